@@ -0,0 +1,297 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from cache import CacheLRU
+
+# Analyses déjà construites, indexées par empreinte du résultat
+_CACHE_ANALYSES = CacheLRU(max_entrees=16, max_octets=128 * 1024**2)
+
+
+# Métriques du format long et modèle du nom de colonne par ligne correspondant
+METRIQUES_LONG = {
+    'prime': 'prime_{}',
+    'cout_total': 'cout_total_{}',
+    'cout_total_mensuel': 'cout_total_{}_mensuel',
+    'cout_total_bus': 'cout_total_{}_bus',
+    'cout_total_conducteur': 'cout_total_{}_conducteur'
+}
+
+
+def _diviser(numerateur, denominateur):
+    """Division élément par élément, 0 là où le dénominateur est nul"""
+    return np.divide(numerateur,
+                     denominateur,
+                     out=np.zeros(np.broadcast(numerateur, denominateur).shape),
+                     where=denominateur != 0)
+
+
+def construire_analyses(resultat, calendrier=None):
+    """
+    Construit les agrégats utilisés par les graphiques de comparaison
+
+    Toutes les colonnes des K systèmes sont agrégées par ligne en un seul
+    groupby ; les ratios par bus et par conducteur sont ensuite calculés en
+    bloc sur les tableaux agrégés.
+
+    Avec un calendrier, par_mois donne les totaux réels de chaque ligne et de
+    chaque mois (colonne MOIS) au lieu de VOY / 12 et BONUS/J x 30, et les
+    totaux mensuels globaux, prime mensuelle par conducteur comprise, sont
+    les moyennes des mois réels.
+
+    Args:
+        resultat (ResultatPrimes): Résultat du calcul des primes
+        calendrier (PrimesCalendrier): Primes jour par jour des mêmes systèmes
+
+    Returns:
+        dict: 'totaux_globaux' (dict), 'par_ligne', 'par_bus',
+            'par_conducteur', 'par_mois' et 'format_long' (pandas.DataFrame),
+            'totaux_mensuels' (totaux réels par mois, None sans calendrier)
+            et 'empreinte', l'empreinte du résultat et du calendrier
+    """
+    donnees = resultat.donnees
+    noms = resultat.noms
+
+    colonnes = {
+        'LIGNE': donnees['LIGNE'],
+        'VOY': donnees['VOY'],
+        'BUS': donnees['BUS'],
+        'VOY/SERVICE/J': donnees['VOY/SERVICE/J'],
+        'NBRE CONDUCTEURS ETP': donnees['NBRE CONDUCTEURS ETP']
+    }
+    agregations = {
+        'VOY': 'sum',
+        'BUS': 'sum',
+        'VOY/SERVICE/J': 'mean',
+        'NBRE CONDUCTEURS ETP': 'sum'
+    }
+    for nom in noms:
+        colonnes[f"prime_{nom}"] = resultat.colonne(f"prime_{nom}")
+        colonnes[f"cout_total_{nom}"] = resultat.colonne(f"cout_total_{nom}")
+        colonnes[f"cout_total_{nom}_mensuel"] = resultat.colonne(
+            f"cout_total_{nom}_mensuel")
+        agregations[f"prime_{nom}"] = 'mean'
+        agregations[f"cout_total_{nom}"] = 'sum'
+        agregations[f"cout_total_{nom}_mensuel"] = 'sum'
+
+    par_ligne = pd.DataFrame(colonnes).groupby(
+        'LIGNE', sort=False, observed=True).agg(agregations).reset_index()
+
+    # Ratios par bus et par conducteur, calculés pour les K systèmes à la fois
+    couts = par_ligne[[f"cout_total_{nom}" for nom in noms]].to_numpy().T
+    par_bus_k = _diviser(couts, par_ligne['BUS'].to_numpy(dtype=float))
+    par_conducteur_k = _diviser(
+        couts, par_ligne['NBRE CONDUCTEURS ETP'].to_numpy(dtype=float))
+    for k, nom in enumerate(noms):
+        par_ligne[f"cout_total_{nom}_bus"] = par_bus_k[k]
+        par_ligne[f"cout_total_{nom}_conducteur"] = par_conducteur_k[k]
+
+    par_ligne['VOY_MENSUEL'] = par_ligne['VOY'] / 12
+
+    par_bus = par_ligne[['LIGNE', 'BUS'] +
+                        [f"cout_total_{nom}_bus" for nom in noms]]
+    par_conducteur = par_ligne[['LIGNE', 'NBRE CONDUCTEURS ETP'] +
+                               [f"cout_total_{nom}_conducteur" for nom in noms]]
+    if calendrier is None:
+        par_mois = par_ligne[['LIGNE', 'VOY_MENSUEL'] +
+                             [f"cout_total_{nom}_mensuel" for nom in noms]]
+    else:
+        par_mois = calendrier.par_mois()
+
+    # Totaux sur toutes les lignes
+    conducteurs = resultat.conducteurs_comptes
+    total_conducteurs = conducteurs.sum()
+    bonus_cond_jour = _diviser(resultat.bonus_service_j @ conducteurs,
+                               total_conducteurs)
+    primes_moyennes = resultat.bonus_service_j.mean(axis=1)
+
+    totaux_globaux = {
+        'VOY_TOTAL': donnees['VOY'].sum(),
+        'VOY_MENSUEL': donnees['VOY'].sum() / 12
+    }
+    for k, nom in enumerate(noms):
+        cout_total = par_ligne[f"cout_total_{nom}"].sum()
+        totaux_globaux[f"cout_total_{nom}"] = cout_total
+        totaux_globaux[f"cout_total_{nom}_mensuel"] = par_ligne[
+            f"cout_total_{nom}_mensuel"].sum()
+        totaux_globaux[f"prime_{nom}"] = primes_moyennes[k]
+        totaux_globaux[f"bonus_cond_jour_{nom}"] = bonus_cond_jour[k]
+        totaux_globaux[f"bonus_cond_mois_{nom}"] = bonus_cond_jour[k] * 30
+        totaux_globaux[f"bonus_cond_an_{nom}"] = bonus_cond_jour[k] * 365
+
+    mensuels = None
+    if calendrier is not None:
+        mensuels = calendrier.totaux_mensuels()
+        totaux_globaux['VOY_MENSUEL'] = mensuels['VOY_MENSUEL'].mean()
+        for nom in noms:
+            cout_mensuel = mensuels[f"cout_total_{nom}_mensuel"].mean()
+            totaux_globaux[f"cout_total_{nom}_mensuel"] = cout_mensuel
+            # Prime mensuelle par conducteur sur les mois réels, pas BONUS/J x 30
+            totaux_globaux[f"bonus_cond_mois_{nom}"] = float(
+                _diviser(cout_mensuel, total_conducteurs))
+
+    empreinte = resultat.empreinte()
+    if calendrier is not None:
+        empreinte = hashlib.sha256(
+            (empreinte + calendrier.empreinte()).encode()).hexdigest()
+
+    return {
+        'totaux_globaux': totaux_globaux,
+        'par_ligne': par_ligne,
+        'par_bus': par_bus,
+        'par_conducteur': par_conducteur,
+        'par_mois': par_mois,
+        'format_long': construire_format_long(
+            par_ligne, [s['nom'] for s in resultat.systemes], noms),
+        'totaux_mensuels': mensuels,
+        'empreinte': empreinte
+    }
+
+
+def construire_format_long(par_ligne, noms_systemes, suffixes):
+    """
+    Met les métriques par ligne au format long (une ligne par ligne de bus,
+    système et métrique) par simple réorganisation des tableaux
+
+    Args:
+        par_ligne (pandas.DataFrame): Agrégats par ligne de construire_analyses
+        noms_systemes (list): Noms affichés des systèmes
+        suffixes (list): Suffixes de colonnes des systèmes
+
+    Returns:
+        pandas.DataFrame: Colonnes LIGNE, VOY, Voyageurs (par service),
+            Système, metrique et valeur
+    """
+    nb_lignes = len(par_ligne)
+    nb_systemes = len(suffixes)
+    nb_metriques = len(METRIQUES_LONG)
+
+    # Pour chaque métrique, le tableau lignes x systèmes lu système par système
+    valeurs = np.concatenate([
+        par_ligne[[modele.format(s) for s in suffixes]].to_numpy(
+            dtype=float).ravel(order='F')
+        for modele in METRIQUES_LONG.values()
+    ]) if nb_systemes else np.empty(0)
+
+    repetitions = nb_systemes * nb_metriques
+    return pd.DataFrame({
+        'LIGNE':
+        np.tile(par_ligne['LIGNE'].to_numpy(), repetitions),
+        'VOY':
+        np.tile(par_ligne['VOY'].to_numpy(), repetitions),
+        'Voyageurs':
+        np.tile(par_ligne['VOY/SERVICE/J'].to_numpy(), repetitions),
+        'Système':
+        np.tile(np.repeat(np.array(noms_systemes, dtype=object), nb_lignes),
+                nb_metriques),
+        'metrique':
+        np.repeat(np.array(list(METRIQUES_LONG), dtype=object),
+                  nb_lignes * nb_systemes),
+        'valeur':
+        valeurs
+    })
+
+
+def obtenir_analyses(resultat, calendrier=None):
+    """
+    Version mémoïsée de construire_analyses, indexée par empreinte du résultat
+
+    Les DataFrames renvoyés sont partagés : ils ne doivent pas être modifiés
+    en place.
+
+    Args:
+        resultat (ResultatPrimes): Résultat du calcul des primes
+        calendrier (PrimesCalendrier): Primes jour par jour (optionnel)
+
+    Returns:
+        dict: Analyses au format de construire_analyses
+    """
+    cle = (resultat.empreinte(),
+           None if calendrier is None else calendrier.empreinte())
+    analyses = _CACHE_ANALYSES.obtenir(cle)
+    if analyses is None:
+        analyses = construire_analyses(resultat, calendrier)
+        _CACHE_ANALYSES.ajouter(cle, analyses)
+    return analyses
+
+
+# Au-delà de ce nombre de points, les graphiques reçoivent des données agrégées
+MAX_POINTS_GRAPHIQUE = 5000
+
+# Nombre de lignes de bus affichées individuellement dans les graphiques par ligne
+MAX_LIGNES_GRAPHIQUE = 30
+
+
+def limiter_lignes(df, valeur, max_lignes=MAX_LIGNES_GRAPHIQUE,
+                   agregation='sum'):
+    """
+    Garde les lignes de bus les plus importantes et regroupe les autres
+
+    Les lignes sont classées sur la somme de la valeur tous systèmes
+    confondus ; au-delà de max_lignes - 1, elles sont agrégées par système
+    dans une catégorie « Autres ».
+
+    Args:
+        df (pandas.DataFrame): Données au format long (LIGNE, Système, valeur)
+        valeur (str): Colonne de la valeur à classer et agréger
+        max_lignes (int): Nombre de barres par système, « Autres » compris
+        agregation (str): Agrégation des autres lignes ('sum' ou 'mean')
+
+    Returns:
+        pandas.DataFrame: Au plus max_lignes lignes de bus par système
+    """
+    lignes = df['LIGNE'].unique()
+    if len(lignes) <= max_lignes:
+        return df
+
+    totaux = df.groupby('LIGNE', sort=False, observed=True)[valeur].sum()
+    gardees = totaux.nlargest(max_lignes - 1).index
+    dans_selection = df['LIGNE'].isin(gardees)
+
+    autres = df[~dans_selection].groupby(
+        'Système', sort=False, observed=True)[valeur].agg(agregation).reset_index()
+    autres['LIGNE'] = f"Autres ({len(lignes) - len(gardees)} lignes)"
+
+    return pd.concat([df[dans_selection], autres], ignore_index=True)
+
+
+def binner_nuage(df, x, y, nb_classes=40):
+    """
+    Agrège un nuage de points en une grille de comptages par système
+
+    La taille du résultat ne dépend que du nombre de classes et de systèmes,
+    pas du nombre de points.
+
+    Args:
+        df (pandas.DataFrame): Points avec les colonnes x, y et Système
+        x (str): Colonne des abscisses
+        y (str): Colonne des ordonnées
+        nb_classes (int): Nombre de classes sur chaque axe
+
+    Returns:
+        pandas.DataFrame: Une ligne par case non vide avec Système, les bornes
+            '<x> min', '<x> max', '<y> min', '<y> max' et Nombre
+    """
+    cases = {'Système': df['Système'].to_numpy()}
+    bornes = {}
+    for axe in (x, y):
+        valeurs = df[axe].to_numpy(dtype=float)
+        debut, fin = np.nanmin(valeurs), np.nanmax(valeurs)
+        if fin <= debut:
+            debut, fin = debut - 0.5, fin + 0.5
+        bornes[axe] = np.linspace(debut, fin, nb_classes + 1)
+        cases[axe] = np.clip(
+            np.searchsorted(bornes[axe], valeurs, side='right') - 1, 0,
+            nb_classes - 1)
+
+    comptes = pd.DataFrame(cases).groupby(['Système', x, y],
+                                          sort=False).size().reset_index(
+                                              name='Nombre')
+
+    for axe in (x, y):
+        indices = comptes[axe].to_numpy()
+        comptes[f"{axe} min"] = bornes[axe][indices]
+        comptes[f"{axe} max"] = bornes[axe][indices + 1]
+
+    return comptes.drop(columns=[x, y])
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+
+from cache import CacheLRU, empreinte_dataframe
+from moteur import compiler_systemes
+
+# Voyageurs par service couverts par la courbe d'aperçu
+MAX_VOYAGEURS_APERCU = 1000
+
+# Agrégats des lignes déjà construits, indexés par empreinte des données
+_CACHE_AGREGATS = CacheLRU(max_entrees=8, max_octets=64 * 1024**2)
+
+
+def courbe_primes(systemes, max_voyageurs=MAX_VOYAGEURS_APERCU):
+    """
+    Evalue la prime par service de chaque système de 0 à max_voyageurs
+
+    Args:
+        systemes (list): Systèmes de prime à tracer
+        max_voyageurs (int): Dernier nombre de voyageurs évalué
+
+    Returns:
+        pandas.DataFrame: Colonnes Voyageurs, Système et Prime (MAD), une
+            ligne par nombre de voyageurs et par système
+    """
+    voyageurs = np.arange(max_voyageurs + 1)
+    primes = compiler_systemes(systemes).evaluer(voyageurs)
+
+    return pd.DataFrame({
+        'Voyageurs': np.tile(voyageurs, len(systemes)),
+        'Système': np.repeat([s['nom'] for s in systemes], len(voyageurs)),
+        'Prime (MAD)': primes.ravel()
+    })
+
+
+def agreger_lignes(df):
+    """
+    Regroupe les lignes par nombre de voyageurs par service
+
+    Le coût d'un système ne dépend que de VOY/SERVICE/J et des conducteurs :
+    les lignes de même fréquentation sont fusionnées en sommant leurs
+    conducteurs.
+
+    Args:
+        df (pandas.DataFrame): Données avec VOY/SERVICE/J et NBRE CONDUCTEURS ETP
+
+    Returns:
+        tuple: (voyageurs distincts, conducteurs cumulés) en numpy.ndarray
+    """
+    cle = empreinte_dataframe(df)
+    agregats = _CACHE_AGREGATS.obtenir(cle)
+    if agregats is None:
+        voyageurs, positions = np.unique(
+            df['VOY/SERVICE/J'].to_numpy(dtype=float), return_inverse=True)
+        conducteurs = np.bincount(
+            positions.ravel(),
+            weights=df['NBRE CONDUCTEURS ETP'].to_numpy(dtype=float),
+            minlength=len(voyageurs))
+        agregats = (voyageurs, conducteurs)
+        _CACHE_AGREGATS.ajouter(cle, agregats)
+    return agregats
+
+
+def cout_projete(df, systemes):
+    """
+    Projette le coût annuel total de chaque système sur les données chargées
+
+    Args:
+        df (pandas.DataFrame): Données avec VOY/SERVICE/J et NBRE CONDUCTEURS ETP
+        systemes (list): Systèmes de prime à évaluer
+
+    Returns:
+        pandas.Series: Coût annuel total (MAD) indexé par nom de système
+    """
+    voyageurs, conducteurs = agreger_lignes(df)
+    couts = (compiler_systemes(systemes).evaluer(voyageurs) @ conducteurs) * 365
+    return pd.Series(couts, index=[s['nom'] for s in systemes])
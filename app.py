@@ -1,14 +1,27 @@
 import pandas as pd
 import streamlit as st
 import altair as alt
-import io
-import base64
 import numpy as np
 import copy
-from utils import (SYSTEMES_DEFAUT, calculer_primes_df, valider_donnees,
-                   get_download_link, exporter_systeme_json,
-                   importer_systeme_json)
-from data_format import obtenir_structure_csv, obtenir_exemple_csv
+from utils import (SYSTEMES_DEFAUT, calculer_primes_df_cache,
+                   statistiques_cache_primes, contenu_csv, FORMATS_CSV)
+from data_format import obtenir_structure_csv, obtenir_structure_services
+from ingestion import (charger_excel, charger_fichier_services,
+                       charger_registre_csv, empreinte_octets,
+                       registre_en_cache)
+from conducteurs import (MODES_PRIME, calculer_primes_conducteurs_cache,
+                         synthese_conducteurs)
+from calendrier import FREQUENCES, calculer_primes_calendrier, serie_mensuelle_cache
+from balayage import (CHAMPS_PALIER, taille_grille, tableau_balayage,
+                      valeurs_plage)
+from budget import BUDGET_2024, ajuster_echelle, ajuster_taux_palier
+from apercu import courbe_primes, cout_projete
+from simulation import DISTRIBUTIONS, simuler_couts
+from export import exporter_excel
+from analytique import obtenir_analyses
+from visualization import creer_graphiques_comparaison
+from combined_visualizations import afficher_metriques_combine
+from profilage import Profileur, configurer_journal
 
 # Configuration de la page
 st.set_page_config(page_title="Simulateur de Primes pour Conducteurs",
@@ -16,10 +29,22 @@ st.set_page_config(page_title="Simulateur de Primes pour Conducteurs",
                    layout="wide",
                    initial_sidebar_state="expanded")
 
+# Les mesures de performance de chaque exécution sont ajoutées au journal
+configurer_journal()
+
 # Initialiser les variables de session si elles n'existent pas
 if 'data' not in st.session_state:
     st.session_state.data = None
 
+if 'histogrammes' not in st.session_state:
+    st.session_state.histogrammes = None
+
+if 'series' not in st.session_state:
+    st.session_state.series = None
+
+if 'empreinte_services' not in st.session_state:
+    st.session_state.empreinte_services = None
+
 if 'authenticated' not in st.session_state:
     st.session_state.authenticated = False
 
@@ -265,6 +290,145 @@ def page_configuration_systemes():
         # Mettre à jour les paliers dans la session
         systeme_nouveau["paliers"] = paliers_df.to_dict('records')
 
+    # Aperçu des barèmes, recalculé à chaque modification d'un palier
+    st.subheader("Aperçu des barèmes")
+    systemes_apercu = [
+        st.session_state.systemes_personnalises["systeme_actuel"],
+        st.session_state.systemes_personnalises["systeme_nouveau"]
+    ]
+    chart_apercu = alt.Chart(courbe_primes(systemes_apercu)).mark_line().encode(
+        x=alt.X('Voyageurs:Q', title='Voyageurs par service'),
+        y=alt.Y('Prime (MAD):Q', title='Prime par service (MAD)'),
+        color=alt.Color('Système:N', legend=alt.Legend(orient="top")),
+        tooltip=['Système', 'Voyageurs', 'Prime (MAD)']
+    ).properties(title='Prime par service selon la fréquentation')
+    st.altair_chart(chart_apercu, use_container_width=True)
+
+    if st.session_state.data is not None:
+        couts_projetes = cout_projete(st.session_state.data, systemes_apercu)
+        col1, col2, col3 = st.columns(3)
+        col1.metric(f"Coût annuel - {couts_projetes.index[0]}",
+                    f"{couts_projetes.iloc[0]:,.0f} MAD")
+        col2.metric(f"Coût annuel - {couts_projetes.index[1]}",
+                    f"{couts_projetes.iloc[1]:,.0f} MAD")
+        col3.metric("Différence",
+                    f"{couts_projetes.iloc[1] - couts_projetes.iloc[0]:,.0f} MAD")
+    else:
+        st.info("Chargez des données sur la page principale pour voir le "
+                "coût annuel projeté.")
+
+    # Balayage des paramètres des paliers sur les données chargées
+    with st.expander("Balayage des paramètres"):
+        cle_systeme = st.selectbox(
+            "Système à balayer", ["systeme_actuel", "systeme_nouveau"],
+            format_func=lambda cle: st.session_state.systemes_personnalises[
+                cle]["nom"],
+            key="balayage_systeme")
+        systeme_balaye = st.session_state.systemes_personnalises[cle_systeme]
+
+        # Une plage par champ de palier ; un pas nul garde la valeur actuelle
+        plages_df = pd.DataFrame([{
+            "Palier": idx + 1,
+            "Champ": champ,
+            "Début": float(palier[champ]),
+            "Fin": float(palier[champ]),
+            "Pas": 0.0
+        } for idx, palier in enumerate(systeme_balaye["paliers"])
+                                  for champ in CHAMPS_PALIER])
+        plages_df = st.data_editor(plages_df,
+                                   disabled=["Palier", "Champ"],
+                                   hide_index=True,
+                                   key=f"plages_{cle_systeme}")
+
+        plages = {}
+        for _, plage in plages_df.iterrows():
+            indice = int(plage["Palier"]) - 1
+            valeurs = valeurs_plage(plage["Début"], plage["Fin"], plage["Pas"])
+            if len(valeurs) > 1 or valeurs[0] != systeme_balaye["paliers"][
+                    indice][plage["Champ"]]:
+                plages[(indice, plage["Champ"])] = valeurs
+
+        st.write(f"**Combinaisons**: {taille_grille(plages):,}")
+
+        if st.button("Lancer le balayage", key="lancer_balayage"):
+            if st.session_state.data is None:
+                st.warning("Chargez des données sur la page principale avant "
+                           "de lancer un balayage.")
+            elif not plages:
+                st.warning("Définissez au moins une plage à balayer.")
+            else:
+                with st.spinner("Balayage en cours..."):
+                    classement = tableau_balayage(st.session_state.data,
+                                                  systeme_balaye,
+                                                  plages,
+                                                  meilleurs=100)
+                st.dataframe(classement)
+
+    # Recherche des taux qui atteignent une enveloppe annuelle
+    with st.expander("Atteindre un budget"):
+        cle_systeme = st.selectbox(
+            "Système à ajuster", ["systeme_actuel", "systeme_nouveau"],
+            format_func=lambda cle: st.session_state.systemes_personnalises[
+                cle]["nom"],
+            key="budget_systeme")
+        systeme_ajuste = st.session_state.systemes_personnalises[cle_systeme]
+
+        budget = st.number_input("Budget annuel visé (MAD)",
+                                 value=float(BUDGET_2024),
+                                 min_value=0.0,
+                                 step=10000.0,
+                                 key="budget_vise")
+        mode = st.radio("Variable ajustée",
+                        ["Tous les taux (même proportion)", "Taux d'un palier"],
+                        key="budget_mode")
+        if mode == "Taux d'un palier":
+            indice = st.selectbox(
+                "Palier libre",
+                list(range(len(systeme_ajuste["paliers"]))),
+                format_func=lambda i: f"Palier {i + 1}",
+                key="budget_palier")
+
+        if st.button("Calculer les taux", key="calculer_budget"):
+            if st.session_state.data is None:
+                st.warning("Chargez des données sur la page principale avant "
+                           "de rechercher un budget.")
+            else:
+                if mode == "Taux d'un palier":
+                    solution = ajuster_taux_palier(st.session_state.data,
+                                                   systeme_ajuste, budget,
+                                                   indice)
+                else:
+                    solution = ajuster_echelle(st.session_state.data,
+                                               systeme_ajuste, budget)
+                st.session_state.solution_budget = (cle_systeme, budget, solution)
+
+        if st.session_state.get("solution_budget"):
+            cle_solution, budget_solution, solution = st.session_state.solution_budget
+            if solution is None:
+                st.error("Ce budget ne peut pas être atteint en ajustant "
+                         "ces taux.")
+            else:
+                systeme_solution, cout, atteinte = solution
+                st.write(f"**Coût annuel obtenu**: {cout:,.2f} MAD "
+                         f"(écart au budget: {cout - budget_solution:+,.2f} MAD)")
+                if not atteinte:
+                    st.warning("La recherche n'a pas convergé : voici les taux "
+                               "les plus proches trouvés.")
+                else:
+                    st.caption("Les primes étant arrondies au centime, le coût "
+                               "avance par marches : l'écart restant est celui "
+                               "du coût atteignable le plus proche du budget.")
+                st.dataframe(pd.DataFrame(systeme_solution["paliers"]))
+                if st.button("Appliquer ces taux", key="appliquer_budget"):
+                    st.session_state.systemes_personnalises[cle_solution][
+                        "paliers"] = systeme_solution["paliers"]
+                    # Les champs de taux reprennent les valeurs appliquées
+                    suffixe = cle_solution.split("_")[1]
+                    for idx in range(len(systeme_solution["paliers"])):
+                        st.session_state.pop(f"taux_{suffixe}_{idx}", None)
+                    st.session_state.solution_budget = None
+                    st.rerun()
+
     # Boutons pour la navigation et actions
     st.markdown("---")
     col1, col2, col3 = st.columns(3)
@@ -300,6 +464,11 @@ def page_configuration_systemes():
 
 # Fonction pour afficher la page principale de l'application
 def page_principale():
+    # Durée et mémoire de chaque étape de cette exécution
+    profileur = Profileur(memoire=st.session_state.get("profilage_actif", False),
+                          utilisateur=st.session_state.username,
+                          page="principale")
+
     # Titre principal
     st.title(f"🚌 Simulateur de Primes pour Conducteurs")
     st.markdown(f"Utilisateur: {st.session_state.username}")
@@ -316,19 +485,46 @@ def page_principale():
         st.subheader("Importer des données")
 
         uploaded_file = st.file_uploader(
-            "Choisir un fichier Excel",
-            type=["xlsx", "xls"],
+            "Choisir un fichier Excel ou CSV détaillé",
+            type=["xlsx", "xls", "csv"],
             help=
-            "Fichier Excel avec les colonnes: LIGNE, VOY, BUS, VOY/SERVICE/J, NBRE CONDUCTEURS ETP"
+            "Fichier Excel avec les colonnes: LIGNE, VOY, BUS, VOY/SERVICE/J, NBRE CONDUCTEURS ETP, "
+            "ou fichier CSV détaillé par service: LIGNE, DATE, VOYAGEURS, BUS, CONDUCTEUR"
         )
 
+        # Contenu du fichier détaillé importé, pour les lectures à la demande
+        contenu_services = None
         if uploaded_file is not None:
             try:
-                data = pd.read_excel(uploaded_file)
-                valide, message = valider_donnees(data)
+                # Le fichier est lu et empreinté une seule fois par exécution
+                contenu = uploaded_file.getvalue()
+                empreinte = empreinte_octets(contenu)
+                est_csv = uploaded_file.name.lower().endswith(".csv")
+                with profileur.etape("chargement") as mesure:
+                    if est_csv:
+                        # Agrégat, histogrammes et série en une lecture par blocs ;
+                        # le registre n'est lu que si la vue par conducteur est active
+                        produits = ['services', 'histogrammes', 'series']
+                        if st.session_state.get("primes_conducteurs_actif", False):
+                            produits.append('registre')
+                        lus = charger_fichier_services(contenu, empreinte, produits)
+                        data, valide, message = lus['services']
+                        histogrammes = lus['histogrammes'] if valide else None
+                        series = lus['series'] if valide else None
+                        contenu_services = contenu
+                    else:
+                        data, valide, message = charger_excel(contenu, empreinte)
+                        histogrammes = series = None
+                    mesure['lignes'] = len(data) if valide else 0
+                    if valide:
+                        mesure.update(data.attrs.get('memoire', {}))
 
                 if valide:
                     st.session_state.data = data
+                    st.session_state.histogrammes = histogrammes
+                    st.session_state.series = series
+                    st.session_state.empreinte_services = (empreinte if est_csv
+                                                           else None)
                     st.success("Données chargées avec succès !")
                 else:
                     st.error(f"Erreur dans le format des données: {message}")
@@ -340,6 +536,7 @@ def page_principale():
         # Informations sur la structure du CSV
         with st.expander("Structure du fichier attendu"):
             st.code(obtenir_structure_csv())
+            st.code(obtenir_structure_services())
 
         # Section des paramètres de calcul
         st.subheader("Paramètres de calcul")
@@ -353,6 +550,38 @@ def page_principale():
             "Nombre moyen de services (trajets) par jour pour chaque conducteur"
         )
 
+        # Les fichiers détaillés permettent d'évaluer le barème service par service
+        par_distribution = False
+        if st.session_state.histogrammes is not None:
+            par_distribution = st.checkbox(
+                "Primes sur la distribution des services",
+                value=True,
+                help=
+                "Moyenne des primes de chaque service plutôt que prime du nombre moyen de voyageurs"
+            )
+
+        # Les dates des services donnent les totaux de chaque mois réel
+        par_calendrier = False
+        if st.session_state.series is not None:
+            par_calendrier = st.checkbox(
+                "Totaux mensuels sur le calendrier réel",
+                value=True,
+                help=
+                "Primes évaluées jour par jour ; les mois comptent leurs jours réels "
+                "au lieu de VOY / 12 et BONUS/J x 30"
+            )
+        frequence = 'J'
+        if par_calendrier:
+            frequence = st.radio(
+                "Granularité de la fréquentation",
+                FREQUENCES,
+                format_func=lambda f: {
+                    'J': "Journalière (jour par jour)",
+                    'M': "Mensuelle (moyenne de chaque mois sur ses jours)"
+                }[f],
+                horizontal=True,
+                key="frequence_calendrier")
+
         # Bouton pour accéder à la page de configuration des systèmes
         if st.button("Configurer les Systèmes de Prime"):
             st.session_state.page = "configurer_systemes"
@@ -378,6 +607,20 @@ def page_principale():
                 ]
                 st.dataframe(paliers_df)
 
+        # Compteurs du cache de calcul, pour ajuster sa taille
+        with st.expander("Cache des calculs"):
+            stats = statistiques_cache_primes()
+            st.write(f"**Succès**: {stats['succes']} - **Échecs**: {stats['echecs']}")
+            st.write(f"**Entrées**: {stats['entrees']} "
+                     f"({stats['octets'] / 1024**2:.1f} Mo)")
+            # Gain de la normalisation des types à l'import
+            memoire = (st.session_state.data.attrs.get('memoire')
+                       if st.session_state.data is not None else None)
+            if memoire:
+                st.write(f"**Données**: {memoire['octets_apres'] / 1024**2:.2f} Mo "
+                         f"(avant normalisation: "
+                         f"{memoire['octets_avant'] / 1024**2:.2f} Mo)")
+
         # Option de déconnexion
         if st.button("Déconnexion"):
             st.session_state.authenticated = False
@@ -392,53 +635,33 @@ def page_principale():
             st.session_state.systemes_personnalises["systeme_nouveau"]
         ]
 
+        nb_lignes = len(st.session_state.data)
+
         # Calcul des primes avec le nombre de services par jour donné
-        df_resultat = calculer_primes_df(st.session_state.data,
-                                         systemes_actifs, nb_services_par_jour)
-
-        # Analyses par catégorie
-        analyses = {}
-
-        # Calcul des totaux globaux (somme pour toutes les lignes)
-        analyses['totaux_globaux'] = {}
-
-        # VOY total (somme de VOY pour toutes les lignes)
-        analyses['totaux_globaux']['VOY_TOTAL'] = df_resultat['VOY'].sum()
-
-        # Calculer les sommes pour chaque système
-        systeme_base = systemes_actifs[0]['nom'].replace(' ', '_').lower()
-        systeme_comp = systemes_actifs[1]['nom'].replace(' ', '_').lower()
-
-        # Coût total annuel pour chaque système (somme pour toutes les lignes)
-        analyses['totaux_globaux'][f"cout_total_{systeme_base}"] = df_resultat[
-            f"cout_total_{systeme_base}"].sum()
-        analyses['totaux_globaux'][f"cout_total_{systeme_comp}"] = df_resultat[
-            f"cout_total_{systeme_comp}"].sum()
-
-        # Bonus moyen pondéré par conducteur pour chaque système
-        total_conducteurs = df_resultat['NBRE CONDUCTEURS ETP'].sum()
-
-        # Par jour
-        analyses['totaux_globaux'][f"bonus_cond_jour_{systeme_base}"] = (
-            df_resultat[f"BONUS/CONDUCTEUR/J_{systeme_base}"] *
-            df_resultat['NBRE CONDUCTEURS ETP']).sum() / total_conducteurs
-        analyses['totaux_globaux'][f"bonus_cond_jour_{systeme_comp}"] = (
-            df_resultat[f"BONUS/CONDUCTEUR/J_{systeme_comp}"] *
-            df_resultat['NBRE CONDUCTEURS ETP']).sum() / total_conducteurs
-
-        # Par mois (jour * 30)
-        analyses['totaux_globaux'][
-            f"bonus_cond_mois_{systeme_base}"] = analyses['totaux_globaux'][
-                f"bonus_cond_jour_{systeme_base}"] * 30
-        analyses['totaux_globaux'][
-            f"bonus_cond_mois_{systeme_comp}"] = analyses['totaux_globaux'][
-                f"bonus_cond_jour_{systeme_comp}"] * 30
-
-        # Par an (jour * 365)
-        analyses['totaux_globaux'][f"bonus_cond_an_{systeme_base}"] = analyses[
-            'totaux_globaux'][f"bonus_cond_jour_{systeme_base}"] * 365
-        analyses['totaux_globaux'][f"bonus_cond_an_{systeme_comp}"] = analyses[
-            'totaux_globaux'][f"bonus_cond_jour_{systeme_comp}"] * 365
+        with profileur.etape("calcul", nb_lignes):
+            df_resultat = calculer_primes_df_cache(
+                st.session_state.data,
+                systemes_actifs,
+                nb_services_par_jour,
+                histogrammes=(st.session_state.histogrammes
+                              if par_distribution else None))
+
+        # Analyses par catégorie, construites en bloc pour tous les systèmes
+        calendrier = None
+        if par_calendrier:
+            with profileur.etape("calendrier", nb_lignes):
+                serie = st.session_state.series
+                if frequence == 'M':
+                    serie = serie_mensuelle_cache(serie)
+                calendrier = calculer_primes_calendrier(
+                    st.session_state.data, serie, systemes_actifs, frequence)
+
+        with profileur.etape("analyses", nb_lignes):
+            analyses = obtenir_analyses(df_resultat, calendrier)
+
+        # Suffixes de colonnes des deux systèmes comparés
+        systeme_base = df_resultat.noms[0]
+        systeme_comp = df_resultat.noms[1]
 
         # Calculer les différences
         diff_cout_total = analyses['totaux_globaux'][
@@ -450,120 +673,220 @@ def page_principale():
             100 if analyses['totaux_globaux'][f"cout_total_{systeme_base}"]
             != 0 else 0)
 
-        # Affichage des KPIs principaux
-        st.subheader("KPIs Principaux")
+        with profileur.etape("kpis", nb_lignes):
+            # Affichage des KPIs principaux
+            st.subheader("KPIs Principaux")
 
-        # Utiliser des colonnes pour afficher les KPIs (au lieu d'un tableau)
-        col1, col2 = st.columns(2)
+            # Utiliser des colonnes pour afficher les KPIs (au lieu d'un tableau)
+            col1, col2 = st.columns(2)
 
-        with col1:
-            st.metric("Nombre de lignes", f"{len(df_resultat)}")
-        # with col2:
-        #     st.metric("Nombre total de voyageurs par an",
-        #               f"{int(analyses['totaux_globaux']['VOY_TOTAL']):,}")
-
-        col3, col4, col5 = st.columns(3)
-        with col3:
-            st.metric(
-                f"Prime 2024",
-                f"{int(9309650):,} MAD"
-            )
-        with col4:
-            st.metric(
-                f"Prime projection PB - {systemes_actifs[0]['nom']}",
-                f"{int(analyses['totaux_globaux'][f'cout_total_{systeme_base}']):,} MAD",
-                delta=f"{((int(analyses['totaux_globaux'][f'cout_total_{systeme_base}']) - int(9309650)) * 100 / int(9309650)):.2f}%"
-            )
-        with col5:
-          st.metric(
-                f"Prime projection BP - {systemes_actifs[1]['nom']}",
-                f"{int(analyses['totaux_globaux'][f'cout_total_{systeme_comp}']):,} MAD",
-                delta=f"{diff_cout_total_pct:.2f}%"
-            )
-        # Create the DataFrame with index
-        total_annee_prime_24 = 9309650  # MAD
-        num_conducteurs = 1286
-        total_annee_prime_24_par_conducteur = int(total_annee_prime_24 / num_conducteurs)
+            with col1:
+                st.metric("Nombre de lignes", f"{len(df_resultat)}")
+            # with col2:
+            #     st.metric("Nombre total de voyageurs par an",
+            #               f"{int(analyses['totaux_globaux']['VOY_TOTAL']):,}")
+
+            col3, col4, col5 = st.columns(3)
+            with col3:
+                st.metric(
+                    f"Prime 2024",
+                    f"{int(BUDGET_2024):,} MAD"
+                )
+            with col4:
+                st.metric(
+                    f"Prime projection PB - {systemes_actifs[0]['nom']}",
+                    f"{int(analyses['totaux_globaux'][f'cout_total_{systeme_base}']):,} MAD",
+                    delta=f"{((int(analyses['totaux_globaux'][f'cout_total_{systeme_base}']) - int(BUDGET_2024)) * 100 / int(BUDGET_2024)):.2f}%"
+                )
+            with col5:
+              st.metric(
+                    f"Prime projection BP - {systemes_actifs[1]['nom']}",
+                    f"{int(analyses['totaux_globaux'][f'cout_total_{systeme_comp}']):,} MAD",
+                    delta=f"{diff_cout_total_pct:.2f}%"
+                )
+            # Create the DataFrame with index
+            total_annee_prime_24 = BUDGET_2024  # MAD
+            num_conducteurs = 1286
+            total_annee_prime_24_par_conducteur = int(total_annee_prime_24 / num_conducteurs)
       
-        df = pd.DataFrame({
-          "Prime 2024": [
-                int(total_annee_prime_24_par_conducteur / 365),
-                int(total_annee_prime_24_par_conducteur / 12),
-                int(total_annee_prime_24_par_conducteur)
-            ],
-            "Prime projection PB Système actuel": [
-                int(analyses['totaux_globaux'][f'bonus_cond_jour_{systeme_base}']),
-                int(analyses['totaux_globaux'][f'bonus_cond_mois_{systeme_base}']),
-                int(analyses['totaux_globaux'][f'bonus_cond_an_{systeme_base}'])
-            ],
-            "Prime projection PB Nouveau système": [
-                int(analyses['totaux_globaux'][f'bonus_cond_jour_{systeme_comp}']),
-                int(analyses['totaux_globaux'][f'bonus_cond_mois_{systeme_comp}']),
-                int(analyses['totaux_globaux'][f'bonus_cond_an_{systeme_comp}'])
-            ]
-        }, index=["jour", "mois", "année"])
+            df = pd.DataFrame({
+              "Prime 2024": [
+                    int(total_annee_prime_24_par_conducteur / 365),
+                    int(total_annee_prime_24_par_conducteur / 12),
+                    int(total_annee_prime_24_par_conducteur)
+                ],
+                "Prime projection PB Système actuel": [
+                    int(analyses['totaux_globaux'][f'bonus_cond_jour_{systeme_base}']),
+                    int(analyses['totaux_globaux'][f'bonus_cond_mois_{systeme_base}']),
+                    int(analyses['totaux_globaux'][f'bonus_cond_an_{systeme_base}'])
+                ],
+                "Prime projection PB Nouveau système": [
+                    int(analyses['totaux_globaux'][f'bonus_cond_jour_{systeme_comp}']),
+                    int(analyses['totaux_globaux'][f'bonus_cond_mois_{systeme_comp}']),
+                    int(analyses['totaux_globaux'][f'bonus_cond_an_{systeme_comp}'])
+                ]
+            }, index=["jour", "mois", "année"])
         
-        # Rename the index
-        df.index.name = "Prime moyenne de conducteur par"
+            # Rename the index
+            df.index.name = "Prime moyenne de conducteur par"
         
-        # Create styled DataFrame (from previous step)
-        styler = df.style\
-            .set_properties(**{'text-align': 'center'})\
-            .format("{:,.0f} MAD")\
-            .set_table_styles([
-                {
-                    'selector': 'th.row_heading',
-                    'props': [('color', 'blue'), ('text-align', 'center')]
-                },
-                {
-                    'selector': 'th.col_heading',
-                    'props': [('text-align', 'center')]
-                },
-                {
-                    'selector': '', 
-                    'props': [('margin-left', 'auto'), ('margin-right', 'auto')]
-                }
-            ])
+            # Create styled DataFrame (from previous step)
+            styler = df.style\
+                .set_properties(**{'text-align': 'center'})\
+                .format("{:,.0f} MAD")\
+                .set_table_styles([
+                    {
+                        'selector': 'th.row_heading',
+                        'props': [('color', 'blue'), ('text-align', 'center')]
+                    },
+                    {
+                        'selector': 'th.col_heading',
+                        'props': [('text-align', 'center')]
+                    },
+                    {
+                        'selector': '', 
+                        'props': [('margin-left', 'auto'), ('margin-right', 'auto')]
+                    }
+                ])
         
-        # Create centered container
-        centered_table = f"""
-        <div style="display: flex; justify-content: center;">
-            {styler.to_html()}</div>
-        """
+            # Create centered container
+            centered_table = f"""
+            <div style="display: flex; justify-content: center;">
+                {styler.to_html()}</div>
+            """
         
-        # Display in Streamlit
-        st.write(centered_table, unsafe_allow_html=True)
+            # Display in Streamlit
+            st.write(centered_table, unsafe_allow_html=True)
 
-        # Afficher la différence en pourcentage
-        st.info(
-            f"**Différence entre les systèmes**: {diff_cout_total:,.2f} MAD ({diff_cout_total_pct:.2f}%)"
-        )
+            # Afficher la différence en pourcentage
+            st.info(
+                f"**Différence entre les systèmes**: {diff_cout_total:,.2f} MAD ({diff_cout_total_pct:.2f}%)"
+            )
 
-        # Visualisation sous forme de graphique à barres
-        st.subheader("Comparaison des systèmes de bonus")
+        # Projection sous incertitude de la fréquentation
+        with st.expander("Simulation de l'incertitude sur les voyageurs"):
+            col_sim1, col_sim2, col_sim3 = st.columns(3)
+            with col_sim1:
+                nb_tirages = st.number_input("Nombre de scénarios",
+                                             min_value=100,
+                                             max_value=100000,
+                                             value=10000,
+                                             step=1000)
+            with col_sim2:
+                distribution = st.selectbox("Loi des voyageurs par service",
+                                            DISTRIBUTIONS)
+            with col_sim3:
+                coefficient_variation = st.number_input(
+                    "Écart-type relatif",
+                    min_value=0.0,
+                    max_value=2.0,
+                    value=0.15,
+                    step=0.05,
+                    disabled=distribution == 'poisson')
+
+            if st.button("Lancer la simulation"):
+                with profileur.etape("simulation",
+                                     nb_lignes * int(nb_tirages)):
+                    quantiles = simuler_couts(st.session_state.data,
+                                              systemes_actifs,
+                                              nb_tirages=int(nb_tirages),
+                                              distribution=distribution,
+                                              coefficient_variation=
+                                              coefficient_variation,
+                                              graine=0)
+                st.dataframe(quantiles.style.format("{:,.0f} MAD"))
+
+        # Primes individuelles, à partir des services de chaque conducteur ;
+        # le registre n'est lu qu'à la demande
+        if st.session_state.empreinte_services is not None:
+            with st.expander("Primes par conducteur"):
+                if st.checkbox("Calculer les primes par conducteur",
+                               key="primes_conducteurs_actif",
+                               help="Lit le registre des services de chaque "
+                               "conducteur dans le fichier détaillé"):
+                    lu = registre_en_cache(st.session_state.empreinte_services)
+                    if lu is None and contenu_services is not None:
+                        with profileur.etape("registre") as mesure:
+                            lu = charger_registre_csv(
+                                contenu_services,
+                                empreinte=st.session_state.empreinte_services)
+                            mesure['lignes'] = len(lu[0]) if lu[1] else 0
+
+                    if lu is None:
+                        st.info("Importez de nouveau le fichier détaillé pour "
+                                "calculer les primes par conducteur.")
+                    elif not lu[1]:
+                        st.error(f"Erreur dans le registre des conducteurs: {lu[2]}")
+                    else:
+                        registre = lu[0]
+                        mode_conducteur = st.radio(
+                            "Prime d'une journée",
+                            MODES_PRIME,
+                            format_func=lambda m: {
+                                'moyenne': "Barème sur la moyenne des services du jour",
+                                'service': "Moyenne des primes de chaque service"
+                            }[m],
+                            horizontal=True)
+                        with profileur.etape("conducteurs", len(registre)):
+                            primes_conducteurs = calculer_primes_conducteurs_cache(
+                                registre, systemes_actifs, mode_conducteur)
+                        st.markdown(f"**{len(primes_conducteurs):,} conducteurs**, "
+                                    f"{len(registre):,} services")
+                        st.dataframe(synthese_conducteurs(
+                            primes_conducteurs,
+                            systemes_actifs).style.format("{:,.0f} MAD"))
+
+                        # Distribution des primes annuelles des deux systèmes
+                        distribution_conducteurs = pd.DataFrame({
+                            'Système': np.repeat(
+                                [s['nom'] for s in systemes_actifs],
+                                len(primes_conducteurs)),
+                            'Prime annuelle (MAD)': np.concatenate([
+                                primes_conducteurs[f"BONUS/CONDUCTEUR/AN_{nom}"]
+                                for nom in (systeme_base, systeme_comp)
+                            ])
+                        })
+                        st.altair_chart(alt.Chart(distribution_conducteurs).mark_bar(
+                            opacity=0.6).encode(
+                                x=alt.X('Prime annuelle (MAD):Q',
+                                        bin=alt.Bin(maxbins=40)),
+                                y=alt.Y('count():Q', stack=None,
+                                        title='Conducteurs'),
+                                color='Système:N'),
+                                        use_container_width=True)
+                        st.dataframe(primes_conducteurs)
+
+        with profileur.etape("graphiques", nb_lignes):
+            # Visualisation sous forme de graphique à barres
+            st.subheader("Comparaison des systèmes de bonus")
+
+            # Créer des données pour le graphique
+            chart_data = {
+                'Système': [systemes_actifs[0]['nom'], systemes_actifs[1]['nom']],
+                'Bonus total (MAD)': [
+                    analyses['totaux_globaux'][f"cout_total_{systeme_base}"],
+                    analyses['totaux_globaux'][f"cout_total_{systeme_comp}"]
+                ]
+            }
 
-        # Créer des données pour le graphique
-        chart_data = {
-            'Système': [systemes_actifs[0]['nom'], systemes_actifs[1]['nom']],
-            'Bonus total (MAD)': [
-                analyses['totaux_globaux'][f"cout_total_{systeme_base}"],
-                analyses['totaux_globaux'][f"cout_total_{systeme_comp}"]
-            ]
-        }
+            df_chart = pd.DataFrame(chart_data)
 
-        df_chart = pd.DataFrame(chart_data)
+            # Créer le graphique
+            chart = alt.Chart(df_chart).mark_bar().encode(
+                x=alt.X('Système:N', title='Système de prime'),
+                y=alt.Y('Bonus total (MAD):Q', title='Bonus total (MAD)'),
+                color=alt.Color('Système:N', legend=None),
+                tooltip=['Système', 'Bonus total (MAD)']).properties(
+                    title='Comparaison des bonus totaux entre les systèmes',
+                    width=600,
+                    height=400)
 
-        # Créer le graphique
-        chart = alt.Chart(df_chart).mark_bar().encode(
-            x=alt.X('Système:N', title='Système de prime'),
-            y=alt.Y('Bonus total (MAD):Q', title='Bonus total (MAD)'),
-            color=alt.Color('Système:N', legend=None),
-            tooltip=['Système', 'Bonus total (MAD)']).properties(
-                title='Comparaison des bonus totaux entre les systèmes',
-                width=600,
-                height=400)
+            st.altair_chart(chart, use_container_width=True)
 
-        st.altair_chart(chart, use_container_width=True)
+            # Analyses détaillées par ligne, par bus, par conducteur et par mois
+            st.subheader("Analyses détaillées")
+            creer_graphiques_comparaison(analyses, systemes_actifs)
+            afficher_metriques_combine(analyses, systemes_actifs)
 
         # # Graphique des bonus moyens par conducteur
         # st.subheader("Comparaison des bonus moyens par conducteur")
@@ -609,17 +932,30 @@ def page_principale():
                 f"BONUS/CONDUCTEUR/AN_{nom_col}"
             ])
 
-        st.dataframe(df_resultat[colonnes_affichage])
+        with profileur.etape("tableau", nb_lignes):
+            st.dataframe(df_resultat[colonnes_affichage])
 
-        # Option pour télécharger les résultats en Excel
-        st.markdown("### 💾 Exporter les résultats")
+        # Le fichier CSV n'est produit qu'au clic sur le bouton
+        compression = st.radio("Format CSV", list(FORMATS_CSV),
+                               format_func=lambda c: FORMATS_CSV[c][0],
+                               horizontal=True)
+        extension, type_mime = FORMATS_CSV[compression]
+
+        def generer_csv():
+            with profileur.etape("export_csv", nb_lignes):
+                return contenu_csv(df_resultat, colonnes_affichage,
+                                   compression)
 
-        buffer = io.BytesIO()
-        with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
-            df_resultat[colonnes_affichage].to_excel(writer,
-                                                     sheet_name='Resultats',
-                                                     index=False)
+        st.download_button(
+            "Télécharger les résultats (CSV)",
+            data=generer_csv,
+            file_name=f"resultats_primes{extension}",
+            mime=type_mime)
 
+        # Option pour télécharger les résultats en Excel
+        st.markdown("### 💾 Exporter les résultats")
+        # Le classeur n'est construit qu'au clic, une fois par résultat
+        def generer_excel():
             # Créer un onglet pour les KPIs
             kpi_df = pd.DataFrame({
                 'Métrique': [
@@ -649,31 +985,17 @@ def page_principale():
                     f"{analyses['totaux_globaux'][f'bonus_cond_an_{systeme_comp}']}"
                 ]
             })
-            kpi_df.to_excel(writer, sheet_name='KPIs', index=False)
-
-            # Ajouter les détails des systèmes de prime
-            sys_actuel_df = pd.DataFrame(
-                systemes_actifs[0]['paliers'],
-                columns=["Min", "Max", "Taux (MAD)"])
-            sys_actuel_df.to_excel(
-                writer,
-                sheet_name=f'Système {systemes_actifs[0]["nom"]}',
-                index=False)
-
-            sys_nouveau_df = pd.DataFrame(
-                systemes_actifs[1]['paliers'],
-                columns=["Min", "Max", "Taux (MAD)"])
-            sys_nouveau_df.to_excel(
-                writer,
-                sheet_name=f'Système {systemes_actifs[1]["nom"]}',
-                index=False)
-
-        excel_data = buffer.getvalue()
-
-        # Créer un lien de téléchargement pour le fichier Excel
-        b64 = base64.b64encode(excel_data).decode()
-        href = f'<a href="data:application/vnd.openxmlformats-officedocument.spreadsheetml.sheet;base64,{b64}" download="resultats_primes.xlsx">Télécharger les résultats (Excel)</a>'
-        st.markdown(href, unsafe_allow_html=True)
+
+            with profileur.etape("export_excel", nb_lignes):
+                return exporter_excel(df_resultat, colonnes_affichage, kpi_df,
+                                      systemes_actifs)
+
+        st.download_button(
+            "Télécharger les résultats (Excel)",
+            data=generer_excel,
+            file_name="resultats_primes.xlsx",
+            mime=
+            "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
 
     else:
         st.info("Veuillez charger des données pour commencer l'analyse.")
@@ -715,6 +1037,25 @@ def page_principale():
             ]
             st.dataframe(paliers_df)
 
+    # Panneau des performances de cette exécution
+    with st.sidebar:
+        if st.checkbox("Afficher les performances", key="profilage_actif",
+                       help="Durée, lignes traitées et pic mémoire de chaque "
+                       "étape ; le suivi mémoire ralentit légèrement les calculs"):
+            mesures = profileur.tableau()
+            # Pic absent (None) quand une autre session mesurait la mémoire
+            mesures['pic_memoire_octets'] = pd.to_numeric(
+                mesures['pic_memoire_octets']) / 1024**2
+            st.dataframe(mesures.rename(columns={
+                'etape': 'Étape',
+                'lignes': 'Lignes',
+                'secondes': 'Durée (s)',
+                'pic_memoire_octets': 'Pic mémoire (Mo)'
+            }), hide_index=True)
+            st.caption("Les exports sont mesurés au clic et écrits dans le "
+                       "journal des performances. Le pic mémoire n'est mesuré "
+                       "que par une session à la fois.")
+
     # Pied de page
     st.markdown("---")
     st.markdown("🚌 Simulateur de Primes pour Conducteurs - Version 1.0")
@@ -0,0 +1,212 @@
+import copy
+import heapq
+import itertools
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from moteur import BaremeCompile, BaremeLot
+
+# Champs d'un palier pouvant faire l'objet d'un balayage
+CHAMPS_PALIER = ['min', 'max', 'taux']
+
+# Tableaux d'entrée partagés, attachés une fois par processus de calcul
+_TABLEAUX = None
+_SEGMENTS_PARTAGES = []
+
+
+def valeurs_plage(debut, fin, pas):
+    """
+    Enumère les valeurs d'une plage bornes incluses
+
+    Args:
+        debut (float): Première valeur
+        fin (float): Dernière valeur
+        pas (float): Ecart entre deux valeurs (0 = seulement debut)
+
+    Returns:
+        list: Valeurs de la plage, arrondies au centième
+    """
+    if pas <= 0 or fin <= debut:
+        return [debut]
+    nombre = int(np.floor((fin - debut) / pas + 1e-9)) + 1
+    return [round(debut + i * pas, 2) for i in range(nombre)]
+
+
+def taille_grille(plages):
+    """
+    Compte les combinaisons d'une grille de balayage
+
+    Args:
+        plages (dict): (indice du palier, champ) -> liste de valeurs
+
+    Returns:
+        int: Nombre de systèmes candidats
+    """
+    taille = 1
+    for valeurs in plages.values():
+        taille *= len(valeurs)
+    return taille
+
+
+def generer_grille(paliers, plages):
+    """
+    Enumère paresseusement le produit cartésien des plages d'un système
+
+    Args:
+        paliers (list): Paliers du système de référence
+        plages (dict): (indice du palier, champ) -> liste de valeurs ;
+            les champs absents gardent la valeur du système de référence
+
+    Yields:
+        tuple: (valeurs des paramètres balayés, paliers du candidat)
+    """
+    cles = list(plages)
+    for valeurs in itertools.product(*(plages[c] for c in cles)):
+        candidat = copy.deepcopy(paliers)
+        for (indice, champ), valeur in zip(cles, valeurs):
+            candidat[indice][champ] = valeur
+        yield valeurs, candidat
+
+
+def _partager(tableau):
+    """Copie un tableau dans un segment de mémoire partagée"""
+    segment = shared_memory.SharedMemory(create=True,
+                                         size=max(tableau.nbytes, 1))
+    np.ndarray(tableau.shape, tableau.dtype, buffer=segment.buf)[:] = tableau
+    return segment
+
+
+def _attacher(descriptions):
+    """Initialise un processus de calcul sur les tableaux partagés"""
+    global _TABLEAUX, _SEGMENTS_PARTAGES
+    tableaux = []
+    for nom, forme, type_ in descriptions:
+        segment = shared_memory.SharedMemory(name=nom)
+        _SEGMENTS_PARTAGES.append(segment)
+        tableau = np.ndarray(forme, type_, buffer=segment.buf)
+        tableau.flags.writeable = False
+        tableaux.append(tableau)
+    _TABLEAUX = tuple(tableaux)
+
+
+def _evaluer_bloc(bloc, tableaux=None):
+    """
+    Calcule le coût annuel d'un bloc de candidats en une passe matricielle
+
+    Args:
+        bloc (list): Liste de (valeurs balayées, paliers)
+        tableaux (tuple): (voyageurs, conducteurs) ; par défaut les tableaux
+            partagés du processus
+
+    Returns:
+        list: Liste de (valeurs balayées, coût annuel total)
+    """
+    voyageurs, conducteurs = tableaux if tableaux is not None else _TABLEAUX
+    lot = BaremeLot(BaremeCompile(paliers) for _, paliers in bloc)
+    couts = (lot.evaluer(voyageurs) @ conducteurs) * 365
+    return [(valeurs, float(cout)) for (valeurs, _), cout in zip(bloc, couts)]
+
+
+def _blocs(grille, taille_bloc):
+    """Découpe la grille en listes de taille_bloc candidats"""
+    while True:
+        bloc = list(itertools.islice(grille, taille_bloc))
+        if not bloc:
+            return
+        yield bloc
+
+
+def balayer(df, systeme, plages, nb_processus=None, taille_bloc=32):
+    """
+    Evalue une grille de variantes d'un système sur toutes les lignes
+
+    Les colonnes VOY/SERVICE/J et NBRE CONDUCTEURS ETP sont placées une
+    seule fois en mémoire partagée, en lecture seule, pour tous les
+    processus. Les candidats sont évalués par blocs avec un BaremeLot et
+    les résultats sont produits au fil de l'eau, dans l'ordre d'achèvement.
+
+    Args:
+        df (pandas.DataFrame): Données avec VOY/SERVICE/J et NBRE CONDUCTEURS ETP
+        systeme (dict): Système de référence
+        plages (dict): (indice du palier, champ) -> liste de valeurs
+        nb_processus (int): Nombre de processus (1 = calcul dans le processus courant)
+        taille_bloc (int): Nombre de candidats évalués par passe
+
+    Yields:
+        tuple: (valeurs des paramètres balayés, coût annuel total)
+    """
+    voyageurs = df['VOY/SERVICE/J'].to_numpy(dtype=float)
+    conducteurs = df['NBRE CONDUCTEURS ETP'].to_numpy(dtype=float)
+    blocs = _blocs(generer_grille(systeme['paliers'], plages), taille_bloc)
+
+    if nb_processus is None:
+        nb_processus = os.cpu_count() or 1
+    nb_processus = min(nb_processus,
+                       -(-taille_grille(plages) // taille_bloc))
+
+    if nb_processus <= 1:
+        for bloc in blocs:
+            yield from _evaluer_bloc(bloc, (voyageurs, conducteurs))
+        return
+
+    segments = [_partager(voyageurs), _partager(conducteurs)]
+    descriptions = [(s.name, t.shape, t.dtype.str)
+                    for s, t in zip(segments, [voyageurs, conducteurs])]
+    try:
+        with ProcessPoolExecutor(max_workers=nb_processus,
+                                 initializer=_attacher,
+                                 initargs=(descriptions, )) as executeur:
+            # Nombre borné de blocs en cours pour ne pas matérialiser la grille
+            en_cours = set()
+            for bloc in itertools.islice(blocs, 2 * nb_processus):
+                en_cours.add(executeur.submit(_evaluer_bloc, bloc))
+            while en_cours:
+                termines, en_cours = wait(en_cours,
+                                          return_when=FIRST_COMPLETED)
+                for futur in termines:
+                    yield from futur.result()
+                    bloc = next(blocs, None)
+                    if bloc is not None:
+                        en_cours.add(executeur.submit(_evaluer_bloc, bloc))
+    finally:
+        for segment in segments:
+            segment.close()
+            segment.unlink()
+
+
+def tableau_balayage(df, systeme, plages, meilleurs=None, **options):
+    """
+    Classe les variantes d'un système par coût annuel total croissant
+
+    Args:
+        df (pandas.DataFrame): Données avec VOY/SERVICE/J et NBRE CONDUCTEURS ETP
+        systeme (dict): Système de référence
+        plages (dict): (indice du palier, champ) -> liste de valeurs
+        meilleurs (int): Nombre de variantes conservées (toutes par défaut)
+        **options: Paramètres transmis à balayer
+
+    Returns:
+        pandas.DataFrame: Une ligne par variante avec les paramètres balayés,
+            le coût annuel total et le bonus moyen par conducteur et par an
+    """
+    resultats = balayer(df, systeme, plages, **options)
+    if meilleurs is not None:
+        # Seules les variantes les moins coûteuses restent en mémoire
+        resultats = heapq.nsmallest(meilleurs, resultats, key=lambda r: r[1])
+
+    colonnes = [f"palier{indice + 1}_{champ}" for indice, champ in plages]
+    tableau = pd.DataFrame([list(valeurs) + [cout]
+                            for valeurs, cout in resultats],
+                           columns=colonnes + ['cout_annuel'])
+
+    total_conducteurs = df['NBRE CONDUCTEURS ETP'].sum()
+    tableau['bonus_conducteur_an'] = (tableau['cout_annuel'] /
+                                      total_conducteurs
+                                      if total_conducteurs else 0.0)
+
+    return tableau.sort_values('cout_annuel', kind='stable',
+                               ignore_index=True)
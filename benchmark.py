@@ -0,0 +1,404 @@
+import argparse
+import copy
+import gc
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import export
+from analytique import (MAX_POINTS_GRAPHIQUE, binner_nuage,
+                        construire_analyses, limiter_lignes)
+from generation import generer_reseau
+from ingestion import agreger_services_csv
+from simulation import simuler_couts
+from utils import (SYSTEME_NOUVEAU, calculer_prime_generique,
+                   calculer_primes_df, calculer_primes_lot, contenu_csv,
+                   normaliser_types)
+from visualization import extraire_metrique
+
+# Grille mesurée par défaut : nombre de lignes de données et de systèmes
+TAILLES_DEFAUT = [10, 1_000, 100_000, 1_000_000, 10_000_000]
+SYSTEMES_DEFAUT_BENCH = [1, 10, 100]
+
+# Etapes mesurées, dans l'ordre du pipeline
+ETAPES = [
+    'ingestion', 'calcul_scalaire', 'calcul', 'agregation', 'graphiques',
+    'export_csv', 'export_excel', 'simulation'
+]
+
+# Au-delà de ces tailles (lignes x systèmes), les étapes les plus lentes ne
+# sont pas mesurées
+MAX_CELLULES_SCALAIRE = 1_000_000
+MAX_CELLULES_EXCEL = 200_000
+MAX_CELLULES_CSV = 2_000_000
+
+# Le format long des analyses a 5 lignes par ligne de bus et par système
+MAX_CELLULES_ANALYSES = 2_000_000
+
+# Scénarios de la simulation mesurée, et taille maximale (lignes x systèmes)
+# simulée : chaque cellule est évaluée une fois par scénario
+NB_TIRAGES_SIMULATION = 10_000
+MAX_CELLULES_SIMULATION = 10_000
+
+# Taille maximale (lignes x systèmes) d'une combinaison mesurée
+MAX_CELLULES = 20_000_000
+
+# Ralentissement relatif au-delà duquel une mesure est signalée
+SEUIL_REGRESSION = 0.25
+
+HISTORIQUE_DEFAUT = 'benchmarks/historique.jsonl'
+
+
+def donnees_synthetiques(nb_lignes, graine=0):
+    """
+    Construit un réseau synthétique au format validé de l'application
+
+    Args:
+        nb_lignes (int): Nombre de lignes de bus
+        graine (int): Graine du générateur aléatoire
+
+    Returns:
+        pandas.DataFrame: Réseau de generation.generer_reseau, types normalisés
+    """
+    return normaliser_types(generer_reseau(nb_lignes, graine))
+
+
+def services_synthetiques(nb_services, graine=0):
+    """
+    Produit un fichier CSV détaillé par service (voir ingestion.COLONNES_SERVICES)
+
+    Args:
+        nb_services (int): Nombre d'enregistrements de service
+        graine (int): Graine du générateur aléatoire
+
+    Returns:
+        bytes: Contenu du fichier CSV
+    """
+    generateur = np.random.default_rng(graine)
+    nb_lignes = max(1, min(nb_services // 50, 500))
+    lignes = generateur.integers(0, nb_lignes, nb_services)
+    dates = pd.Timestamp('2024-01-01') + pd.to_timedelta(
+        generateur.integers(0, 366, nb_services), unit='D')
+
+    buffer = io.BytesIO()
+    pd.DataFrame({
+        'LIGNE': np.char.add('L', lignes.astype(str)),
+        'DATE': dates.strftime('%Y-%m-%d'),
+        'VOYAGEURS': generateur.poisson(300, nb_services),
+        'BUS': lignes * 100 + generateur.integers(0, 20, nb_services),
+        'CONDUCTEUR': lignes * 1000 + generateur.integers(0, 60, nb_services)
+    }).to_csv(buffer, index=False)
+    return buffer.getvalue()
+
+
+def systemes_synthetiques(nb_systemes, graine=0):
+    """
+    Dérive des variantes du nouveau système avec des taux tirés au hasard
+
+    Args:
+        nb_systemes (int): Nombre de systèmes
+        graine (int): Graine du générateur aléatoire
+
+    Returns:
+        list: Systèmes de prime nommés « Système 1 » à « Système K »
+    """
+    generateur = np.random.default_rng(graine)
+    systemes = []
+    for k in range(nb_systemes):
+        systeme = copy.deepcopy(SYSTEME_NOUVEAU)
+        systeme['nom'] = f"Système {k + 1}"
+        for palier in systeme['paliers']:
+            palier['taux'] = round(palier['taux'] * generateur.uniform(0.5, 1.5), 2)
+        systemes.append(systeme)
+    return systemes
+
+
+def _etapes_combinaison(donnees, systemes, etapes):
+    """
+    Prépare les fonctions mesurées pour une combinaison lignes x systèmes
+
+    Les entrées de chaque étape (résultat du calcul, analyses) sont
+    construites une fois, hors mesure, et seulement si une étape mesurée
+    en a besoin.
+
+    Returns:
+        dict: Nom de l'étape -> fonction sans argument, ou None si l'étape
+            n'est pas mesurée à cette taille
+    """
+    cellules = len(donnees) * len(systemes)
+    resultat = calculer_primes_lot(donnees, systemes)
+    avec_analyses = cellules <= MAX_CELLULES_ANALYSES
+    if avec_analyses and 'graphiques' in etapes:
+        analyses = construire_analyses(resultat)
+    noms_systemes = [s['nom'] for s in systemes]
+    voyageurs = donnees['VOY/SERVICE/J'].to_numpy(dtype=float)
+
+    def calcul_scalaire():
+        for systeme in systemes:
+            [calculer_prime_generique(v, systeme) for v in voyageurs]
+
+    def graphiques():
+        for metrique, agregation in [('prime', 'mean'), ('cout_total', 'sum'),
+                                     ('cout_total_bus', 'mean')]:
+            limiter_lignes(extraire_metrique(analyses, noms_systemes, metrique,
+                                             'Valeur'),
+                           'Valeur', agregation=agregation)
+        distribution = extraire_metrique(analyses, noms_systemes, 'prime',
+                                         'Prime (MAD)',
+                                         colonnes=('Système', 'Voyageurs'))
+        if len(distribution) > MAX_POINTS_GRAPHIQUE:
+            binner_nuage(distribution, 'Voyageurs', 'Prime (MAD)')
+
+    def export_excel():
+        # Le classeur est mis en cache par empreinte : chaque mesure repart à vide
+        export._CACHE_EXPORTS.vider()
+        kpis = pd.DataFrame({
+            'Métrique': [f"Coût annuel {nom}" for nom in noms_systemes],
+            'Valeur': resultat.totaux_annuels().to_numpy()
+        })
+        export.exporter_excel(resultat, resultat.columns, kpis, systemes)
+
+    return {
+        'calcul_scalaire':
+        calcul_scalaire if cellules <= MAX_CELLULES_SCALAIRE else None,
+        'calcul': lambda: calculer_primes_df(donnees, systemes),
+        'agregation':
+        (lambda: construire_analyses(resultat)) if avec_analyses else None,
+        'graphiques': graphiques if avec_analyses else None,
+        'export_csv':
+        (lambda: contenu_csv(resultat)) if cellules <= MAX_CELLULES_CSV else None,
+        'export_excel': export_excel if cellules <= MAX_CELLULES_EXCEL else None,
+        'simulation':
+        (lambda: simuler_couts(donnees, systemes, NB_TIRAGES_SIMULATION, graine=0))
+        if cellules <= MAX_CELLULES_SIMULATION else None
+    }
+
+
+def mesurer(fonction, repetitions=3):
+    """
+    Mesure la durée d'exécution d'une fonction
+
+    Args:
+        fonction (callable): Fonction sans argument
+        repetitions (int): Nombre d'exécutions
+
+    Returns:
+        float: Meilleure durée en secondes
+    """
+    durees = []
+    for _ in range(repetitions):
+        gc.collect()
+        debut = time.perf_counter()
+        fonction()
+        durees.append(time.perf_counter() - debut)
+    return min(durees)
+
+
+def _version():
+    """Commit courant du dépôt, ou '' hors d'un dépôt git"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              capture_output=True, text=True,
+                              cwd=Path(__file__).parent,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def executer_benchmarks(tailles=None, nb_systemes=None, etapes=None,
+                        repetitions=3, max_cellules=MAX_CELLULES, graine=0,
+                        journal=None):
+    """
+    Mesure chaque étape du pipeline sur une grille de tailles synthétiques
+
+    L'ingestion ne dépend que du nombre d'enregistrements : elle est mesurée
+    une fois par taille, avec systemes = 0. Les combinaisons de plus de
+    max_cellules lignes x systèmes et les étapes trop lentes pour leur
+    taille sont enregistrées avec le statut 'ignore'.
+
+    Args:
+        tailles (list): Nombres de lignes (TAILLES_DEFAUT par défaut)
+        nb_systemes (list): Nombres de systèmes (SYSTEMES_DEFAUT_BENCH par défaut)
+        etapes (list): Etapes à mesurer (toutes par défaut)
+        repetitions (int): Exécutions par mesure, la meilleure est gardée
+        max_cellules (int): Taille maximale d'une combinaison
+        graine (int): Graine des données synthétiques
+        journal (callable): Fonction appelée avec chaque mesure (dict)
+
+    Returns:
+        pandas.DataFrame: Une ligne par mesure avec execution, version,
+            machine, etape, lignes, systemes, secondes, debit et statut
+    """
+    tailles = TAILLES_DEFAUT if tailles is None else tailles
+    nb_systemes = SYSTEMES_DEFAUT_BENCH if nb_systemes is None else nb_systemes
+    etapes = ETAPES if etapes is None else etapes
+    contexte = {
+        'execution': datetime.now().isoformat(timespec='seconds'),
+        'version': _version(),
+        'machine': f"{platform.node()} {platform.machine()} {os.cpu_count()} cœurs"
+    }
+
+    mesures = []
+
+    def enregistrer(etape, lignes, systemes, secondes=None):
+        mesure = dict(contexte, etape=etape, lignes=lignes, systemes=systemes,
+                      secondes=secondes,
+                      debit=lignes / secondes if secondes else None,
+                      statut='ignore' if secondes is None else 'ok')
+        mesures.append(mesure)
+        if journal is not None:
+            journal(mesure)
+
+    for nb_lignes in tailles:
+        if 'ingestion' in etapes:
+            contenu = services_synthetiques(nb_lignes, graine)
+            enregistrer('ingestion', nb_lignes, 0,
+                        mesurer(lambda: agreger_services_csv(io.BytesIO(contenu)),
+                                repetitions))
+            del contenu
+
+        donnees = donnees_synthetiques(nb_lignes, graine)
+        for k in nb_systemes:
+            a_mesurer = [e for e in etapes if e != 'ingestion']
+            if nb_lignes * k > max_cellules:
+                for etape in a_mesurer:
+                    enregistrer(etape, nb_lignes, k)
+                continue
+
+            fonctions = _etapes_combinaison(donnees,
+                                            systemes_synthetiques(k, graine),
+                                            a_mesurer)
+            for etape in a_mesurer:
+                fonction = fonctions[etape]
+                enregistrer(etape, nb_lignes, k,
+                            None if fonction is None else
+                            mesurer(fonction, repetitions))
+            del fonctions
+        del donnees
+
+    return pd.DataFrame(mesures)
+
+
+def lire_historique(chemin):
+    """
+    Lit un historique de mesures (une mesure JSON par ligne)
+
+    Args:
+        chemin (str): Chemin du fichier
+
+    Returns:
+        pandas.DataFrame: Mesures, vide si le fichier n'existe pas
+    """
+    chemin = Path(chemin)
+    if not chemin.exists():
+        return pd.DataFrame()
+    with chemin.open(encoding='utf-8') as fichier:
+        return pd.DataFrame([json.loads(ligne) for ligne in fichier if ligne.strip()])
+
+
+def ajouter_historique(chemin, mesures):
+    """
+    Ajoute des mesures à la fin d'un historique
+
+    Args:
+        chemin (str): Chemin du fichier (créé si besoin)
+        mesures (pandas.DataFrame): Mesures de executer_benchmarks
+    """
+    chemin = Path(chemin)
+    chemin.parent.mkdir(parents=True, exist_ok=True)
+    with chemin.open('a', encoding='utf-8') as fichier:
+        # Valeurs manquantes écrites en null, types numpy en types natifs
+        for mesure in mesures.astype(object).where(mesures.notna(), None).to_dict('records'):
+            fichier.write(json.dumps(mesure, ensure_ascii=False,
+                                     default=lambda v: v.item()) + '\n')
+
+
+def comparer(mesures, reference, seuil=SEUIL_REGRESSION):
+    """
+    Compare des mesures à la dernière mesure de référence de chaque cas
+
+    Args:
+        mesures (pandas.DataFrame): Mesures de executer_benchmarks
+        reference (pandas.DataFrame): Historique de référence
+        seuil (float): Ralentissement relatif toléré (0.25 pour +25 %)
+
+    Returns:
+        pandas.DataFrame: Mesures complétées de reference_secondes, ratio et
+            regression (True si la durée dépasse la référence de plus du seuil)
+    """
+    cas = ['etape', 'lignes', 'systemes']
+    comparaison = mesures.copy()
+    if reference.empty:
+        comparaison['reference_secondes'] = np.nan
+    else:
+        derniers = (reference[reference['statut'] == 'ok']
+                    .drop_duplicates(cas, keep='last')[cas + ['secondes']]
+                    .rename(columns={'secondes': 'reference_secondes'}))
+        comparaison = comparaison.merge(derniers, on=cas, how='left')
+
+    comparaison['ratio'] = comparaison['secondes'] / comparaison['reference_secondes']
+    comparaison['regression'] = comparaison['ratio'] > 1 + seuil
+    return comparaison
+
+
+def main(arguments=None):
+    parseur = argparse.ArgumentParser(
+        description="Mesure les performances du moteur de primes et du tableau de bord")
+    parseur.add_argument('-n', '--lignes', type=int, nargs='+', default=None,
+                         help="Nombres de lignes (défaut: 10 à 10 millions)")
+    parseur.add_argument('-k', '--systemes', type=int, nargs='+', default=None,
+                         help="Nombres de systèmes (défaut: 1 10 100)")
+    parseur.add_argument('-e', '--etapes', nargs='+', choices=ETAPES,
+                         default=None, help="Etapes mesurées (défaut: toutes)")
+    parseur.add_argument('-r', '--repetitions', type=int, default=3,
+                         help="Exécutions par mesure (défaut: 3)")
+    parseur.add_argument('--max-cellules', type=int, default=MAX_CELLULES,
+                         help="Lignes x systèmes maximum d'une combinaison")
+    parseur.add_argument('--historique', default=HISTORIQUE_DEFAUT,
+                         help=f"Historique des mesures (défaut: {HISTORIQUE_DEFAUT})")
+    parseur.add_argument('--reference', default=None,
+                         help="Historique de référence (défaut: l'historique)")
+    parseur.add_argument('--seuil', type=float, default=SEUIL_REGRESSION,
+                         help="Ralentissement toléré (défaut: 0.25)")
+    parseur.add_argument('--sans-historique', action='store_true',
+                         help="Ne pas enregistrer les mesures")
+    args = parseur.parse_args(arguments)
+
+    reference = lire_historique(args.reference or args.historique)
+
+    def journal(mesure):
+        duree = ('ignorée' if mesure['secondes'] is None else
+                 f"{mesure['secondes']:.4f} s")
+        print(f"{mesure['etape']:<16} {mesure['lignes']:>11,} lignes "
+              f"{mesure['systemes']:>4} systèmes  {duree}", file=sys.stderr)
+
+    mesures = executer_benchmarks(args.lignes, args.systemes, args.etapes,
+                                  args.repetitions, args.max_cellules,
+                                  journal=journal)
+    if not args.sans_historique:
+        ajouter_historique(args.historique, mesures)
+
+    comparaison = comparer(mesures, reference, args.seuil)
+    print(comparaison[['etape', 'lignes', 'systemes', 'secondes',
+                       'reference_secondes', 'ratio',
+                       'regression']].to_string(index=False))
+
+    regressions = comparaison[comparaison['regression']]
+    if not regressions.empty:
+        print(f"{len(regressions)} régression(s) au-delà de "
+              f"{args.seuil:.0%}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
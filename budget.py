@@ -0,0 +1,177 @@
+import copy
+
+import numpy as np
+
+from moteur import BaremeCompile
+
+# Enveloppe annuelle des primes versées en 2024 (MAD)
+BUDGET_2024 = 9309650
+
+
+def _racine_monotone(fonction, bas, haut, tolerance, max_iterations=100):
+    """
+    Cherche x tel que fonction(x) = 0 pour une fonction croissante
+
+    La borne haute est doublée jusqu'à encadrer la racine, puis l'intervalle
+    est réduit par la méthode de la fausse position (variante d'Illinois),
+    qui converge en quelques évaluations sur une fonction presque affine.
+    Une fonction en escalier (coût arrondi au centime) peut sauter par-dessus
+    la tolérance : quand l'intervalle se réduit à la marche qui enjambe zéro,
+    le point évalué le plus proche de zéro est la valeur atteignable la plus
+    proche, renvoyée comme atteinte. Sans convergence, ce point est signalé
+    comme hors tolérance.
+
+    Args:
+        fonction (callable): Fonction croissante d'une variable
+        bas (float): Borne basse de la recherche
+        haut (float): Première borne haute essayée
+        tolerance (float): Ecart accepté sur la valeur de la fonction
+        max_iterations (int): Nombre maximal d'évaluations par phase
+
+    Returns:
+        tuple: (racine, atteinte) - le point évalué de plus petit écart et
+            True si cet écart respecte la tolérance ou si zéro tombe dans
+            une marche de la fonction ; (None, False) si la racine n'est pas
+            encadrée
+    """
+    f_bas = fonction(bas)
+    if f_bas > tolerance:
+        return None, False
+    if abs(f_bas) <= tolerance:
+        return bas, True
+
+    f_haut = fonction(haut)
+    for _ in range(max_iterations):
+        if f_haut >= 0:
+            break
+        bas, f_bas = haut, f_haut
+        haut *= 2
+        f_haut = fonction(haut)
+    else:
+        return None, False
+
+    meilleur = min((abs(f_bas), bas), (abs(f_haut), haut))
+    cote = 0
+    for _ in range(max_iterations):
+        x = haut - f_haut * (haut - bas) / (f_haut - f_bas)
+        f_x = fonction(x)
+        meilleur = min(meilleur, (abs(f_x), x))
+        if abs(f_x) <= tolerance:
+            return x, True
+        if haut - bas <= 1e-12 * max(1.0, abs(x)):
+            # Saut de la fonction entre bas et haut : pas de point plus proche
+            return meilleur[1], True
+        if f_x < 0:
+            bas, f_bas = x, f_x
+            if cote == -1:
+                f_haut /= 2
+            cote = -1
+        else:
+            haut, f_haut = x, f_x
+            if cote == 1:
+                f_bas /= 2
+            cote = 1
+    return meilleur[1], meilleur[0] <= tolerance
+
+
+def _cout(paliers, voyageurs, conducteurs):
+    """Coût annuel total d'une liste de paliers sur toutes les lignes"""
+    return float(BaremeCompile(paliers).evaluer(voyageurs) @ conducteurs) * 365
+
+
+def _tableaux(df):
+    conducteurs = df['NBRE CONDUCTEURS ETP'].to_numpy(dtype=float)
+    return (df['VOY/SERVICE/J'].to_numpy(dtype=float),
+            np.where(np.isfinite(conducteurs), conducteurs, 0.0))
+
+
+def tolerance_cout(conducteurs):
+    """
+    Donne l'écart au budget en deçà duquel le coût ne peut pas être réglé
+
+    Les primes étant arrondies au centime par service, le coût annuel avance
+    par marches de 0,01 x conducteurs x 365 MAD par ligne : la tolérance par
+    défaut est la moitié de la plus haute de ces marches (1 MAD au moins).
+
+    Args:
+        conducteurs (numpy.ndarray): Conducteurs ETP de chaque ligne
+
+    Returns:
+        float: Tolérance en MAD
+    """
+    plus_grand = conducteurs.max() if len(conducteurs) else 0.0
+    return max(1.0, 0.01 * plus_grand * 365 / 2)
+
+
+def ajuster_echelle(df, systeme, budget, tolerance=None):
+    """
+    Multiplie tous les taux d'un système pour atteindre un budget annuel
+
+    Args:
+        df (pandas.DataFrame): Données avec VOY/SERVICE/J et NBRE CONDUCTEURS ETP
+        systeme (dict): Système dont la forme des paliers est conservée
+        budget (float): Coût annuel total visé en MAD
+        tolerance (float): Ecart accepté sur le coût en MAD (par défaut,
+            tolerance_cout : une demi-marche d'arrondi au centime)
+
+    Returns:
+        tuple: (système ajusté, coût annuel obtenu, tolérance atteinte), ou
+            None si le budget est hors d'atteinte
+    """
+    voyageurs, conducteurs = _tableaux(df)
+    if tolerance is None:
+        tolerance = tolerance_cout(conducteurs)
+    paliers = copy.deepcopy(systeme["paliers"])
+    taux = np.array([p["taux"] for p in paliers], dtype=float)
+
+    def ecart(echelle):
+        for palier, t in zip(paliers, taux * echelle):
+            palier["taux"] = t
+        return _cout(paliers, voyageurs, conducteurs) - budget
+
+    echelle, atteinte = _racine_monotone(ecart, 0.0, 1.0, tolerance)
+    if echelle is None:
+        return None
+
+    ajuste = copy.deepcopy(systeme)
+    ajuste["paliers"] = [
+        dict(palier, taux=float(t))
+        for palier, t in zip(systeme["paliers"], taux * echelle)
+    ]
+    return ajuste, _cout(ajuste["paliers"], voyageurs, conducteurs), atteinte
+
+
+def ajuster_taux_palier(df, systeme, budget, indice, tolerance=None):
+    """
+    Cherche le taux d'un seul palier qui fait atteindre un budget annuel
+
+    Args:
+        df (pandas.DataFrame): Données avec VOY/SERVICE/J et NBRE CONDUCTEURS ETP
+        systeme (dict): Système dont les autres paliers sont conservés
+        budget (float): Coût annuel total visé en MAD
+        indice (int): Indice du palier dont le taux est libre
+        tolerance (float): Ecart accepté sur le coût en MAD (par défaut,
+            tolerance_cout : une demi-marche d'arrondi au centime)
+
+    Returns:
+        tuple: (système ajusté, coût annuel obtenu, tolérance atteinte), ou
+            None si le budget est hors d'atteinte
+    """
+    voyageurs, conducteurs = _tableaux(df)
+    if tolerance is None:
+        tolerance = tolerance_cout(conducteurs)
+    paliers = copy.deepcopy(systeme["paliers"])
+
+    def ecart(taux):
+        paliers[indice]["taux"] = taux
+        return _cout(paliers, voyageurs, conducteurs) - budget
+
+    taux, atteinte = _racine_monotone(ecart, 0.0,
+                                      max(paliers[indice]["taux"], 0.01),
+                                      tolerance)
+    if taux is None:
+        return None
+
+    ajuste = copy.deepcopy(systeme)
+    ajuste["paliers"][indice]["taux"] = float(taux)
+    return ajuste, _cout(ajuste["paliers"], voyageurs, conducteurs), atteinte
@@ -0,0 +1,185 @@
+import hashlib
+import json
+import sys
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+def taille_objet(valeur):
+    """
+    Estime l'empreinte mémoire d'une valeur mise en cache
+
+    Args:
+        valeur: Objet à mesurer (DataFrame, tableau NumPy, tuple...)
+
+    Returns:
+        int: Taille estimée en octets
+    """
+    if isinstance(valeur, pd.DataFrame):
+        return int(valeur.memory_usage(index=True, deep=True).sum())
+    if isinstance(valeur, pd.Series):
+        return int(valeur.memory_usage(index=True, deep=True))
+    if isinstance(valeur, np.ndarray):
+        return int(valeur.nbytes)
+    if isinstance(valeur, (bytes, bytearray)):
+        return len(valeur)
+    if isinstance(valeur, (tuple, list)):
+        return sys.getsizeof(valeur) + sum(taille_objet(v) for v in valeur)
+    if isinstance(valeur, dict):
+        return sys.getsizeof(valeur) + sum(
+            taille_objet(v) for v in valeur.values())
+    if hasattr(valeur, 'taille_octets'):
+        return int(valeur.taille_octets())
+    return sys.getsizeof(valeur)
+
+
+# Empreintes déjà calculées, indexées par identité de l'objet DataFrame
+_EMPREINTES_CONNUES = {}
+
+
+def empreinte_dataframe(df):
+    """
+    Calcule une empreinte stable du contenu d'un DataFrame
+
+    L'empreinte couvre les valeurs, l'index, les noms de colonnes et les types.
+    Elle est mémorisée pour l'objet tant qu'il existe : comme les DataFrames
+    partagés via les caches, un DataFrame empreinté ne doit plus être modifié
+    en place.
+
+    Args:
+        df (pandas.DataFrame): DataFrame à identifier
+
+    Returns:
+        str: Empreinte hexadécimale
+    """
+    connue = _EMPREINTES_CONNUES.get(id(df))
+    if connue is not None and connue[0]() is df:
+        return connue[1]
+
+    h = hashlib.sha256()
+    h.update(repr([(str(c), str(t)) for c, t in df.dtypes.items()]).encode())
+    h.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    empreinte = h.hexdigest()
+
+    cle = id(df)
+    _EMPREINTES_CONNUES[cle] = (weakref.ref(
+        df, lambda _: _EMPREINTES_CONNUES.pop(cle, None)), empreinte)
+    return empreinte
+
+
+def empreinte_systeme(systeme):
+    """
+    Calcule une empreinte canonique d'un système de prime
+
+    Seuls le nom (qui détermine les noms de colonnes) et les paliers sont
+    pris en compte ; la description n'influence pas les calculs.
+
+    Args:
+        systeme (dict): Description du système de prime
+
+    Returns:
+        str: Empreinte hexadécimale
+    """
+    paliers = [[float(p["min"]), float(p["max"]), float(p["taux"])]
+               for p in systeme["paliers"]]
+    canonique = json.dumps({"nom": systeme["nom"], "paliers": paliers})
+    return hashlib.sha256(canonique.encode()).hexdigest()
+
+
+class CacheLRU:
+    """
+    Cache borné à éviction LRU, partagé entre les sessions Streamlit
+
+    Le cache est limité en nombre d'entrées et, optionnellement, en octets.
+    Les compteurs de succès et d'échecs permettent d'ajuster ces limites.
+
+    Attributes:
+        max_entrees (int): Nombre maximal d'entrées conservées
+        max_octets (int): Taille mémoire maximale cumulée (None = illimitée)
+        succes (int): Nombre de lectures trouvées dans le cache
+        echecs (int): Nombre de lectures absentes du cache
+    """
+
+    def __init__(self, max_entrees=32, max_octets=None):
+        self.max_entrees = max_entrees
+        self.max_octets = max_octets
+        self.succes = 0
+        self.echecs = 0
+        self._entrees = OrderedDict()
+        self._octets = 0
+        self._verrou = threading.Lock()
+
+    def __len__(self):
+        return len(self._entrees)
+
+    def __contains__(self, cle):
+        return cle in self._entrees
+
+    def obtenir(self, cle, defaut=None):
+        """
+        Lit une entrée et la marque comme la plus récemment utilisée
+
+        Args:
+            cle (hashable): Clé de l'entrée
+            defaut: Valeur renvoyée si la clé est absente
+
+        Returns:
+            Valeur en cache, ou defaut si absente
+        """
+        with self._verrou:
+            if cle in self._entrees:
+                self._entrees.move_to_end(cle)
+                self.succes += 1
+                return self._entrees[cle][0]
+            self.echecs += 1
+            return defaut
+
+    def ajouter(self, cle, valeur):
+        """
+        Ajoute une entrée en évinçant les moins récemment utilisées si besoin
+
+        Une valeur plus grosse que max_octets n'est pas conservée.
+
+        Args:
+            cle (hashable): Clé de l'entrée
+            valeur: Valeur à conserver
+        """
+        taille = taille_objet(valeur)
+        with self._verrou:
+            if cle in self._entrees:
+                self._octets -= self._entrees.pop(cle)[1]
+            if self.max_octets is not None and taille > self.max_octets:
+                return
+            self._entrees[cle] = (valeur, taille)
+            self._octets += taille
+            while len(self._entrees) > self.max_entrees or (
+                    self.max_octets is not None
+                    and self._octets > self.max_octets):
+                _, (_, taille_evincee) = self._entrees.popitem(last=False)
+                self._octets -= taille_evincee
+
+    def vider(self):
+        """Supprime toutes les entrées et remet les compteurs à zéro"""
+        with self._verrou:
+            self._entrees.clear()
+            self._octets = 0
+            self.succes = 0
+            self.echecs = 0
+
+    def statistiques(self):
+        """
+        Résume l'état du cache
+
+        Returns:
+            dict: Succès, échecs, nombre d'entrées et octets occupés
+        """
+        return {
+            "succes": self.succes,
+            "echecs": self.echecs,
+            "entrees": len(self._entrees),
+            "octets": self._octets
+        }
@@ -0,0 +1,274 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from cache import CacheLRU, empreinte_dataframe, empreinte_systeme
+from moteur import compiler_systemes
+from resultats import nom_base_systeme
+
+# Calendriers déjà calculés, indexés par empreinte des données, de la série et des systèmes
+_CACHE_CALENDRIERS = CacheLRU(max_entrees=8, max_octets=256 * 1024**2)
+
+# Séries regroupées par mois, indexées par empreinte de la série journalière
+_CACHE_SERIES_MENSUELLES = CacheLRU(max_entrees=8, max_octets=64 * 1024**2)
+
+# Granularités acceptées pour la fréquentation : journalière ou mensuelle
+FREQUENCES = ('J', 'M')
+
+
+def _services_par_jour(df):
+    """Services par jour de chaque ligne, déduits de VOY et de VOY/SERVICE/J"""
+    moyennes = df['VOY/SERVICE/J'].to_numpy(dtype=float)
+    return np.divide(df['VOY'].to_numpy(dtype=float) / 365,
+                     moyennes,
+                     out=np.zeros(len(df)),
+                     where=moyennes > 0)
+
+
+def matrices_calendrier(df, serie, frequence='J'):
+    """
+    Répartit la fréquentation de chaque ligne sur les jours du calendrier
+
+    La série donne, par LIGNE et par DATE, les voyageurs par service
+    (VOY/SERVICE/J) ou les voyageurs de la période (VOY). En mensuel, la
+    valeur d'un mois s'applique à chacun de ses jours (VOY est alors réparti
+    sur le nombre réel de jours du mois). Sans SERVICES ni VOY/SERVICE/J,
+    les voyageurs sont convertis avec les services par jour de la ligne
+    (VOY / 365 / VOY/SERVICE/J des données annuelles). Un jour absent d'une
+    ligne présente dans la série est un jour sans service ; une ligne absente
+    de la série garde chaque jour sa moyenne annuelle.
+
+    Args:
+        df (pandas.DataFrame): Données par ligne (LIGNE, VOY, VOY/SERVICE/J)
+        serie (pandas.DataFrame): Fréquentation par LIGNE et DATE
+        frequence (str): 'J' (journalière) ou 'M' (mensuelle)
+
+    Returns:
+        tuple: (pandas.DatetimeIndex des jours, voyageurs par service
+            (lignes x jours, NaN sans service), voyageurs par jour
+            (lignes x jours))
+    """
+    if frequence not in FREQUENCES:
+        raise ValueError(f"Fréquence inconnue: {frequence}")
+    if 'VOY/SERVICE/J' not in serie.columns and 'VOY' not in serie.columns:
+        raise ValueError("La série doit contenir VOY ou VOY/SERVICE/J")
+
+    dates = pd.to_datetime(serie['DATE'])
+    if frequence == 'M':
+        debut = dates.min().to_period('M').to_timestamp()
+        fin = dates.max().to_period('M').to_timestamp(how='end').normalize()
+    else:
+        debut, fin = dates.min(), dates.max()
+    jours = pd.date_range(debut, fin, freq='D')
+
+    lignes = df['LIGNE'].astype(str)
+    services_ligne = _services_par_jour(df)
+    # Position de chaque enregistrement de la série (première ligne du même nom)
+    positions_lignes = pd.Series(np.arange(len(lignes)), index=lignes.to_numpy())
+    positions_lignes = positions_lignes[~positions_lignes.index.duplicated()]
+    indices = positions_lignes.reindex(serie['LIGNE'].astype(str)).to_numpy()
+    presentes = ~np.isnan(indices)
+    indices = indices[presentes].astype(int)
+    serie = serie[presentes]
+    dates = dates[presentes]
+
+    if 'VOY/SERVICE/J' in serie.columns:
+        par_service = serie['VOY/SERVICE/J'].to_numpy(dtype=float)
+    if 'SERVICES' in serie.columns:
+        services = serie['SERVICES'].to_numpy(dtype=float)
+    else:
+        services = services_ligne[indices]
+
+    if frequence == 'M':
+        # Chaque mois est étendu à ses jours réels
+        nb_jours = dates.dt.days_in_month.to_numpy()
+        premiers = ((dates.dt.to_period('M').dt.to_timestamp() - debut).dt.days
+                    ).to_numpy()
+        if 'SERVICES' in serie.columns:
+            services = services / nb_jours
+        if 'VOY/SERVICE/J' not in serie.columns:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                par_service = serie['VOY'].to_numpy(dtype=float) / nb_jours / services
+        indices = np.repeat(indices, nb_jours)
+        positions = np.repeat(premiers, nb_jours) + (
+            np.arange(nb_jours.sum()) - np.repeat(np.cumsum(nb_jours) - nb_jours, nb_jours))
+        par_service = np.repeat(par_service, nb_jours)
+        services = np.repeat(services, nb_jours)
+    else:
+        positions = (dates - debut).dt.days.to_numpy()
+        if 'VOY/SERVICE/J' not in serie.columns:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                par_service = serie['VOY'].to_numpy(dtype=float) / services
+
+    nb_lignes, nb_jours_total = len(df), len(jours)
+    voyageurs = np.full((nb_lignes, nb_jours_total), np.nan)
+    nb_services = np.zeros((nb_lignes, nb_jours_total))
+
+    # Lignes sans série : la moyenne annuelle chaque jour
+    sans_serie = np.ones(nb_lignes, dtype=bool)
+    sans_serie[indices] = False
+    voyageurs[sans_serie] = df['VOY/SERVICE/J'].to_numpy(dtype=float)[sans_serie, None]
+    nb_services[sans_serie] = services_ligne[sans_serie, None]
+
+    voyageurs[indices, positions] = par_service
+    nb_services[indices, positions] = services
+    voyageurs[~(nb_services > 0)] = np.nan
+
+    return jours, voyageurs, np.nan_to_num(voyageurs) * nb_services
+
+
+def serie_mensuelle(serie):
+    """
+    Regroupe par mois une fréquentation journalière
+
+    Args:
+        serie (pandas.DataFrame): Fréquentation par LIGNE et DATE avec VOY
+            et, si présents, SERVICES et VOY/SERVICE/J
+
+    Returns:
+        pandas.DataFrame: Une ligne par LIGNE et par mois (DATE au premier
+            jour du mois) avec VOY, et SERVICES et VOY/SERVICE/J si la série
+            journalière donne SERVICES
+    """
+    mois = pd.to_datetime(serie['DATE']).dt.to_period('M').dt.to_timestamp()
+    colonnes = ['VOY'] + (['SERVICES'] if 'SERVICES' in serie.columns else [])
+    mensuelle = (serie[colonnes].groupby([serie['LIGNE'].astype(str), mois.rename('DATE')],
+                                         sort=True).sum().reset_index())
+    if 'SERVICES' in mensuelle.columns:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mensuelle['VOY/SERVICE/J'] = (mensuelle['VOY'].to_numpy(dtype=float) /
+                                          mensuelle['SERVICES'].to_numpy(dtype=float))
+    return mensuelle
+
+
+def serie_mensuelle_cache(serie):
+    """
+    Version mémoïsée de serie_mensuelle
+
+    La même série mensuelle est renvoyée tant que la série journalière ne
+    change pas : son empreinte, déjà calculée, sert alors de clé au cache des
+    calendriers. Elle ne doit pas être modifiée en place.
+
+    Args:
+        serie (pandas.DataFrame): Fréquentation journalière par LIGNE et DATE
+
+    Returns:
+        pandas.DataFrame: Fréquentation par LIGNE et par mois
+    """
+    cle = empreinte_dataframe(serie)
+    mensuelle = _CACHE_SERIES_MENSUELLES.obtenir(cle)
+    if mensuelle is None:
+        mensuelle = serie_mensuelle(serie)
+        _CACHE_SERIES_MENSUELLES.ajouter(cle, mensuelle)
+    return mensuelle
+
+
+class PrimesCalendrier:
+    """
+    Primes de K systèmes évaluées jour par jour sur le calendrier réel
+
+    Le barème est évalué en une seule passe sur le tableau lignes x jours ;
+    les totaux mensuels somment les jours réels de chaque mois.
+
+    Attributes:
+        lignes (numpy.ndarray): Identifiant de chaque ligne
+        jours (pandas.DatetimeIndex): Jours du calendrier
+        noms (list): Suffixes de colonnes de chaque système
+        voyageurs_jour (numpy.ndarray): Voyageurs par jour (lignes x jours)
+        bonus_jour (numpy.ndarray): Bonus par jour (systèmes x lignes x jours)
+    """
+
+    def __init__(self, df, serie, systemes, frequence='J'):
+        self.lignes = df['LIGNE'].astype(str).to_numpy()
+        self.noms = [nom_base_systeme(s) for s in systemes]
+        self.jours, voyageurs, self.voyageurs_jour = matrices_calendrier(
+            df, serie, frequence)
+
+        # Une ligne sans nombre de conducteurs ne compte pas dans les totaux
+        conducteurs = df['NBRE CONDUCTEURS ETP'].to_numpy(dtype=float)
+        conducteurs = np.where(np.isfinite(conducteurs), conducteurs, 0.0)
+        self.bonus_jour = (compiler_systemes(systemes).evaluer(voyageurs) *
+                           conducteurs[:, None])
+        self._empreinte = hashlib.sha256(
+            (empreinte_dataframe(df) + empreinte_dataframe(serie) + frequence +
+             ''.join(empreinte_systeme(s) for s in systemes)).encode()).hexdigest()
+
+    def empreinte(self):
+        """str: Empreinte des données, de la série, de la fréquence et des systèmes"""
+        return self._empreinte
+
+    def taille_octets(self):
+        """int: Mémoire occupée par les tableaux journaliers"""
+        return int(self.voyageurs_jour.nbytes + self.bonus_jour.nbytes)
+
+    def _mois(self):
+        """Premier jour de chaque mois et libellé AAAA-MM"""
+        mois = self.jours.to_period('M')
+        debuts = np.flatnonzero(np.r_[True, mois[1:] != mois[:-1]])
+        return debuts, mois[debuts].astype(str)
+
+    def par_mois(self):
+        """
+        Totaux mensuels réels par ligne
+
+        Returns:
+            pandas.DataFrame: Une ligne par LIGNE et par MOIS (AAAA-MM) avec
+                JOURS (jours avec voyageurs), VOY_MENSUEL et, pour chaque système,
+                cout_total_<nom>_mensuel
+        """
+        debuts, libelles = self._mois()
+        nb_lignes, nb_mois = len(self.lignes), len(debuts)
+
+        colonnes = {
+            'LIGNE': np.repeat(self.lignes, nb_mois),
+            'MOIS': np.tile(libelles, nb_lignes),
+            'JOURS': np.add.reduceat((self.voyageurs_jour > 0).astype(int),
+                                     debuts, axis=1).ravel(),
+            'VOY_MENSUEL': np.add.reduceat(self.voyageurs_jour, debuts,
+                                           axis=1).ravel()
+        }
+        couts = np.add.reduceat(self.bonus_jour, debuts, axis=2)
+        for k, nom in enumerate(self.noms):
+            colonnes[f"cout_total_{nom}_mensuel"] = couts[k].ravel()
+        return pd.DataFrame(colonnes)
+
+    def totaux_mensuels(self):
+        """
+        Totaux mensuels réels sur tout le réseau
+
+        Returns:
+            pandas.DataFrame: Une ligne par MOIS avec VOY_MENSUEL et, pour
+                chaque système, cout_total_<nom>_mensuel
+        """
+        debuts, libelles = self._mois()
+        colonnes = {
+            'MOIS': libelles,
+            'VOY_MENSUEL': np.add.reduceat(self.voyageurs_jour.sum(axis=0), debuts)
+        }
+        couts = np.add.reduceat(self.bonus_jour.sum(axis=1), debuts, axis=1)
+        for k, nom in enumerate(self.noms):
+            colonnes[f"cout_total_{nom}_mensuel"] = couts[k]
+        return pd.DataFrame(colonnes)
+
+
+def calculer_primes_calendrier(df, serie, systemes, frequence='J'):
+    """
+    Version mémoïsée de PrimesCalendrier
+
+    Args:
+        df (pandas.DataFrame): Données par ligne
+        serie (pandas.DataFrame): Fréquentation par LIGNE et DATE
+        systemes (list): Systèmes de prime à évaluer
+        frequence (str): 'J' (journalière) ou 'M' (mensuelle)
+
+    Returns:
+        PrimesCalendrier: Primes jour par jour, partagées entre les appels
+    """
+    cle = (empreinte_dataframe(df), empreinte_dataframe(serie), frequence,
+           tuple(empreinte_systeme(s) for s in systemes))
+    calendrier = _CACHE_CALENDRIERS.obtenir(cle)
+    if calendrier is None:
+        calendrier = PrimesCalendrier(df, serie, systemes, frequence)
+        _CACHE_CALENDRIERS.ajouter(cle, calendrier)
+    return calendrier
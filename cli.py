@@ -0,0 +1,192 @@
+import argparse
+import os
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import pandas as pd
+
+from ingestion import charger_excel
+from utils import calculer_primes_lot, importer_systeme_json
+
+# Extensions des classeurs traités dans le répertoire d'entrée
+EXTENSIONS_CLASSEURS = ('.xlsx', '.xls')
+
+# Nom (sans extension) de la synthèse écrite dans le répertoire de sortie
+NOM_SYNTHESE = 'synthese'
+
+
+def charger_systemes(chemins):
+    """
+    Lit des systèmes de prime exportés par exporter_systeme_json
+
+    Args:
+        chemins (list): Chemins des fichiers JSON
+
+    Returns:
+        list: Systèmes de prime, dans l'ordre des fichiers
+
+    Raises:
+        ValueError: Si un fichier ne décrit pas un système valide
+    """
+    systemes = []
+    for chemin in chemins:
+        systeme = importer_systeme_json(Path(chemin).read_text(encoding='utf-8'))
+        if systeme is None:
+            raise ValueError(f"Système de prime invalide: {chemin}")
+        systemes.append(systeme)
+    return systemes
+
+
+def noms_sorties(classeurs):
+    """
+    Choisit le fichier de résultats de chaque classeur
+
+    Le nom du classeur sans extension est repris s'il est unique ; les
+    classeurs de même nom (a.xlsx et a.xls, ou casse différente) sont
+    distingués par leur extension (a_xlsx.csv, a_xls.csv), puis par un
+    numéro si besoin. Les noms sont comparés sans tenir compte de la casse
+    et ne reprennent jamais celui de la synthèse.
+
+    Args:
+        classeurs (list): Chemins des classeurs (pathlib.Path)
+
+    Returns:
+        dict: Nom du fichier CSV de résultats de chaque classeur
+    """
+    effectifs = Counter(c.stem.lower() for c in classeurs)
+    effectifs[NOM_SYNTHESE] += 1
+    pris = {NOM_SYNTHESE}
+    noms = {}
+    for classeur in classeurs:
+        nom = classeur.stem
+        if effectifs[nom.lower()] > 1:
+            nom = f"{nom}_{classeur.suffix.lstrip('.').lower()}"
+        base, numero = nom, 2
+        while nom.lower() in pris:
+            nom = f"{base}_{numero}"
+            numero += 1
+        pris.add(nom.lower())
+        noms[classeur] = f"{nom}.csv"
+    return noms
+
+
+def traiter_classeur(chemin, systemes, sortie, nb_services_par_jour=5,
+                     nom_sortie=None):
+    """
+    Calcule les primes d'un classeur pour tous les systèmes et écrit le résultat
+
+    Args:
+        chemin (str): Chemin du classeur Excel
+        systemes (list): Systèmes de prime à évaluer
+        sortie (str): Répertoire des fichiers de résultats
+        nb_services_par_jour (int): Nombre de services par jour par ligne
+        nom_sortie (str): Nom du fichier de résultats (par défaut, le nom du
+            classeur avec l'extension .csv)
+
+    Returns:
+        list: Une ligne de synthèse (dict) par système
+    """
+    chemin = Path(chemin)
+    data, valide, message = charger_excel(chemin.read_bytes())
+    if not valide:
+        return [{
+            'classeur': chemin.name,
+            'systeme': s['nom'],
+            'erreur': message
+        } for s in systemes]
+
+    resultat = calculer_primes_lot(data, systemes, nb_services_par_jour)
+    nom_sortie = nom_sortie or f"{chemin.stem}.csv"
+    resultat.vers_dataframe().to_csv(Path(sortie) / nom_sortie, index=False)
+
+    totaux = resultat.totaux_annuels()
+    total_conducteurs = data['NBRE CONDUCTEURS ETP'].sum()
+    return [{
+        'classeur': chemin.name,
+        'sortie': nom_sortie,
+        'systeme': nom,
+        'lignes': len(data),
+        'cout_annuel': cout,
+        'bonus_conducteur_an':
+        cout / total_conducteurs if total_conducteurs else 0.0,
+        'erreur': ''
+    } for nom, cout in totaux.items()]
+
+
+def executer(entree, fichiers_systemes, sortie, nb_processus=None,
+             nb_services_par_jour=5):
+    """
+    Traite tous les classeurs d'un répertoire avec un ensemble de systèmes
+
+    Chaque classeur est une tâche du groupe de processus ; ses systèmes sont
+    évalués ensemble en une passe. Un fichier de résultats par classeur
+    (voir noms_sorties) et une synthèse (une ligne par classeur et par
+    système) sont écrits dans le répertoire de sortie.
+
+    Args:
+        entree (str): Répertoire des classeurs Excel
+        fichiers_systemes (list): Fichiers JSON des systèmes de prime
+        sortie (str): Répertoire des résultats (créé si besoin)
+        nb_processus (int): Nombre de processus (par défaut, un par cœur)
+        nb_services_par_jour (int): Nombre de services par jour par ligne
+
+    Returns:
+        pandas.DataFrame: Synthèse des coûts annuels
+    """
+    systemes = charger_systemes(fichiers_systemes)
+    classeurs = sorted(p for p in Path(entree).iterdir()
+                       if p.suffix.lower() in EXTENSIONS_CLASSEURS
+                       and not p.name.startswith('~$'))
+    noms = noms_sorties(classeurs)
+    os.makedirs(sortie, exist_ok=True)
+
+    lignes = []
+    with ProcessPoolExecutor(max_workers=nb_processus) as executeur:
+        taches = {
+            executeur.submit(traiter_classeur, str(c), systemes, sortie,
+                             nb_services_par_jour, noms[c]): c
+            for c in classeurs
+        }
+        for tache in as_completed(taches):
+            try:
+                lignes.extend(tache.result())
+            except Exception as e:
+                lignes.append({'classeur': taches[tache].name, 'erreur': str(e)})
+
+    synthese = pd.DataFrame(lignes, columns=[
+        'classeur', 'sortie', 'systeme', 'lignes', 'cout_annuel',
+        'bonus_conducteur_an', 'erreur'
+    ]).sort_values(['classeur', 'systeme'], ignore_index=True)
+    synthese.to_csv(Path(sortie) / f"{NOM_SYNTHESE}.csv", index=False)
+    return synthese
+
+
+def main(arguments=None):
+    parseur = argparse.ArgumentParser(
+        description="Calcule les primes des conducteurs sans l'interface Streamlit")
+    parseur.add_argument('entree', help="Répertoire des classeurs Excel")
+    parseur.add_argument('systemes', nargs='+',
+                         help="Fichiers JSON des systèmes de prime")
+    parseur.add_argument('-o', '--sortie', default='sorties',
+                         help="Répertoire des résultats (défaut: sorties)")
+    parseur.add_argument('-p', '--processus', type=int, default=None,
+                         help="Nombre de processus (défaut: un par cœur)")
+    parseur.add_argument('--services-par-jour', type=int, default=5,
+                         help="Nombre de services par jour par ligne")
+    args = parseur.parse_args(arguments)
+
+    try:
+        synthese = executer(args.entree, args.systemes, args.sortie,
+                            args.processus, args.services_par_jour)
+    except (OSError, ValueError) as e:
+        print(f"Erreur: {e}", file=sys.stderr)
+        return 1
+
+    print(synthese.to_string(index=False))
+    return 1 if (synthese['erreur'].fillna('') != '').any() else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
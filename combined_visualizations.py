@@ -5,6 +5,7 @@ import matplotlib.pyplot as plt
 import matplotlib.ticker as mticker
 import numpy as np
 from utils import SYSTEMES_DEFAUT
+from analytique import limiter_lignes
 
 def creer_graphique_combine(analyses, systemes_actifs, metric_type="BONUS/AN"):
     """
@@ -25,71 +26,53 @@ def creer_graphique_combine(analyses, systemes_actifs, metric_type="BONUS/AN"):
         st.warning("Aucune donnée disponible pour la visualisation")
         return
 
-    df_lignes = analyses['par_ligne']
-    
-    # Préparer les données pour le graphique
-    data = []
-    
-    # Déterminer la colonne à utiliser selon le type de métrique
+    # Métrique du format long et titre selon le type de métrique
     if metric_type == "BONUS/AN":
-        cols = [f"cout_total_{s['nom'].replace(' ', '_').lower()}" for s in systemes_actifs]
+        metrique = "cout_total"
         title = "Coût annuel total par ligne"
-        y_title = "Montant (MAD)"
     elif metric_type == "BONUS/MOIS":
-        cols = [f"cout_total_{s['nom'].replace(' ', '_').lower()}_mensuel" for s in systemes_actifs]
+        metrique = "cout_total_mensuel"
         title = "Coût mensuel par ligne"
-        y_title = "Montant (MAD)"
     elif metric_type == "BONUS/BUS/AN":
-        cols = [f"cout_total_{s['nom'].replace(' ', '_').lower()}_bus" for s in systemes_actifs]
+        metrique = "cout_total_bus"
         title = "Coût annuel par bus par ligne"
-        y_title = "Montant (MAD)"
     elif metric_type == "BONUS/CONDUCTEUR/AN":
-        cols = [f"cout_total_{s['nom'].replace(' ', '_').lower()}_conducteur" for s in systemes_actifs]
+        metrique = "cout_total_conducteur"
         title = "Coût annuel par conducteur par ligne"
-        y_title = "Montant (MAD)"
     elif metric_type == "BONUS/SERVICE/J":
-        cols = [f"prime_{s['nom'].replace(' ', '_').lower()}" for s in systemes_actifs]
+        metrique = "prime"
         title = "Prime par service par jour par ligne"
-        y_title = "Montant (MAD)"
     else:
         # Type par défaut
-        cols = [f"cout_total_{s['nom'].replace(' ', '_').lower()}" for s in systemes_actifs]
+        metrique = "cout_total"
         title = "Comparaison des systèmes par ligne"
-        y_title = "Montant (MAD)"
+    y_title = "Montant (MAD)"
     
-    # Vérifier que les colonnes existent
-    valid_cols = [col for col in cols if col in df_lignes.columns]
+    # Sélection dans le format long partagé (LIGNE, Système, métrique, valeur)
+    noms_systemes = [s['nom'] for s in systemes_actifs]
+    long = analyses['format_long']
+    df_melted = long[(long['metrique'] == metrique) & long['Système'].isin(noms_systemes)]
     
-    if not valid_cols:
+    if df_melted.empty:
         st.warning(f"Aucune colonne de données trouvée pour {metric_type}")
         return
     
-    # Construire le tableau de données pour le graphique
-    for i, ligne in df_lignes.iterrows():
-        ligne_data = {
-            'LIGNE': str(ligne['LIGNE']),
-            'VOY': f"{int(ligne['VOY']):,}".replace(',', ' ')
-        }
-        
-        for j, col in enumerate(valid_cols):
-            if col in df_lignes.columns:
-                systeme_nom = systemes_actifs[j]['nom']
-                ligne_data[systeme_nom] = ligne[col]
-        
-        data.append(ligne_data)
-    
-    # Créer le DataFrame pour Altair
-    df_graph = pd.DataFrame(data)
-    
-    # Transformer les données pour Altair
-    df_melted = pd.melt(
-        df_graph, 
-        id_vars=['LIGNE', 'VOY'], 
-        value_vars=[s['nom'] for s in systemes_actifs if f"cout_total_{s['nom'].replace(' ', '_').lower()}" in valid_cols or 
-                    f"prime_{s['nom'].replace(' ', '_').lower()}" in valid_cols],
-        var_name='Système',
-        value_name='Valeur'
-    )
+    df_melted = pd.DataFrame({
+        'LIGNE': df_melted['LIGNE'].astype(str),
+        'VOY': df_melted['VOY'].astype(int).map('{:,}'.format).str.replace(',', ' '),
+        'Système': df_melted['Système'],
+        'Valeur': df_melted['valeur']
+    })
+    
+    # Tableau détaillé : une colonne par système
+    df_graph = df_melted.pivot_table(index=['LIGNE', 'VOY'], columns='Système', values='Valeur',
+                                     sort=False).reset_index()
+    df_graph = df_graph[['LIGNE', 'VOY'] + [n for n in noms_systemes if n in df_graph.columns]]
+    df_graph.columns.name = None
+    
+    # Les graphiques ne montrent que les lignes principales, le tableau les montre toutes
+    df_melted = limiter_lignes(df_melted, 'Valeur',
+                               agregation='sum' if metrique in ('cout_total', 'cout_total_mensuel') else 'mean')
     
     # Créer le graphique avec barres groupées
     chart = alt.Chart(df_melted).mark_bar().encode(
@@ -0,0 +1,160 @@
+import numpy as np
+import pandas as pd
+
+from cache import CacheLRU, empreinte_dataframe, empreinte_systeme
+from moteur import compiler_systemes
+from resultats import nom_base_systeme
+
+# Primes par conducteur déjà calculées, indexées par empreinte du registre et des systèmes
+_CACHE_CONDUCTEURS = CacheLRU(max_entrees=8, max_octets=64 * 1024**2)
+
+# Prime d'une journée : barème appliqué à la moyenne des services du jour,
+# ou moyenne des primes de chaque service
+MODES_PRIME = ('moyenne', 'service')
+
+
+def _categorie(colonne):
+    """Colonne en catégories (sans copie si elle l'est déjà), catégories inutilisées retirées"""
+    if not isinstance(colonne.dtype, pd.CategoricalDtype):
+        colonne = colonne.astype('category')
+    return colonne.cat.remove_unused_categories()
+
+
+def calculer_primes_conducteurs(registre, systemes, mode='moyenne'):
+    """
+    Calcule la prime de chaque conducteur à partir du registre de ses services
+
+    Comme dans le modèle par ligne, un conducteur touche chaque jour travaillé
+    la prime par service de sa journée. Les enregistrements sont regroupés
+    par (conducteur, jour) sur des clés catégorielles ; les barèmes des K
+    systèmes sont évalués en une passe sur toutes les journées, puis sommés
+    par conducteur. Les services dont le nombre de voyageurs manque sont
+    écartés dans les deux modes.
+
+    Args:
+        registre (pandas.DataFrame): Un enregistrement par service avec
+            CONDUCTEUR, DATE, LIGNE et VOYAGEURS
+        systemes (list): Systèmes de prime à évaluer
+        mode (str): 'moyenne' (barème appliqué aux voyageurs moyens par
+            service de la journée) ou 'service' (moyenne des primes de
+            chaque service de la journée)
+
+    Returns:
+        pandas.DataFrame: Une ligne par conducteur avec CONDUCTEUR, LIGNE
+            (ligne la plus conduite), JOURS, SERVICES, VOYAGEURS et, pour
+            chaque système, BONUS/TOTAL_<nom> (sur la période du registre),
+            BONUS/CONDUCTEUR/J_<nom> (par jour travaillé) et
+            BONUS/CONDUCTEUR/AN_<nom> (ramené à 365 jours)
+    """
+    if mode not in MODES_PRIME:
+        raise ValueError(f"Mode inconnu: {mode}")
+
+    lot = compiler_systemes(systemes)
+    noms = [nom_base_systeme(s) for s in systemes]
+
+    # Les regroupements portent sur les colonnes d'un même cadre, quel que
+    # soit l'index du registre (filtré, réindexé...)
+    services = pd.DataFrame({
+        'CONDUCTEUR': _categorie(registre['CONDUCTEUR']).array,
+        'DATE': _categorie(registre['DATE']).array,
+        'LIGNE': _categorie(registre['LIGNE']).array,
+        'VOYAGEURS': registre['VOYAGEURS'].to_numpy(dtype=float)
+    })
+    dates = services['DATE']
+
+    # Un service sans nombre de voyageurs n'entre dans aucune moyenne, quel
+    # que soit le mode (la période reste celle de tout le registre)
+    services = services[np.isfinite(services['VOYAGEURS'].to_numpy())].reset_index(drop=True)
+
+    # Journées de travail : une ligne par (conducteur, jour)
+    journees = services.groupby(['CONDUCTEUR', 'DATE'], observed=True,
+                                sort=False)['VOYAGEURS'].agg(['sum', 'count', 'mean'])
+    if mode == 'moyenne':
+        primes = lot.evaluer(journees['mean'].to_numpy())
+    else:
+        primes_services = pd.DataFrame(
+            lot.evaluer(services['VOYAGEURS'].to_numpy()).T, columns=noms)
+        primes_services[['CONDUCTEUR', 'DATE']] = services[['CONDUCTEUR', 'DATE']]
+        primes = primes_services.groupby(
+            ['CONDUCTEUR', 'DATE'], observed=True,
+            sort=False)[noms].mean().loc[journees.index].to_numpy().T
+
+    # Sommes par conducteur
+    totaux = pd.DataFrame(primes.T, columns=noms, index=journees.index)
+    totaux['SERVICES'] = journees['count'].to_numpy()
+    totaux['VOYAGEURS'] = journees['sum'].to_numpy()
+    totaux['JOURS'] = 1
+    par_conducteur = totaux.groupby(level='CONDUCTEUR', observed=True,
+                                    sort=False).sum()
+
+    # Ligne principale : celle du plus grand nombre de services
+    services_ligne = services.groupby(['CONDUCTEUR', 'LIGNE'], observed=True,
+                                      sort=False).size()
+    principale = (services_ligne.sort_values(ascending=False, kind='stable')
+                  .reset_index().drop_duplicates('CONDUCTEUR')
+                  .set_index('CONDUCTEUR')['LIGNE'])
+
+    jours_calendrier = pd.to_datetime(dates.cat.categories)
+    nb_jours_periode = (jours_calendrier.max() - jours_calendrier.min()).days + 1
+
+    resultat = pd.DataFrame({
+        'CONDUCTEUR': par_conducteur.index.astype(str),
+        'LIGNE': principale.reindex(par_conducteur.index).astype(str).to_numpy(),
+        'JOURS': par_conducteur['JOURS'].to_numpy(),
+        'SERVICES': par_conducteur['SERVICES'].to_numpy(),
+        'VOYAGEURS': par_conducteur['VOYAGEURS'].to_numpy()
+    })
+    for nom in noms:
+        total = par_conducteur[nom].to_numpy()
+        resultat[f"BONUS/TOTAL_{nom}"] = total
+        resultat[f"BONUS/CONDUCTEUR/J_{nom}"] = total / resultat['JOURS'].to_numpy()
+        resultat[f"BONUS/CONDUCTEUR/AN_{nom}"] = total * 365 / nb_jours_periode
+    return resultat
+
+
+def synthese_conducteurs(primes, systemes):
+    """
+    Résume la distribution des primes annuelles par conducteur
+
+    Args:
+        primes (pandas.DataFrame): Résultat de calculer_primes_conducteurs
+        systemes (list): Systèmes de prime évalués
+
+    Returns:
+        pandas.DataFrame: Moyenne, P10, médiane, P90 et maximum de la prime
+            annuelle, une ligne par système
+    """
+    colonnes = [f"BONUS/CONDUCTEUR/AN_{nom_base_systeme(s)}" for s in systemes]
+    annuel = primes[colonnes].to_numpy()
+    p10, p50, p90 = np.percentile(annuel, [10, 50, 90], axis=0)
+    return pd.DataFrame({
+        'moyenne': annuel.mean(axis=0),
+        'P10': p10,
+        'médiane': p50,
+        'P90': p90,
+        'maximum': annuel.max(axis=0)
+    }, index=[s['nom'] for s in systemes])
+
+
+def calculer_primes_conducteurs_cache(registre, systemes, mode='moyenne'):
+    """
+    Version mémoïsée de calculer_primes_conducteurs
+
+    Le résultat est partagé entre les appels : il ne doit pas être modifié
+    en place.
+
+    Args:
+        registre (pandas.DataFrame): Registre des services par conducteur
+        systemes (list): Systèmes de prime à évaluer
+        mode (str): 'moyenne' ou 'service'
+
+    Returns:
+        pandas.DataFrame: Primes par conducteur
+    """
+    cle = (empreinte_dataframe(registre),
+           tuple(empreinte_systeme(s) for s in systemes), mode)
+    primes = _CACHE_CONDUCTEURS.obtenir(cle)
+    if primes is None:
+        primes = calculer_primes_conducteurs(registre, systemes, mode)
+        _CACHE_CONDUCTEURS.ajouter(cle, primes)
+    return primes
@@ -19,6 +19,28 @@ def obtenir_structure_csv():
     """
     return structure
 
+def obtenir_structure_services():
+    """
+    Décrit le fichier CSV détaillé (un enregistrement par service et par jour)
+    
+    Returns:
+        str: Description de la structure CSV détaillée attendue
+    """
+    structure = """
+    Le fichier CSV détaillé doit contenir une ligne par service et par jour:
+    
+    - LIGNE : Identification de la ligne de bus
+    - DATE : Jour du service (AAAA-MM-JJ)
+    - VOYAGEURS : Nombre de voyageurs transportés pendant le service
+    - BUS : Identifiant du bus affecté au service
+    - CONDUCTEUR : Identifiant du conducteur du service
+    
+    Les enregistrements sont agrégés par ligne : VOY est ramené à l'année,
+    BUS et NBRE CONDUCTEURS ETP sont des moyennes par jour de service.
+    Les services de chaque CONDUCTEUR donnent aussi sa prime individuelle.
+    """
+    return structure
+
 def obtenir_exemple_csv():
     """
     Fournit un exemple de fichier CSV à télécharger
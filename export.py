@@ -0,0 +1,75 @@
+import io
+
+import pandas as pd
+from openpyxl import Workbook
+
+from cache import CacheLRU
+
+# Classeurs déjà générés, indexés par empreinte du résultat
+_CACHE_EXPORTS = CacheLRU(max_entrees=4, max_octets=128 * 1024**2)
+
+# Nombre de lignes converties à la fois lors de l'écriture
+TAILLE_BLOC_EXPORT = 10000
+
+
+def _ecrire_feuille(classeur, titre, source, colonnes):
+    """
+    Ecrit des colonnes dans une nouvelle feuille, bloc de lignes par bloc
+
+    Args:
+        classeur (openpyxl.Workbook): Classeur en écriture seule
+        titre (str): Nom de la feuille
+        source: DataFrame ou ResultatPrimes indexable par nom de colonne
+        colonnes (list): Colonnes à écrire
+    """
+    feuille = classeur.create_sheet(titre)
+    feuille.append(list(colonnes))
+
+    valeurs = [source[c].to_numpy() for c in colonnes]
+    nb_lignes = len(source)
+    for debut in range(0, nb_lignes, TAILLE_BLOC_EXPORT):
+        fin = min(debut + TAILLE_BLOC_EXPORT, nb_lignes)
+        for ligne in zip(*(v[debut:fin].tolist() for v in valeurs)):
+            feuille.append(ligne)
+
+
+def exporter_excel(resultat, colonnes, kpis, systemes):
+    """
+    Génère le classeur Excel des résultats, avec mise en cache
+
+    Le classeur est écrit en mode écriture seule d'openpyxl : les lignes
+    sont envoyées au fichier au fur et à mesure, sans construire de
+    DataFrame intermédiaire ni garder les cellules en mémoire.
+
+    Args:
+        resultat (ResultatPrimes): Résultat du calcul des primes
+        colonnes (list): Colonnes de la feuille Resultats
+        kpis (pandas.DataFrame): Tableau des KPIs (colonnes Métrique, Valeur)
+        systemes (list): Systèmes de prime, une feuille de paliers chacun
+
+    Returns:
+        bytes: Contenu du fichier xlsx
+    """
+    cle = (resultat.empreinte(), tuple(colonnes),
+           tuple(map(str, kpis['Valeur'])))
+    contenu = _CACHE_EXPORTS.obtenir(cle)
+    if contenu is not None:
+        return contenu
+
+    classeur = Workbook(write_only=True)
+    _ecrire_feuille(classeur, 'Resultats', resultat, colonnes)
+    _ecrire_feuille(classeur, 'KPIs', kpis, list(kpis.columns))
+
+    # Détails des paliers de chaque système
+    for systeme in systemes:
+        paliers = pd.DataFrame(systeme['paliers'], columns=['min', 'max', 'taux'])
+        paliers.columns = ["Min", "Max", "Taux (MAD)"]
+        _ecrire_feuille(classeur, f'Système {systeme["nom"]}', paliers,
+                        list(paliers.columns))
+
+    buffer = io.BytesIO()
+    classeur.save(buffer)
+    contenu = buffer.getvalue()
+
+    _CACHE_EXPORTS.ajouter(cle, contenu)
+    return contenu
@@ -0,0 +1,273 @@
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+from utils import SYSTEME_NOUVEAU
+
+# Nombre maximal de lignes de données d'une feuille Excel (en-tête non compris)
+MAX_LIGNES_EXCEL = 1_048_575
+
+# Nombre d'enregistrements de service générés par bloc
+TAILLE_BLOC_SERVICES = 1_000_000
+
+# Formats d'écriture reconnus, par extension
+FORMATS = ('.csv', '.xlsx', '.parquet')
+
+
+def seuils_systeme(systeme):
+    """
+    Donne les nombres de voyageurs où le taux d'un système change
+
+    Args:
+        systeme (dict): Système de prime
+
+    Returns:
+        numpy.ndarray: Minimums des paliers au-delà du premier, triés
+    """
+    mins = np.unique([float(p["min"]) for p in systeme["paliers"]])
+    return mins[mins > mins.min()] if len(mins) else mins
+
+
+def generer_reseau(nb_lignes, graine=0, systeme=None, part_seuils=0.7,
+                   dispersion=30.0):
+    """
+    Génère un réseau de lignes au format du fichier Excel attendu
+
+    Une part des lignes a une fréquentation par service tirée autour d'un
+    seuil du système (loi normale centrée sur le seuil), les autres suivent
+    une loi gamma large : les lignes tombent de part et d'autre de chaque
+    changement de taux. Les bus, les services par bus et les conducteurs
+    sont tirés par ligne, et VOY en est déduit, pour que le fichier
+    détaillé de generer_services s'agrège sur les mêmes valeurs.
+
+    Args:
+        nb_lignes (int): Nombre de lignes de bus
+        graine (int): Graine du générateur, pour un réseau reproductible
+        systeme (dict): Système dont les seuils sont encadrés
+            (SYSTEME_NOUVEAU par défaut)
+        part_seuils (float): Part des lignes tirées autour d'un seuil
+        dispersion (float): Ecart-type des voyageurs autour d'un seuil
+
+    Returns:
+        pandas.DataFrame: Colonnes LIGNE, VOY, BUS, VOY/SERVICE/J et
+            NBRE CONDUCTEURS ETP
+    """
+    if systeme is None:
+        systeme = SYSTEME_NOUVEAU
+    generateur = np.random.default_rng(graine)
+    seuils = seuils_systeme(systeme)
+
+    voyageurs = generateur.gamma(3.0, 100.0, nb_lignes)
+    if len(seuils):
+        autour = generateur.random(nb_lignes) < part_seuils
+        voyageurs[autour] = (
+            generateur.choice(seuils, autour.sum()) +
+            generateur.normal(0.0, dispersion, autour.sum()))
+    voyageurs = np.clip(voyageurs, 1.0, None).round(1)
+
+    bus = generateur.integers(2, 41, nb_lignes)
+    services_par_jour = bus * generateur.integers(4, 9, nb_lignes)
+    conducteurs = np.ceil(bus * generateur.uniform(1.4, 2.2, nb_lignes)).astype(int)
+
+    return pd.DataFrame({
+        'LIGNE': np.char.add('L', np.arange(1, nb_lignes + 1).astype(str)),
+        'VOY': np.round(voyageurs * services_par_jour * 365).astype(np.int64),
+        'BUS': bus,
+        'VOY/SERVICE/J': voyageurs,
+        'NBRE CONDUCTEURS ETP': conducteurs
+    })
+
+
+def _premiers_identifiants(effectifs):
+    """Premier identifiant global de chaque ligne pour des effectifs par ligne"""
+    return np.concatenate([[1], np.cumsum(effectifs)[:-1] + 1])
+
+
+def generer_services(reseau, nb_jours=365, debut='2024-01-01', graine=0,
+                     taille_bloc=TAILLE_BLOC_SERVICES):
+    """
+    Génère le détail par service d'un réseau, bloc par bloc
+
+    Chaque ligne assure chaque jour VOY / 365 / VOY/SERVICE/J services,
+    répartis entre ses bus et ses conducteurs ; les voyageurs de chaque
+    service suivent une loi de Poisson de moyenne VOY/SERVICE/J. Agrégé par
+    ingestion.agreger_services_csv, le détail redonne le réseau (aux
+    tirages près). Les blocs regroupent des lignes entières.
+
+    Args:
+        reseau (pandas.DataFrame): Réseau de generer_reseau
+        nb_jours (int): Nombre de jours générés
+        debut (str): Premier jour (AAAA-MM-JJ)
+        graine (int): Graine du générateur
+        taille_bloc (int): Nombre approximatif d'enregistrements par bloc
+
+    Yields:
+        pandas.DataFrame: Colonnes LIGNE, DATE, VOYAGEURS, BUS et CONDUCTEUR
+    """
+    generateur = np.random.default_rng(graine)
+    moyennes = reseau['VOY/SERVICE/J'].to_numpy(dtype=float)
+    bus = reseau['BUS'].to_numpy().astype(int)
+    conducteurs = reseau['NBRE CONDUCTEURS ETP'].to_numpy().astype(int)
+    services = np.maximum(
+        1, np.round(reseau['VOY'].to_numpy() / 365 / np.maximum(moyennes, 1e-9))
+    ).astype(int)
+
+    # Identifiants globaux : chaque ligne a ses propres bus et conducteurs
+    premier_bus = _premiers_identifiants(bus)
+    premier_conducteur = _premiers_identifiants(conducteurs)
+    lignes = pd.CategoricalDtype(reseau['LIGNE'].astype(str))
+    jours = np.datetime64(debut, 'D') + np.arange(nb_jours)
+
+    enregistrements = services * nb_jours
+    fins = np.cumsum(enregistrements)
+    debut_bloc = 0
+    while debut_bloc < len(reseau):
+        # Lignes entières jusqu'à atteindre la taille du bloc
+        fin_bloc = max(debut_bloc + 1, int(np.searchsorted(
+            fins, fins[debut_bloc] - enregistrements[debut_bloc] + taille_bloc,
+            side='right')))
+        indices = np.arange(debut_bloc, fin_bloc)
+        ligne = np.repeat(indices, enregistrements[indices])
+        rang = np.arange(len(ligne)) - np.repeat(
+            np.cumsum(enregistrements[indices]) - enregistrements[indices],
+            enregistrements[indices])
+        jour, service = np.divmod(rang, services[ligne])
+
+        yield pd.DataFrame({
+            'LIGNE': pd.Categorical.from_codes(ligne, dtype=lignes),
+            'DATE': jours[jour],
+            'VOYAGEURS': generateur.poisson(moyennes[ligne]),
+            'BUS': premier_bus[ligne] + service % bus[ligne],
+            'CONDUCTEUR': premier_conducteur[ligne] +
+            (service + jour) % conducteurs[ligne]
+        })
+        debut_bloc = fin_bloc
+
+
+def generer_conducteurs(reseau):
+    """
+    Liste les conducteurs du réseau avec leur ligne d'affectation
+
+    Les identifiants sont ceux de la colonne CONDUCTEUR de generer_services.
+
+    Args:
+        reseau (pandas.DataFrame): Réseau de generer_reseau
+
+    Returns:
+        pandas.DataFrame: Colonnes CONDUCTEUR et LIGNE, un conducteur par ligne
+    """
+    effectifs = reseau['NBRE CONDUCTEURS ETP'].to_numpy().astype(int)
+    return pd.DataFrame({
+        'CONDUCTEUR': np.arange(1, effectifs.sum() + 1),
+        'LIGNE': np.repeat(reseau['LIGNE'].to_numpy(), effectifs)
+    })
+
+
+def ecrire(donnees, chemin):
+    """
+    Ecrit un DataFrame ou une suite de blocs en CSV, xlsx ou Parquet
+
+    Le format suit l'extension du fichier. Les blocs sont écrits au fur et
+    à mesure, sans être rassemblés en mémoire. Le Parquet nécessite pyarrow.
+
+    Args:
+        donnees: pandas.DataFrame ou itérable de DataFrames de mêmes colonnes
+        chemin (str): Fichier de sortie (.csv, .xlsx ou .parquet)
+
+    Returns:
+        int: Nombre de lignes écrites
+
+    Raises:
+        ValueError: Si l'extension n'est pas reconnue ou si les données
+            dépassent la taille d'une feuille Excel
+    """
+    chemin = Path(chemin)
+    extension = chemin.suffix.lower()
+    if extension not in FORMATS:
+        raise ValueError(f"Format non reconnu: {chemin.suffix} "
+                         f"(formats: {', '.join(FORMATS)})")
+    blocs = [donnees] if isinstance(donnees, pd.DataFrame) else donnees
+    chemin.parent.mkdir(parents=True, exist_ok=True)
+
+    nb_lignes = 0
+    if extension == '.csv':
+        for bloc in blocs:
+            bloc.to_csv(chemin, index=False, mode='w' if nb_lignes == 0 else 'a',
+                        header=nb_lignes == 0, date_format='%Y-%m-%d')
+            nb_lignes += len(bloc)
+
+    elif extension == '.parquet':
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        redacteur = None
+        try:
+            for bloc in blocs:
+                table = pa.Table.from_pandas(bloc, preserve_index=False)
+                if redacteur is None:
+                    redacteur = pq.ParquetWriter(chemin, table.schema)
+                redacteur.write_table(table)
+                nb_lignes += len(bloc)
+        finally:
+            if redacteur is not None:
+                redacteur.close()
+
+    else:
+        classeur = Workbook(write_only=True)
+        feuille = classeur.create_sheet('Donnees')
+        for bloc in blocs:
+            if nb_lignes == 0:
+                feuille.append(list(bloc.columns))
+            nb_lignes += len(bloc)
+            if nb_lignes > MAX_LIGNES_EXCEL:
+                raise ValueError(f"Plus de {MAX_LIGNES_EXCEL:,} lignes : "
+                                 "utilisez le format CSV ou Parquet")
+            valeurs = [
+                bloc[c].dt.date.to_numpy() if pd.api.types.is_datetime64_any_dtype(bloc[c])
+                else bloc[c].to_numpy() for c in bloc.columns
+            ]
+            for ligne in zip(*(v.tolist() for v in valeurs)):
+                feuille.append(ligne)
+        classeur.save(chemin)
+
+    return nb_lignes
+
+
+def main(arguments=None):
+    parseur = argparse.ArgumentParser(
+        description="Génère un jeu de données synthétique reproductible")
+    parseur.add_argument('lignes', type=int, help="Nombre de lignes de bus")
+    parseur.add_argument('-o', '--sortie', default='reseau.xlsx',
+                         help="Fichier du réseau par ligne (défaut: reseau.xlsx)")
+    parseur.add_argument('--services', default=None,
+                         help="Fichier du détail par service (optionnel)")
+    parseur.add_argument('--conducteurs', default=None,
+                         help="Fichier de la liste des conducteurs (optionnel)")
+    parseur.add_argument('--jours', type=int, default=365,
+                         help="Nombre de jours du détail par service (défaut: 365)")
+    parseur.add_argument('--graine', type=int, default=0,
+                         help="Graine du générateur (défaut: 0)")
+    args = parseur.parse_args(arguments)
+
+    try:
+        reseau = generer_reseau(args.lignes, args.graine)
+        print(f"{args.sortie}: {ecrire(reseau, args.sortie):,} lignes")
+        if args.services:
+            nb = ecrire(generer_services(reseau, args.jours, graine=args.graine),
+                        args.services)
+            print(f"{args.services}: {nb:,} services")
+        if args.conducteurs:
+            nb = ecrire(generer_conducteurs(reseau), args.conducteurs)
+            print(f"{args.conducteurs}: {nb:,} conducteurs")
+    except (OSError, ValueError, ImportError) as e:
+        print(f"Erreur: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
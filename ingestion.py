@@ -0,0 +1,535 @@
+import hashlib
+import io
+
+import numpy as np
+import pandas as pd
+
+from cache import CacheLRU
+from utils import COLONNES_DEBORD, valider_donnees, normaliser_types, reduire_entiers
+
+# Fichiers déjà lus, indexés par l'empreinte de leur contenu
+_CACHE_FICHIERS = CacheLRU(max_entrees=16, max_octets=512 * 1024**2)
+
+
+def empreinte_octets(contenu):
+    """
+    Calcule l'empreinte SHA-256 du contenu d'un fichier
+    
+    Args:
+        contenu (bytes): Contenu brut du fichier
+        
+    Returns:
+        str: Empreinte hexadécimale
+    """
+    return hashlib.sha256(contenu).hexdigest()
+
+
+def charger_excel(contenu, empreinte=None):
+    """
+    Lit, valide et normalise un classeur Excel, avec mise en cache par contenu
+    
+    Les relances Streamlit qui présentent le même fichier réutilisent le
+    DataFrame déjà lu sans relancer openpyxl ni la validation. Le DataFrame
+    renvoyé est partagé : il ne doit pas être modifié en place.
+    
+    Args:
+        contenu (bytes): Contenu brut du fichier Excel
+        empreinte (str): Empreinte du contenu, si elle est déjà calculée
+        
+    Returns:
+        tuple: (DataFrame ou None, bool, str) - données, validité, message d'erreur
+    """
+    cle = empreinte if empreinte is not None else empreinte_octets(contenu)
+    resultat = _CACHE_FICHIERS.obtenir(cle)
+    if resultat is not None:
+        return resultat
+
+    data = pd.read_excel(io.BytesIO(contenu))
+    valide, message = valider_donnees(data)
+    resultat = (normaliser_types(data) if valide else None, valide, message)
+
+    _CACHE_FICHIERS.ajouter(cle, resultat)
+    return resultat
+
+
+def statistiques_cache_fichiers():
+    """
+    Donne les compteurs du cache des fichiers importés
+    
+    Returns:
+        dict: Succès, échecs, nombre d'entrées et octets occupés
+    """
+    return _CACHE_FICHIERS.statistiques()
+
+
+# Colonnes attendues dans le fichier détaillé (un enregistrement par service et par jour)
+COLONNES_SERVICES = ['LIGNE', 'DATE', 'VOYAGEURS', 'BUS', 'CONDUCTEUR']
+
+# Colonnes du registre des conducteurs (un enregistrement par service)
+COLONNES_REGISTRE = ['CONDUCTEUR', 'DATE', 'LIGNE', 'VOYAGEURS']
+
+# Produits d'un fichier détaillé, construits ensemble en une lecture par blocs
+PRODUITS_SERVICES = ('services', 'histogrammes', 'series', 'registre')
+
+# Colonnes d'identifiants lues en texte (les voyageurs restent numériques)
+_IDENTIFIANTS = ['LIGNE', 'DATE', 'BUS', 'CONDUCTEUR', 'SERVICE']
+
+
+class _CouplesDistincts:
+    """
+    Ensemble dédoublonné de couples (LIGNE, DATE, identifiant) construit bloc par bloc
+
+    Les blocs sont accumulés puis compactés dès que leur volume dépasse celui
+    de l'ensemble déjà dédoublonné : la mémoire reste proportionnelle au
+    nombre de couples distincts, pas à la taille du fichier.
+    """
+
+    def __init__(self, colonne):
+        self.colonne = colonne
+        self.base = None
+        self.en_attente = []
+        self.taille_attente = 0
+
+    def ajouter(self, bloc):
+        couples = bloc[['LIGNE', 'DATE', self.colonne]].drop_duplicates()
+        self.en_attente.append(couples)
+        self.taille_attente += len(couples)
+        if self.base is None or self.taille_attente > len(self.base):
+            self.compacter()
+
+    def compacter(self):
+        if self.en_attente:
+            blocs = self.en_attente if self.base is None else [self.base] + self.en_attente
+            self.base = pd.concat(blocs, ignore_index=True).drop_duplicates()
+            self.en_attente = []
+            self.taille_attente = 0
+        return self.base
+
+
+class _AgregatLignes:
+    """Totaux par ligne et couples distincts (ligne, jour, bus ou conducteur)"""
+
+    colonnes = COLONNES_SERVICES
+
+    def __init__(self):
+        self.totaux = None
+        self.date_min = self.date_max = None
+        self.bus = _CouplesDistincts('BUS')
+        self.conducteurs = _CouplesDistincts('CONDUCTEUR')
+
+    def ajouter(self, bloc):
+        try:
+            voyageurs = pd.to_numeric(bloc['VOYAGEURS'], errors='raise')
+        except (ValueError, TypeError) as erreur:
+            raise ValueError("La colonne 'VOYAGEURS' doit contenir des valeurs "
+                             f"numériques ({erreur})") from None
+
+        # Voyageurs et nombre de services par ligne
+        totaux_bloc = voyageurs.groupby(bloc['LIGNE']).agg(['sum', 'count'])
+        self.totaux = (totaux_bloc if self.totaux is None else
+                       self.totaux.add(totaux_bloc, fill_value=0))
+
+        # Période couverte, pour ramener les voyageurs à l'année
+        dates = pd.to_datetime(bloc['DATE'])
+        self.date_min = (dates.min() if self.date_min is None else
+                         min(self.date_min, dates.min()))
+        self.date_max = (dates.max() if self.date_max is None else
+                         max(self.date_max, dates.max()))
+
+        self.bus.ajouter(bloc)
+        self.conducteurs.ajouter(bloc)
+
+    def resultat(self):
+        if self.totaux is None:
+            return pd.DataFrame(columns=[
+                'LIGNE', 'VOY', 'BUS', 'VOY/SERVICE/J', 'NBRE CONDUCTEURS ETP'
+            ])
+
+        totaux = self.totaux
+        couples_bus = self.bus.compacter()
+        couples_conducteurs = self.conducteurs.compacter()
+        jours = couples_bus.groupby('LIGNE')['DATE'].nunique()
+        nb_jours_periode = (self.date_max - self.date_min).days + 1
+
+        # Un identifiant manquant ne compte pas comme un bus ou un conducteur
+        resultat = pd.DataFrame({
+            'VOY': (totaux['sum'] * 365 / nb_jours_periode).round().astype(int),
+            'BUS': couples_bus.groupby('LIGNE')['BUS'].count() / jours,
+            'VOY/SERVICE/J': totaux['sum'] / totaux['count'],
+            'NBRE CONDUCTEURS ETP':
+            couples_conducteurs.groupby('LIGNE')['CONDUCTEUR'].count() / jours
+        })
+        return resultat.rename_axis('LIGNE').reset_index()
+
+
+class _Histogrammes:
+    """Nombre de services par classe de voyageurs et par ligne, avec débord"""
+
+    colonnes = ['LIGNE', 'VOYAGEURS']
+
+    def __init__(self, largeur_classe, max_voyageurs):
+        self.largeur_classe = largeur_classe
+        self.nb_classes = max_voyageurs // largeur_classe + 1
+        self.comptes = None
+
+    def _vide(self):
+        return pd.DataFrame(columns=[*range(self.nb_classes), *COLONNES_DEBORD])
+
+    def ajouter(self, bloc):
+        bloc = bloc.dropna(subset=['VOYAGEURS'])
+        voyageurs = bloc['VOYAGEURS'].to_numpy(dtype=float)
+        classes = (voyageurs // self.largeur_classe).clip(0, None)
+        # Services au-delà de la dernière classe : comptés et cumulés à part
+        debord = classes >= self.nb_classes
+        classes = np.where(debord, self.nb_classes, classes).astype(int)
+        comptes_bloc = (bloc.groupby(['LIGNE', classes]).size().unstack(
+            fill_value=0).reindex(columns=range(self.nb_classes + 1), fill_value=0))
+        comptes_bloc.columns = [*range(self.nb_classes), COLONNES_DEBORD[0]]
+        comptes_bloc[COLONNES_DEBORD[1]] = pd.Series(
+            np.where(debord, voyageurs, 0.0), index=bloc.index).groupby(
+                bloc['LIGNE']).sum().reindex(comptes_bloc.index)
+        self.comptes = (comptes_bloc if self.comptes is None else
+                        self.comptes.add(comptes_bloc, fill_value=0))
+
+    def resultat(self):
+        if self.comptes is None:
+            return self._vide().rename_axis('LIGNE')
+        comptes = self.comptes.astype(int)
+        comptes[COLONNES_DEBORD[1]] = self.comptes[COLONNES_DEBORD[1]]
+        return comptes.rename_axis(columns=None)
+
+
+class _Series:
+    """Voyageurs et services de chaque ligne, jour par jour"""
+
+    colonnes = ['LIGNE', 'DATE', 'VOYAGEURS']
+
+    def __init__(self):
+        self.totaux = None
+
+    def ajouter(self, bloc):
+        bloc = bloc.dropna(subset=['VOYAGEURS'])
+        totaux_bloc = bloc.groupby(['LIGNE', 'DATE'])['VOYAGEURS'].agg(
+            ['sum', 'count'])
+        self.totaux = (totaux_bloc if self.totaux is None else
+                       self.totaux.add(totaux_bloc, fill_value=0))
+
+    def resultat(self):
+        if self.totaux is None:
+            return pd.DataFrame(columns=['LIGNE', 'DATE', 'VOY', 'SERVICES',
+                                         'VOY/SERVICE/J'])
+
+        serie = self.totaux.reset_index().rename(columns={'sum': 'VOY',
+                                                          'count': 'SERVICES'})
+        serie['DATE'] = pd.to_datetime(serie['DATE'])
+        # Les sommes de plusieurs blocs passent en flottants : même type
+        # quelle que soit la taille des blocs
+        serie['VOY'] = reduire_entiers(serie['VOY'])
+        serie['SERVICES'] = serie['SERVICES'].astype(int)
+        serie['VOY/SERVICE/J'] = serie['VOY'] / serie['SERVICES']
+        return serie
+
+
+class _Registre:
+    """
+    Enregistrements par conducteur, compactés bloc par bloc
+
+    Chaque bloc est converti dès sa lecture : identifiants en catégories
+    (codes entiers), voyageurs au plus petit type entier. Seuls ces blocs
+    compacts sont gardés jusqu'à leur assemblage final.
+    """
+
+    colonnes = COLONNES_REGISTRE
+
+    def __init__(self):
+        self.blocs = []
+        self.message = ""
+
+    def ajouter(self, bloc):
+        if self.message:
+            return
+        if not pd.api.types.is_numeric_dtype(bloc['VOYAGEURS']):
+            self.message = "La colonne 'VOYAGEURS' doit contenir des valeurs numériques"
+            self.blocs = []
+            return
+        compact = {c: bloc[c].astype('category')
+                   for c in COLONNES_REGISTRE + ['SERVICE']
+                   if c in bloc.columns and c != 'VOYAGEURS'}
+        compact['VOYAGEURS'] = reduire_entiers(bloc['VOYAGEURS'])
+        self.blocs.append(pd.DataFrame(compact)[[
+            c for c in bloc.columns if c in compact]])
+
+    def resultat(self):
+        if self.message:
+            return (None, False, self.message)
+        if not self.blocs:
+            return (pd.DataFrame(columns=COLONNES_REGISTRE), True, "")
+
+        colonnes = {}
+        for colonne in self.blocs[0].columns:
+            valeurs = [bloc.pop(colonne) for bloc in self.blocs]
+            if colonne == 'VOYAGEURS':
+                colonnes[colonne] = reduire_entiers(
+                    pd.concat(valeurs, ignore_index=True))
+            else:
+                colonnes[colonne] = pd.Series(
+                    pd.api.types.union_categoricals(valeurs))
+        self.blocs = []
+        return (pd.DataFrame(colonnes), True, "")
+
+
+def lire_services_csv(source, produits=PRODUITS_SERVICES, taille_bloc=500_000,
+                      largeur_classe=1, max_voyageurs=1000):
+    """
+    Construit en une seule lecture par blocs les produits d'un fichier détaillé
+    
+    Le fichier n'est jamais chargé en entier : chaque bloc est transmis à
+    chacun des produits demandés puis libéré.
+    
+    Args:
+        source (str ou file-like): Chemin ou flux du fichier CSV
+        produits (iterable): Parmi 'services' (agrégat par ligne),
+            'histogrammes', 'series' et 'registre'
+        taille_bloc (int): Nombre d'enregistrements lus par bloc
+        largeur_classe (int): Nombre de valeurs entières de voyageurs par classe
+        max_voyageurs (int): Valeur couverte par la dernière classe
+        
+    Returns:
+        dict: Résultat de chaque produit demandé (voir agreger_services_csv,
+            histogrammes_services_csv, series_services_csv ; 'registre' est un
+            tuple (DataFrame ou None, bool, str))
+            
+    Raises:
+        ValueError: Si une colonne nécessaire manque au fichier, ou si
+            VOYAGEURS n'est pas numérique pour l'agrégat par ligne
+    """
+    constructeurs = {
+        'services': _AgregatLignes,
+        'histogrammes': lambda: _Histogrammes(largeur_classe, max_voyageurs),
+        'series': _Series,
+        'registre': _Registre
+    }
+    accumulateurs = {p: constructeurs[p]() for p in produits}
+    requises = set()
+    for accumulateur in accumulateurs.values():
+        requises.update(accumulateur.colonnes)
+    lues = requises | ({'SERVICE'} if 'registre' in accumulateurs else set())
+
+    lecteur = pd.read_csv(source,
+                          usecols=lambda c: c in lues,
+                          dtype={c: str for c in _IDENTIFIANTS},
+                          chunksize=taille_bloc)
+
+    for bloc in lecteur:
+        manquantes = [c for c in COLONNES_SERVICES
+                      if c in requises and c not in bloc.columns]
+        if manquantes:
+            raise ValueError(f"Colonnes manquantes: {', '.join(manquantes)}")
+        for accumulateur in accumulateurs.values():
+            accumulateur.ajouter(bloc)
+
+    return {p: a.resultat() for p, a in accumulateurs.items()}
+
+
+def agreger_services_csv(source, taille_bloc=500_000):
+    """
+    Agrège par blocs un fichier CSV détaillé par service au format par ligne
+    
+    Le fichier n'est jamais chargé en entier : chaque bloc est réduit à des
+    totaux par ligne et à des couples distincts (ligne, jour, bus) et
+    (ligne, jour, conducteur).
+    
+    Args:
+        source (str ou file-like): Chemin ou flux du fichier CSV
+        taille_bloc (int): Nombre d'enregistrements lus par bloc
+        
+    Returns:
+        pandas.DataFrame: Une ligne par LIGNE avec VOY, BUS, VOY/SERVICE/J
+            et NBRE CONDUCTEURS ETP
+    """
+    return lire_services_csv(source, ['services'], taille_bloc)['services']
+
+
+def histogrammes_services_csv(source, largeur_classe=1, max_voyageurs=1000,
+                              taille_bloc=500_000):
+    """
+    Construit par blocs l'histogramme des voyageurs par service de chaque ligne
+    
+    Les services au-delà de la dernière classe ne sont pas ramenés dans
+    celle-ci : leur nombre et leurs voyageurs cumulés par ligne sont donnés
+    par les colonnes SERVICES_DEBORD et VOY_DEBORD.
+    
+    Args:
+        source (str ou file-like): Chemin ou flux du fichier CSV détaillé
+        largeur_classe (int): Nombre de valeurs entières de voyageurs par classe
+        max_voyageurs (int): Valeur couverte par la dernière classe
+        taille_bloc (int): Nombre d'enregistrements lus par bloc
+        
+    Returns:
+        pandas.DataFrame: Nombre de services par classe (une ligne par LIGNE,
+            une colonne par classe) suivi de SERVICES_DEBORD et VOY_DEBORD
+    """
+    return lire_services_csv(source, ['histogrammes'], taille_bloc,
+                             largeur_classe, max_voyageurs)['histogrammes']
+
+
+def series_services_csv(source, taille_bloc=500_000):
+    """
+    Construit par blocs la fréquentation journalière de chaque ligne
+    
+    Args:
+        source (str ou file-like): Chemin ou flux du fichier CSV détaillé
+        taille_bloc (int): Nombre d'enregistrements lus par bloc
+        
+    Returns:
+        pandas.DataFrame: Une ligne par LIGNE et par DATE avec VOY (voyageurs
+            du jour), SERVICES et VOY/SERVICE/J
+    """
+    return lire_services_csv(source, ['series'], taille_bloc)['series']
+
+
+def _cle_produit(produit, empreinte, largeur_classe, max_voyageurs):
+    """Clé de cache d'un produit d'un fichier détaillé"""
+    if produit == 'histogrammes':
+        return (produit, empreinte, largeur_classe, max_voyageurs)
+    return (produit, empreinte)
+
+
+def charger_fichier_services(contenu, empreinte=None,
+                             produits=('services', 'histogrammes', 'series'),
+                             taille_bloc=500_000, largeur_classe=1,
+                             max_voyageurs=1000):
+    """
+    Construit les produits d'un fichier détaillé, avec mise en cache par contenu
+    
+    Le contenu n'est empreinté qu'une fois par appel (et pas du tout si son
+    empreinte est fournie) ; les produits absents du cache sont construits
+    ensemble, en une seule lecture par blocs. Les valeurs renvoyées sont
+    partagées : elles ne doivent pas être modifiées en place.
+    
+    Args:
+        contenu (bytes): Contenu brut du fichier CSV
+        empreinte (str): Empreinte du contenu, si elle est déjà calculée
+        produits (iterable): Produits voulus (voir lire_services_csv)
+        taille_bloc (int): Nombre d'enregistrements lus par bloc
+        largeur_classe (int): Nombre de valeurs entières de voyageurs par classe
+        max_voyageurs (int): Valeur couverte par la dernière classe
+        
+    Returns:
+        dict: Valeur de chaque produit ; 'services' et 'registre' sont des
+            tuples (DataFrame ou None, bool, str) - données, validité, message
+    """
+    if empreinte is None:
+        empreinte = empreinte_octets(contenu)
+
+    resultats = {}
+    manquants = []
+    for produit in produits:
+        valeur = _CACHE_FICHIERS.obtenir(
+            _cle_produit(produit, empreinte, largeur_classe, max_voyageurs))
+        if valeur is None:
+            manquants.append(produit)
+        else:
+            resultats[produit] = valeur
+
+    if manquants:
+        lus = lire_services_csv(io.BytesIO(contenu), manquants, taille_bloc,
+                                largeur_classe, max_voyageurs)
+        if 'services' in lus:
+            data = lus['services']
+            valide, message = valider_donnees(data)
+            lus['services'] = (normaliser_types(data) if valide else None,
+                               valide, message)
+        for produit, valeur in lus.items():
+            _CACHE_FICHIERS.ajouter(
+                _cle_produit(produit, empreinte, largeur_classe, max_voyageurs),
+                valeur)
+            resultats[produit] = valeur
+
+    return resultats
+
+
+def charger_services_csv(contenu, taille_bloc=500_000, empreinte=None):
+    """
+    Agrège, valide et normalise un fichier détaillé par service, avec mise en cache
+    
+    Args:
+        contenu (bytes): Contenu brut du fichier CSV
+        taille_bloc (int): Nombre d'enregistrements lus par bloc
+        empreinte (str): Empreinte du contenu, si elle est déjà calculée
+        
+    Returns:
+        tuple: (DataFrame ou None, bool, str) - données, validité, message d'erreur
+    """
+    return charger_fichier_services(contenu, empreinte, ['services'],
+                                    taille_bloc)['services']
+
+
+def charger_histogrammes_csv(contenu, largeur_classe=1, max_voyageurs=1000,
+                             empreinte=None):
+    """
+    Construit les histogrammes d'un fichier détaillé par service, avec mise en cache
+    
+    Args:
+        contenu (bytes): Contenu brut du fichier CSV
+        largeur_classe (int): Nombre de valeurs entières de voyageurs par classe
+        max_voyageurs (int): Valeur couverte par la dernière classe
+        empreinte (str): Empreinte du contenu, si elle est déjà calculée
+        
+    Returns:
+        pandas.DataFrame: Nombre de services par classe et par LIGNE
+    """
+    return charger_fichier_services(
+        contenu, empreinte, ['histogrammes'], largeur_classe=largeur_classe,
+        max_voyageurs=max_voyageurs)['histogrammes']
+
+
+def charger_series_csv(contenu, taille_bloc=500_000, empreinte=None):
+    """
+    Construit la fréquentation journalière d'un fichier détaillé, avec mise en cache
+    
+    Args:
+        contenu (bytes): Contenu brut du fichier CSV
+        taille_bloc (int): Nombre d'enregistrements lus par bloc
+        empreinte (str): Empreinte du contenu, si elle est déjà calculée
+        
+    Returns:
+        pandas.DataFrame: Fréquentation par LIGNE et par DATE
+    """
+    return charger_fichier_services(contenu, empreinte, ['series'],
+                                    taille_bloc)['series']
+
+
+def charger_registre_csv(contenu, taille_bloc=500_000, empreinte=None):
+    """
+    Lit par blocs le registre des services par conducteur, avec mise en cache
+    
+    Le registre a le format du fichier détaillé par service (une colonne
+    SERVICE est conservée si elle est présente). Chaque bloc est compacté
+    dès sa lecture : identifiants en catégories, voyageurs au plus petit
+    type entier.
+    
+    Args:
+        contenu (bytes): Contenu brut du fichier CSV
+        taille_bloc (int): Nombre d'enregistrements lus par bloc
+        empreinte (str): Empreinte du contenu, si elle est déjà calculée
+        
+    Returns:
+        tuple: (DataFrame ou None, bool, str) - registre, validité, message d'erreur
+    """
+    return charger_fichier_services(contenu, empreinte, ['registre'],
+                                    taille_bloc)['registre']
+
+
+def registre_en_cache(empreinte):
+    """
+    Donne le registre d'un fichier déjà lu, sans relire le fichier
+    
+    Args:
+        empreinte (str): Empreinte du contenu du fichier détaillé
+        
+    Returns:
+        tuple ou None: (DataFrame ou None, bool, str) comme charger_registre_csv,
+            None si le registre n'est pas en cache
+    """
+    return _CACHE_FICHIERS.obtenir(_cle_produit('registre', empreinte, None, None))
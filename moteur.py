@@ -0,0 +1,271 @@
+import numpy as np
+
+# Ecart relatif en deçà duquel un montant est traité comme une égalité au
+# demi-centime (les sommes par segment et par palier diffèrent de quelques ulp)
+_MARGE_EGALITE = 1e-10
+
+
+def _somme_paliers(voyageurs, paliers):
+    """Somme palier par palier, dans l'ordre et avec les opérations de calculer_prime_generique"""
+    mins, maxs, taux = paliers
+    prime = np.zeros_like(voyageurs)
+    for minimum, maximum, t in zip(mins, maxs, taux):
+        prime = prime + np.where(voyageurs >= minimum,
+                                 (np.minimum(voyageurs, maximum) - minimum + 1) * t,
+                                 0.0)
+    return prime
+
+
+def _arrondir_comme_boucle(primes, voyageurs, paliers, amplitude, pente):
+    """
+    Arrondit au centime des primes calculées par segment, comme la boucle par palier
+
+    Loin d'un demi-centime, ordonnée + pente x voyageurs s'arrondit comme la
+    somme palier par palier. Près d'une égalité, l'ordre des additions peut
+    faire basculer l'arrondi : ces valeurs (peu nombreuses) sont recalculées
+    palier par palier. Les égalités restantes sont départagées comme par
+    round(x, 2), qui arrondit la valeur binaire exacte de x (au pair en cas
+    d'égalité exacte) là où np.round arrondit x * 100 déjà arrondi : le
+    produit exact x * 100 = p + e est obtenu sans erreur par découpage de
+    Dekker et e donne le sens de l'arrondi.
+
+    Args:
+        primes (numpy.ndarray): Primes non arrondies
+        voyageurs (numpy.ndarray): Voyageurs de chaque prime
+        paliers (tuple): (mins, maxs, taux) dans l'ordre du système
+        amplitude (float): Plus grande somme des valeurs absolues des termes
+            d'un montant cumulé du système
+        pente (float): Plus grand taux cumulé du système en valeur absolue
+
+    Returns:
+        numpy.ndarray: Primes arrondies comme calculer_prime_generique
+    """
+    forme = np.shape(primes)
+    primes, voyageurs = np.atleast_1d(primes, voyageurs)
+    p = primes * 100
+    arrondis = np.rint(p)
+    with np.errstate(invalid="ignore"):
+        ecarts = np.abs(p - arrondis)
+        tolerances = _MARGE_EGALITE * (1 + 100 * (amplitude + pente * np.abs(voyageurs)))
+        douteux = np.abs(ecarts - 0.5) <= tolerances
+    if douteux.any():
+        x = _somme_paliers(voyageurs[douteux], paliers)
+        px = x * 100
+        rx = np.rint(px)
+
+        decoupe = 134217729.0 * x
+        haut = decoupe - (decoupe - x)
+        erreur = (haut * 100 - px) + (x - haut) * 100
+        egalite = np.abs(px - rx) == 0.5
+        rx = np.where(egalite & (erreur > 0), np.ceil(px),
+                      np.where(egalite & (erreur < 0), np.floor(px), rx))
+        arrondis[douteux] = rx
+    return (arrondis / 100).reshape(forme)
+
+
+class BaremeCompile:
+    """
+    Barème de prime compilé à partir de la liste des paliers d'un système
+
+    La prime d'un système à paliers est une fonction affine par morceaux du
+    nombre de voyageurs. Le barème compilé conserve les points de rupture
+    triés ainsi que, pour chaque segment, le montant cumulé des paliers
+    (ordonnée à l'origine) et la somme des taux actifs (pente). L'évaluation
+    d'une colonne entière se fait alors en une seule passe np.searchsorted.
+
+    Les montants sont arrondis au centime exactement comme par
+    calculer_prime_generique, égalités au demi-centime comprises.
+
+    Attributes:
+        bornes (numpy.ndarray): Points de rupture triés
+        cumuls (numpy.ndarray): Montant cumulé de chaque segment
+        pentes (numpy.ndarray): Taux applicable dans chaque segment
+        paliers (tuple): (mins, maxs, taux) dans l'ordre du système
+        amplitude (float): Plus grande somme des valeurs absolues des termes
+            d'un montant cumulé (ordre de grandeur des erreurs d'arrondi)
+        pente (float): Plus grande pente en valeur absolue
+    """
+
+    def __init__(self, paliers):
+        mins = np.array([p["min"] for p in paliers], dtype=float)
+        maxs = np.array([p["max"] for p in paliers], dtype=float)
+        taux = np.array([p["taux"] for p in paliers], dtype=float)
+
+        # Un palier dont le max est inférieur au min n'a pas de partie linéaire
+        fins = np.maximum(maxs, mins)
+
+        self.bornes = np.unique(np.concatenate([mins, fins]))
+
+        # Borne inférieure de chaque segment (le premier segment est ouvert à gauche)
+        debuts = np.concatenate([[-np.inf], self.bornes])[:, None]
+
+        # Etat de chaque palier dans chaque segment (segments x paliers)
+        lineaire = (debuts >= mins) & (debuts < fins)
+        plafonne = debuts >= fins
+
+        self.pentes = (lineaire * taux).sum(axis=1)
+        self.cumuls = (lineaire * (taux * (1 - mins)) +
+                       plafonne * (taux * (maxs - mins + 1))).sum(axis=1)
+        self.paliers = (mins, maxs, taux)
+        self.amplitude = (lineaire * np.abs(taux * (1 - mins)) +
+                          plafonne * np.abs(taux * (maxs - mins + 1))).sum(axis=1).max()
+        self.pente = np.abs(self.pentes).max()
+
+    def evaluer(self, voyageurs):
+        """
+        Calcule la prime pour un tableau de nombres de voyageurs
+
+        Args:
+            voyageurs (array-like): Nombres de voyageurs par service
+
+        Returns:
+            numpy.ndarray: Montants des primes en MAD, arrondis au centime
+        """
+        voyageurs = np.asarray(voyageurs, dtype=float)
+        segments = np.searchsorted(self.bornes, voyageurs, side="right")
+        primes = self.cumuls[segments] + self.pentes[segments] * voyageurs
+
+        # Une valeur manquante ne déclenche aucun palier
+        manquants = np.isnan(voyageurs)
+        primes = np.where(manquants, 0.0, primes)
+
+        return _arrondir_comme_boucle(primes, np.where(manquants, 0.0, voyageurs),
+                                      self.paliers, self.amplitude, self.pente)
+
+
+def compiler_systeme(systeme):
+    """
+    Compile un système de prime en barème vectorisé
+
+    Args:
+        systeme (dict): Description du système de prime
+
+    Returns:
+        BaremeCompile: Barème prêt à évaluer des colonnes entières
+    """
+    return BaremeCompile(systeme["paliers"])
+
+
+class BaremeLot:
+    """
+    Ensemble de barèmes compilés évalués ensemble en une seule passe
+
+    Les points de rupture de tous les systèmes sont fusionnés : une seule
+    recherche np.searchsorted localise chaque valeur, puis les montants
+    cumulés et les pentes des K systèmes sont lus dans une table K x segments.
+
+    Attributes:
+        bornes (numpy.ndarray): Union triée des points de rupture
+        cumuls (numpy.ndarray): Montants cumulés (systèmes x segments)
+        pentes (numpy.ndarray): Taux applicables (systèmes x segments)
+        baremes (list): Barèmes compilés de chaque système (paliers pour l'arrondi)
+    """
+
+    def __init__(self, baremes):
+        baremes = list(baremes)
+        if baremes:
+            self.bornes = np.unique(np.concatenate([b.bornes for b in baremes]))
+        else:
+            self.bornes = np.empty(0)
+
+        # Borne inférieure de chaque segment de l'union
+        debuts = np.concatenate([[-np.inf], self.bornes])
+
+        self.cumuls = np.empty((len(baremes), len(debuts)))
+        self.pentes = np.empty((len(baremes), len(debuts)))
+        for k, bareme in enumerate(baremes):
+            segments = np.searchsorted(bareme.bornes, debuts, side="right")
+            self.cumuls[k] = bareme.cumuls[segments]
+            self.pentes[k] = bareme.pentes[segments]
+        self.baremes = baremes
+
+    def evaluer(self, voyageurs):
+        """
+        Calcule les primes de tous les systèmes pour un tableau de voyageurs
+
+        Args:
+            voyageurs (array-like): Nombres de voyageurs par service (N valeurs)
+
+        Returns:
+            numpy.ndarray: Primes en MAD arrondies au centime (K systèmes x N)
+        """
+        voyageurs = np.asarray(voyageurs, dtype=float)
+        segments = np.searchsorted(self.bornes, voyageurs, side="right")
+        primes = self.cumuls[:, segments] + self.pentes[:, segments] * voyageurs
+
+        # Une valeur manquante ne déclenche aucun palier
+        manquants = np.isnan(voyageurs)
+        primes = np.where(manquants, 0.0, primes)
+
+        voyageurs = np.where(manquants, 0.0, voyageurs)
+        for k, bareme in enumerate(self.baremes):
+            primes[k] = _arrondir_comme_boucle(primes[k], voyageurs, bareme.paliers,
+                                               bareme.amplitude, bareme.pente)
+        return primes
+
+    def evaluer_histogrammes(self, comptes, representants, services_debord=None,
+                             voyageurs_debord=None):
+        """
+        Calcule la prime moyenne par service à partir d'histogrammes de voyageurs
+
+        Les montants de chaque classe sont calculés une seule fois ; la prime
+        moyenne d'une ligne est le produit scalaire de ses effectifs par ces
+        montants, divisé par son nombre de services. Les services au-delà de
+        la dernière classe (débord) sont évalués à leur moyenne réelle, ce qui
+        est exact tant qu'ils tombent dans un même segment du barème.
+
+        Args:
+            comptes (array-like): Nombre de services par classe (N lignes x B classes)
+            representants (array-like): Nombre de voyageurs représentatif de
+                chaque classe (B valeurs)
+            services_debord (array-like): Nombre de services au-delà de la
+                dernière classe (N valeurs)
+            voyageurs_debord (array-like): Voyageurs cumulés de ces services
+                (N valeurs)
+
+        Returns:
+            numpy.ndarray: Primes moyennes par service en MAD (K systèmes x N),
+                NaN pour une ligne sans service
+        """
+        comptes = np.asarray(comptes, dtype=float)
+        totaux = self.evaluer(representants) @ comptes.T
+        nb_services = comptes.sum(axis=1)
+        if services_debord is not None:
+            services_debord = np.asarray(services_debord, dtype=float)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                moyennes_debord = np.asarray(voyageurs_debord, dtype=float) / services_debord
+            totaux = totaux + self.evaluer(moyennes_debord) * services_debord
+            nb_services = nb_services + services_debord
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return totaux / nb_services
+
+
+def representants_classes(nb_classes, largeur_classe=1):
+    """
+    Donne le nombre de voyageurs représentatif de chaque classe d'histogramme
+
+    La classe i regroupe les services de i * largeur_classe à
+    (i + 1) * largeur_classe - 1 voyageurs ; son représentant est le milieu
+    de cet intervalle. Avec des classes de largeur 1, le calcul est exact.
+
+    Args:
+        nb_classes (int): Nombre de classes
+        largeur_classe (int): Nombre de valeurs entières par classe
+
+    Returns:
+        numpy.ndarray: Représentant de chaque classe
+    """
+    return np.arange(nb_classes) * largeur_classe + (largeur_classe - 1) / 2
+
+
+def compiler_systemes(systemes):
+    """
+    Compile plusieurs systèmes de prime en un lot évaluable en une passe
+
+    Args:
+        systemes (list): Liste des systèmes de prime
+
+    Returns:
+        BaremeLot: Lot de barèmes partageant les mêmes points de rupture
+    """
+    return BaremeLot(compiler_systeme(systeme) for systeme in systemes)
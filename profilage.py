@@ -0,0 +1,142 @@
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+# Journal des mesures (une mesure JSON par ligne), modifiable par variable d'environnement
+JOURNAL_DEFAUT = os.environ.get('SIMULATEUR_JOURNAL_PROFILAGE',
+                                'logs/profilage.jsonl')
+
+_journal = logging.getLogger('simulateur.profilage')
+_journal.propagate = False
+
+
+def configurer_journal(chemin=JOURNAL_DEFAUT):
+    """
+    Dirige les mesures vers un fichier, une seule fois par chemin
+
+    Args:
+        chemin (str): Chemin du journal (créé si besoin)
+    """
+    chemin = Path(chemin).resolve()
+    if any(getattr(h, 'baseFilename', None) == str(chemin)
+           for h in _journal.handlers):
+        return
+    chemin.parent.mkdir(parents=True, exist_ok=True)
+    gestionnaire = logging.FileHandler(chemin, encoding='utf-8')
+    gestionnaire.setFormatter(logging.Formatter('%(message)s'))
+    _journal.addHandler(gestionnaire)
+    _journal.setLevel(logging.INFO)
+
+
+# tracemalloc est commun à tout le processus : une seule exécution à la fois
+# le démarre et mesure son pic (et le remet à zéro), les autres ne mesurent
+# que la durée
+_verrou_memoire = threading.Lock()
+
+
+class Profileur:
+    """
+    Mesure la durée, le volume traité et le pic mémoire des étapes d'une exécution
+
+    La durée est toujours mesurée. Le pic mémoire passe par tracemalloc,
+    qui ralentit les allocations Python de tout le processus : il n'est suivi
+    que si memoire est vrai, et seulement le temps d'une étape de premier
+    niveau. Le suivi démarré pour l'étape est arrêté à sa fin (un suivi déjà
+    actif avant elle est laissé tel quel). Le pic d'une étape est l'excès de
+    mémoire allouée par rapport à son début ; une étape imbriquée remonte son
+    pic à l'étape englobante.
+
+    Le pic de tracemalloc est global : une étape de premier niveau ne le
+    mesure que si elle obtient le verrou des mesures mémoire, gardé jusqu'à
+    sa fin. Sinon (autre session en cours de mesure), pic_memoire_octets
+    vaut None. Les allocations des autres threads pendant l'étape restent
+    comptées.
+
+    Attributes:
+        mesures (list): Mesures de l'exécution, une par étape terminée
+        memoire (bool): Suivi du pic mémoire
+        contexte (dict): Champs ajoutés à chaque mesure du journal
+    """
+
+    def __init__(self, memoire=False, **contexte):
+        self.mesures = []
+        self.memoire = memoire
+        self.contexte = contexte
+        self._pile = []
+
+    @contextmanager
+    def etape(self, nom, lignes=None):
+        """
+        Mesure le bloc de code d'une étape
+
+        Le dictionnaire renvoyé peut être complété dans le bloc, par exemple
+        avec le nombre de lignes une fois connu.
+
+        Args:
+            nom (str): Nom de l'étape
+            lignes (int): Nombre de lignes traitées
+
+        Yields:
+            dict: Mesure en cours
+        """
+        mesure = {'etape': nom, 'lignes': lignes}
+        # Les étapes imbriquées profitent du verrou de l'étape englobante
+        acquis = (self.memoire and not self._pile
+                  and _verrou_memoire.acquire(blocking=False))
+        # Suivi démarré pour cette étape, à arrêter à sa fin
+        demarre = acquis and not tracemalloc.is_tracing()
+        if demarre:
+            tracemalloc.start()
+        suivi = acquis or bool(self._pile)
+        if self.memoire:
+            mesure['pic_memoire_octets'] = None
+        if suivi:
+            courant, pic = tracemalloc.get_traced_memory()
+            if self._pile:
+                # Le pic atteint jusqu'ici appartient à l'étape englobante
+                self._pile[-1][1] = max(self._pile[-1][1], pic)
+            tracemalloc.reset_peak()
+            self._pile.append([courant, courant])
+        debut = time.perf_counter()
+        try:
+            yield mesure
+        finally:
+            mesure['secondes'] = time.perf_counter() - debut
+            if suivi:
+                depart, pic_interne = self._pile.pop()
+                pic = max(pic_interne, tracemalloc.get_traced_memory()[1])
+                mesure['pic_memoire_octets'] = pic - depart
+                if self._pile:
+                    self._pile[-1][1] = max(self._pile[-1][1], pic)
+                tracemalloc.reset_peak()
+            if demarre:
+                tracemalloc.stop()
+            if acquis:
+                _verrou_memoire.release()
+            self.mesures.append(mesure)
+            if _journal.handlers:
+                _journal.info(json.dumps(
+                    dict(self.contexte,
+                         horodatage=datetime.now().isoformat(timespec='milliseconds'),
+                         **mesure),
+                    ensure_ascii=False, default=str))
+
+    def tableau(self):
+        """
+        Met les mesures de l'exécution en tableau
+
+        Returns:
+            pandas.DataFrame: Une ligne par étape avec etape, lignes,
+                secondes et, si suivi, pic_memoire_octets
+        """
+        return pd.DataFrame(self.mesures, columns=[
+            'etape', 'lignes', 'secondes'
+        ] + (['pic_memoire_octets'] if self.memoire else []))
@@ -0,0 +1,320 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from cache import empreinte_dataframe, empreinte_systeme
+
+
+def nom_base_systeme(systeme):
+    """
+    Donne le suffixe utilisé dans les noms de colonnes d'un système
+
+    Args:
+        systeme (dict): Description du système de prime
+
+    Returns:
+        str: Nom du système en minuscules, espaces remplacés par '_'
+    """
+    return systeme['nom'].replace(' ', '_').lower()
+
+
+def _entiers(valeurs):
+    """
+    Tronque des comptages et les range dans le plus petit type entier sûr
+
+    Une valeur manquante ou infinie (division par zéro bus) devient NaN :
+    la colonne reste alors en flottants tronqués, au lieu de valeurs
+    entières aberrantes.
+    """
+    finies = np.isfinite(valeurs)
+    if not finies.all():
+        return np.where(finies, np.trunc(valeurs), np.nan)
+    return pd.to_numeric(valeurs.astype(np.int64), downcast='integer')
+
+
+class ResultatPrimes:
+    """
+    Résultat compact du calcul des primes pour K systèmes sur N lignes
+
+    Seule la matrice des primes par service (K x N) est stockée ; les autres
+    colonnes du format de calculer_primes_df (par jour, par mois, par an, par
+    conducteur, différences) sont décrites dans un registre et calculées à la
+    première lecture, puis conservées. Les colonnes alias (prime_*,
+    cout_total_*, BONUS/CONDUCTEUR/J_*) partagent le tableau de leur colonne
+    d'origine.
+
+    Le résultat s'utilise comme un DataFrame en lecture : resultat['col']
+    renvoie une Series, resultat[['a', 'b']] un DataFrame.
+
+    Attributes:
+        donnees (pandas.DataFrame): DataFrame d'entrée (non copié)
+        systemes (list): Systèmes de prime évalués
+        noms (list): Suffixes de colonnes de chaque système
+        bonus_service_j (numpy.ndarray): Primes par service par jour (K x N)
+    """
+
+    def __init__(self, donnees, systemes, bonus_service_j):
+        self.donnees = donnees
+        self.systemes = list(systemes)
+        self.noms = [nom_base_systeme(s) for s in self.systemes]
+        self.bonus_service_j = bonus_service_j
+        (self._calculs, self._alias, self._colonnes,
+         self._dependances) = self._construire_registre()
+        self._valeurs = {}
+        self._empreinte = None
+
+    def _construire_registre(self):
+        """
+        Décrit comment obtenir chaque colonne du résultat
+
+        Returns:
+            tuple: (dict nom -> fonction de calcul, dict alias -> nom d'origine,
+                list des colonnes dans l'ordre de calculer_primes_df,
+                dict nom -> suffixes des systèmes dont dépend la colonne)
+        """
+        calculs = {}
+        alias = {}
+        dependances = {}
+
+        # Colonnes dérivées des données d'entrée, au plus petit type entier
+        calculs['VOY/MOIS'] = lambda: _entiers(self._entree('VOY') / 12)
+        calculs['VOY/BUS'] = lambda: _entiers(self._voyageurs_par_bus())
+        calculs['VOY/J'] = lambda: _entiers(self._entree('VOY') / 365)
+        for nom in calculs:
+            dependances[nom] = frozenset()
+
+        for k, nom in enumerate(self.noms):
+            calculs[f"BONUS/SERVICE/J_{nom}"] = (
+                lambda k=k: self.bonus_service_j[k])
+            calculs[f"BONUS/J_{nom}"] = (
+                lambda k=k: self.bonus_service_j[k] * self.conducteurs)
+            alias[f"BONUS/CONDUCTEUR/J_{nom}"] = f"BONUS/SERVICE/J_{nom}"
+            calculs[f"BONUS/AN_{nom}"] = (
+                lambda nom=nom: self.colonne(f"BONUS/J_{nom}") * 365)
+            calculs[f"BONUS/MOIS_{nom}"] = (
+                lambda nom=nom: self.colonne(f"BONUS/J_{nom}") * 30)
+            calculs[f"BONUS/CONDUCTEUR/MOIS_{nom}"] = (
+                lambda k=k: self.bonus_service_j[k] * 30)
+            calculs[f"BONUS/CONDUCTEUR/AN_{nom}"] = (
+                lambda k=k: self.bonus_service_j[k] * 365)
+
+            # Noms compatibles avec l'ancien format
+            alias[f"prime_{nom}"] = f"BONUS/SERVICE/J_{nom}"
+            alias[f"cout_total_{nom}"] = f"BONUS/AN_{nom}"
+            alias[f"cout_total_{nom}_mensuel"] = f"BONUS/MOIS_{nom}"
+
+            for colonne in calculs:
+                dependances.setdefault(colonne, frozenset([nom]))
+
+        # Différences par rapport au premier système
+        if len(self.noms) > 1:
+            base = self.noms[0]
+            for nom in self.noms[1:]:
+                for diff, source in [(f"diff_{nom}", "BONUS/SERVICE/J"),
+                                     (f"diff_cout_{nom}", "BONUS/AN"),
+                                     (f"diff_cout_mensuel_{nom}", "BONUS/MOIS"),
+                                     (f"diff_conducteur_an_{nom}",
+                                      "BONUS/CONDUCTEUR/AN")]:
+                    calculs[diff] = (
+                        lambda a=f"{source}_{nom}", b=f"{source}_{base}":
+                        self.colonne(a) - self.colonne(b))
+                    dependances[diff] = frozenset([nom, base])
+
+        # L'ordre des colonnes est celui de calculer_primes_df
+        ordre = []
+        for k, nom in enumerate(self.noms):
+            ordre += [
+                f"BONUS/SERVICE/J_{nom}", f"BONUS/J_{nom}",
+                f"BONUS/CONDUCTEUR/J_{nom}", f"BONUS/AN_{nom}",
+                f"BONUS/MOIS_{nom}", f"BONUS/CONDUCTEUR/MOIS_{nom}",
+                f"BONUS/CONDUCTEUR/AN_{nom}", f"prime_{nom}",
+                f"cout_total_{nom}", f"cout_total_{nom}_mensuel"
+            ]
+        ordre += [c for c in calculs if c.startswith('diff_')]
+        calculees = ['VOY/MOIS', 'VOY/BUS', 'VOY/J'] + list(dict.fromkeys(ordre))
+
+        colonnes = [c for c in self.donnees.columns
+                    if c not in calculees] + calculees
+        return calculs, alias, colonnes, dependances
+
+    def reprendre(self, precedent):
+        """
+        Reprend les colonnes déjà calculées d'un résultat précédent
+
+        Une colonne est reprise si elle a les mêmes dépendances dans les deux
+        résultats et si les primes par service de chacun des systèmes dont
+        elle dépend sont identiques. Les colonnes tirées des seules données
+        (VOY/MOIS, VOY/BUS, VOY/J) sont reprises dès que les données sont les
+        mêmes.
+
+        Args:
+            precedent (ResultatPrimes): Résultat calculé sur les mêmes données
+
+        Returns:
+            int: Nombre de colonnes reprises
+        """
+        if (precedent.donnees is not self.donnees and
+                empreinte_dataframe(precedent.donnees) !=
+                empreinte_dataframe(self.donnees)):
+            return 0
+
+        anciens = dict(zip(precedent.noms, precedent.bonus_service_j))
+        inchanges = {
+            nom for nom, primes in zip(self.noms, self.bonus_service_j)
+            if nom in anciens and np.array_equal(primes, anciens[nom])
+        }
+
+        reprises = 0
+        for nom, valeurs in precedent._valeurs.items():
+            if (nom in self._calculs and nom not in self._valeurs and
+                    precedent._dependances.get(nom) == self._dependances[nom]
+                    and self._dependances[nom] <= inchanges):
+                self._valeurs[nom] = valeurs
+                reprises += 1
+        return reprises
+
+    def _entree(self, nom):
+        return self.donnees[nom].to_numpy()
+
+    def _voyageurs_par_bus(self):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return (self._entree('VOY').astype(float) /
+                    self._entree('BUS').astype(float))
+
+    def __len__(self):
+        return len(self.donnees)
+
+    def __contains__(self, nom):
+        return nom in self._colonnes
+
+    @property
+    def columns(self):
+        """list: Noms des colonnes disponibles, dans l'ordre de calculer_primes_df"""
+        return list(self._colonnes)
+
+    @property
+    def conducteurs(self):
+        """numpy.ndarray: Nombre de conducteurs ETP de chaque ligne"""
+        return self.donnees['NBRE CONDUCTEURS ETP'].to_numpy(dtype=float)
+
+    @property
+    def conducteurs_comptes(self):
+        """numpy.ndarray: Conducteurs ETP de chaque ligne, 0 là où la valeur
+        manque (les totaux ignorent ces lignes, comme une somme pandas)"""
+        conducteurs = self.conducteurs
+        return np.where(np.isfinite(conducteurs), conducteurs, 0.0)
+
+    def colonne(self, nom):
+        """
+        Renvoie les valeurs d'une colonne, calculées à la première lecture
+
+        Args:
+            nom (str): Nom de la colonne
+
+        Returns:
+            numpy.ndarray: Valeurs de la colonne
+        """
+        nom = self._alias.get(nom, nom)
+        if nom in self._calculs:
+            if nom not in self._valeurs:
+                self._valeurs[nom] = self._calculs[nom]()
+            return self._valeurs[nom]
+        if nom in self.donnees.columns:
+            return self._entree(nom)
+        raise KeyError(nom)
+
+    def _est_entree(self, nom):
+        return (nom in self.donnees.columns and nom not in self._calculs
+                and nom not in self._alias)
+
+    def __getitem__(self, cle):
+        if isinstance(cle, str):
+            if self._est_entree(cle):
+                return self.donnees[cle]
+            return pd.Series(self.colonne(cle), index=self.donnees.index,
+                             name=cle)
+        return self.vers_dataframe(cle)
+
+    def bonus_j(self):
+        """
+        Calcule le bonus par jour de chaque ligne pour chaque système
+
+        Returns:
+            numpy.ndarray: Bonus par jour (K x N)
+        """
+        return self.bonus_service_j * self.conducteurs
+
+    def bonus_an(self):
+        """
+        Calcule le bonus annuel de chaque ligne pour chaque système
+
+        Returns:
+            numpy.ndarray: Bonus par an (K x N)
+        """
+        return self.bonus_j() * 365
+
+    def totaux_annuels(self):
+        """
+        Calcule le coût annuel total de chaque système sur toutes les lignes
+
+        Returns:
+            pandas.Series: Coût annuel total indexé par nom de système
+        """
+        totaux = (self.bonus_service_j @ self.conducteurs_comptes) * 365
+        return pd.Series(totaux, index=[s['nom'] for s in self.systemes])
+
+    def empreinte(self):
+        """
+        Calcule une empreinte stable du résultat
+
+        Returns:
+            str: Empreinte hexadécimale des données, des systèmes et des primes
+        """
+        if self._empreinte is None:
+            h = hashlib.sha256(empreinte_dataframe(self.donnees).encode())
+            for systeme in self.systemes:
+                h.update(empreinte_systeme(systeme).encode())
+            h.update(np.ascontiguousarray(self.bonus_service_j).tobytes())
+            self._empreinte = h.hexdigest()
+        return self._empreinte
+
+    def taille_octets(self):
+        """
+        Mesure la mémoire que le résultat peut occuper, données d'entrée comprises
+
+        Les colonnes calculées à la lecture sont comptées dès la création (8
+        octets par valeur, les vues de la matrice des primes exceptées) : la
+        taille facturée à un cache ne grandit pas quand le tableau de bord
+        les matérialise.
+
+        Returns:
+            int: Taille en octets des données d'entrée, de la matrice des
+                primes et de toutes les colonnes calculées
+        """
+        calculees = [c for c in self._calculs
+                     if not c.startswith("BONUS/SERVICE/J_")]
+        return int(self.donnees.memory_usage(index=True, deep=True).sum() +
+                   self.bonus_service_j.nbytes +
+                   len(calculees) * len(self.donnees) * 8)
+
+    def vers_dataframe(self, colonnes=None):
+        """
+        Construit un DataFrame au format de calculer_primes_df
+
+        Args:
+            colonnes (list): Colonnes à inclure (toutes par défaut)
+
+        Returns:
+            pandas.DataFrame: Colonnes demandées, matérialisées
+        """
+        if colonnes is None:
+            colonnes = self._colonnes
+
+        # Les colonnes d'entrée gardent leur type (catégories, textes...)
+        entree = self.donnees[[c for c in colonnes if self._est_entree(c)]]
+        calculees = pd.DataFrame(
+            {c: self.colonne(c) for c in colonnes if not self._est_entree(c)},
+            index=self.donnees.index)
+
+        return pd.concat([entree, calculees], axis=1)[list(colonnes)]
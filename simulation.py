@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+
+from moteur import compiler_systemes
+
+# Lois disponibles pour les tirages de voyageurs par service
+DISTRIBUTIONS = ['normale', 'lognormale', 'poisson']
+
+
+def tirer_voyageurs(moyennes, nb_tirages, distribution='normale',
+                    coefficient_variation=0.15, generateur=None):
+    """
+    Tire des scénarios de voyageurs par service autour des moyennes par ligne
+
+    Args:
+        moyennes (numpy.ndarray): Voyageurs moyens par service de chaque ligne (N)
+        nb_tirages (int): Nombre de scénarios
+        distribution (str): 'normale', 'lognormale' ou 'poisson'
+        coefficient_variation (float): Ecart-type relatif (lois normale et
+            lognormale)
+        generateur (numpy.random.Generator): Générateur aléatoire
+
+    Returns:
+        numpy.ndarray: Voyageurs tirés (scénarios x lignes), positifs
+    """
+    if generateur is None:
+        generateur = np.random.default_rng()
+    forme = (nb_tirages, len(moyennes))
+
+    if distribution == 'normale':
+        tirages = generateur.normal(moyennes, coefficient_variation * moyennes,
+                                    forme)
+    elif distribution == 'lognormale':
+        # Paramètres choisis pour conserver la moyenne et l'écart-type relatif
+        sigma2 = np.log1p(coefficient_variation**2)
+        mu = np.log(np.maximum(moyennes, 1e-9)) - sigma2 / 2
+        tirages = generateur.lognormal(mu, np.sqrt(sigma2), forme)
+    elif distribution == 'poisson':
+        tirages = generateur.poisson(moyennes, forme).astype(float)
+    else:
+        raise ValueError(f"Distribution inconnue: {distribution}")
+
+    return np.maximum(tirages, 0.0)
+
+
+def simuler_couts(df, systemes, nb_tirages=10000, distribution='normale',
+                  coefficient_variation=0.15, graine=None, taille_bloc=2000):
+    """
+    Simule le coût annuel de chaque système sous incertitude de fréquentation
+
+    Chaque scénario tire les voyageurs par service de toutes les lignes ;
+    les primes de tous les systèmes sont évaluées sur le tableau
+    scénarios x lignes en une seule passe du lot de barèmes, puis pondérées
+    par les conducteurs de chaque ligne. Les tirages d'un bloc sont faits
+    une seule fois et partagés par tous les systèmes : les écarts entre
+    systèmes ne doivent rien au hasard des tirages, et les quantiles d'un
+    système ne dépendent pas des autres systèmes simulés.
+
+    Args:
+        df (pandas.DataFrame): Données avec VOY/SERVICE/J et NBRE CONDUCTEURS ETP
+        systemes (list): Systèmes de prime à simuler
+        nb_tirages (int): Nombre de scénarios
+        distribution (str): 'normale', 'lognormale' ou 'poisson'
+        coefficient_variation (float): Ecart-type relatif des tirages
+        graine (int): Graine du générateur, pour des résultats reproductibles
+        taille_bloc (int): Nombre de scénarios évalués ensemble
+
+    Returns:
+        pandas.DataFrame: Moyenne, P5, P50 et P95 du coût annuel total,
+            une ligne par système
+    """
+    generateur = np.random.default_rng(graine)
+    moyennes = df['VOY/SERVICE/J'].to_numpy(dtype=float)
+    conducteurs = df['NBRE CONDUCTEURS ETP'].to_numpy(dtype=float)
+    lot = compiler_systemes(systemes)
+
+    couts = np.empty((len(systemes), nb_tirages))
+    for debut in range(0, nb_tirages, taille_bloc):
+        fin = min(debut + taille_bloc, nb_tirages)
+        voyageurs = tirer_voyageurs(moyennes, fin - debut, distribution,
+                                    coefficient_variation, generateur)
+        couts[:, debut:fin] = (lot.evaluer(voyageurs) @ conducteurs) * 365
+
+    p5, p50, p95 = np.percentile(couts, [5, 50, 95], axis=1)
+    return pd.DataFrame({
+        'moyenne': couts.mean(axis=1),
+        'P5': p5,
+        'P50': p50,
+        'P95': p95
+    }, index=[s['nom'] for s in systemes])
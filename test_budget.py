@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+
+from budget import (BUDGET_2024, _cout, _racine_monotone, ajuster_echelle, ajuster_taux_palier,
+                    tolerance_cout)
+from generation import generer_reseau
+from utils import SYSTEMES_DEFAUT
+
+SYSTEME = SYSTEMES_DEFAUT["systeme_nouveau"]
+
+
+@pytest.fixture(scope='module')
+def reseau():
+    return generer_reseau(120, 5)
+
+
+def _cout_reseau(df, systeme):
+    return _cout(systeme["paliers"], df['VOY/SERVICE/J'].to_numpy(dtype=float),
+                 df['NBRE CONDUCTEURS ETP'].to_numpy(dtype=float))
+
+
+def test_racine_d_une_fonction_affine():
+    x, atteinte = _racine_monotone(lambda x: 3 * x - 7, 0.0, 1.0, 1e-9)
+    assert atteinte
+    assert x == pytest.approx(7 / 3)
+
+
+def test_racine_hors_d_atteinte():
+    assert _racine_monotone(lambda x: x + 5, 0.0, 1.0, 0.1) == (None, False)
+    assert _racine_monotone(lambda x: -1.0, 0.0, 1.0, 0.1, max_iterations=10) == (None, False)
+
+
+def test_escalier_ramene_a_la_marche_la_plus_proche():
+    x, atteinte = _racine_monotone(lambda x: np.floor(x) - 2.5, 0.0, 1.0, 0.1)
+    assert atteinte
+    assert abs(np.floor(x) - 2.5) == 0.5
+
+
+def test_absence_de_convergence_signalee():
+    x, atteinte = _racine_monotone(lambda x: np.floor(x) - 2.5, 0.0, 1.0, 0.1,
+                                   max_iterations=3)
+    assert not atteinte
+    assert x is not None
+
+
+@pytest.mark.parametrize('budget', [BUDGET_2024, 2 * BUDGET_2024])
+def test_echelle_atteint_le_budget(reseau, budget):
+    ajuste, cout, atteinte = ajuster_echelle(reseau, SYSTEME, budget,
+                                             tolerance=budget * 1e-4)
+
+    assert atteinte and abs(cout - budget) <= budget * 1e-4
+    assert cout == pytest.approx(_cout_reseau(reseau, ajuste))
+    ratios = [a["taux"] / p["taux"] for a, p in zip(ajuste["paliers"], SYSTEME["paliers"])]
+    assert ratios == pytest.approx([ratios[0]] * len(ratios))
+    assert SYSTEME["paliers"][0]["taux"] == 0.10
+
+
+@pytest.mark.parametrize('indice', range(len(SYSTEME["paliers"])))
+def test_taux_d_un_palier(reseau, indice):
+    budget = _cout_reseau(reseau, SYSTEME) * 1.1
+    ajuste, cout, atteinte = ajuster_taux_palier(reseau, SYSTEME, budget, indice,
+                                                 tolerance=budget * 1e-3)
+
+    assert atteinte and abs(cout - budget) <= budget * 1e-3
+    assert ajuste["paliers"][indice]["taux"] > SYSTEME["paliers"][indice]["taux"]
+    autres = [p for i, p in enumerate(ajuste["paliers"]) if i != indice]
+    assert autres == [p for i, p in enumerate(SYSTEME["paliers"]) if i != indice]
+
+
+def test_tolerance_trop_fine_ramenee_a_la_marche(reseau):
+    # Le coût avance par marches d'un centime x conducteurs x 365 : une
+    # tolérance d'un dirham donne le coût atteignable le plus proche
+    budget = _cout_reseau(reseau, SYSTEME) * 1.1
+    for indice in range(len(SYSTEME["paliers"])):
+        _, cout, atteinte = ajuster_taux_palier(reseau, SYSTEME, budget, indice,
+                                                tolerance=1.0)
+        assert atteinte
+        assert abs(cout - budget) <= budget * 1e-3
+
+
+@pytest.mark.parametrize('graine', range(5))
+def test_tolerance_par_defaut_atteinte(graine):
+    df = generer_reseau(500, graine)
+    conducteurs = df['NBRE CONDUCTEURS ETP'].to_numpy(dtype=float)
+    assert tolerance_cout(conducteurs) == 0.01 * conducteurs.max() * 365 / 2
+
+    _, cout, atteinte = ajuster_echelle(df, SYSTEME, BUDGET_2024)
+
+    assert atteinte
+    assert abs(cout - BUDGET_2024) <= 2 * tolerance_cout(conducteurs)
+
+
+def test_budget_inatteignable(reseau):
+    # Même à taux nul, les autres paliers coûtent plus que le budget
+    assert ajuster_taux_palier(reseau, SYSTEME, 1.0, 0) is None
+    assert ajuster_echelle(reseau, SYSTEME, -1000.0) is None
@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+
+from cache import CacheLRU, empreinte_dataframe, empreinte_systeme
+from generation import generer_reseau
+from utils import SYSTEMES_DEFAUT, calculer_primes_df, calculer_primes_df_cache
+
+SYSTEMES = list(SYSTEMES_DEFAUT.values())
+
+
+def test_eviction_par_nombre_d_entrees():
+    cache = CacheLRU(max_entrees=2)
+    cache.ajouter('a', 1)
+    cache.ajouter('b', 2)
+    assert cache.obtenir('a') == 1  # 'b' devient la moins récente
+    cache.ajouter('c', 3)
+
+    assert 'b' not in cache
+    assert cache.obtenir('a') == 1 and cache.obtenir('c') == 3
+    assert cache.obtenir('b') is None
+    assert cache.statistiques()['succes'] == 3
+    assert cache.statistiques()['echecs'] == 1
+
+
+def test_eviction_par_taille():
+    cache = CacheLRU(max_entrees=10, max_octets=2500)
+    for cle in 'abc':
+        cache.ajouter(cle, np.zeros(100))  # 800 octets chacun
+    cache.ajouter('d', np.zeros(100))
+
+    assert 'a' not in cache and len(cache) == 3
+    assert cache.statistiques()['octets'] == 2400
+
+
+def test_valeur_trop_grosse_non_conservee():
+    cache = CacheLRU(max_entrees=10, max_octets=1000)
+    cache.ajouter('petit', np.zeros(10))
+    cache.ajouter('gros', np.zeros(1000))
+
+    assert 'gros' not in cache and 'petit' in cache
+
+
+def test_remplacement_d_une_entree():
+    cache = CacheLRU(max_octets=10_000)
+    cache.ajouter('a', np.zeros(100))
+    cache.ajouter('a', np.zeros(10))
+
+    assert len(cache) == 1
+    assert cache.statistiques()['octets'] == 80
+
+
+def test_empreintes_sur_le_contenu():
+    df = generer_reseau(10, 1)
+    assert empreinte_dataframe(df) == empreinte_dataframe(df.copy())
+    modifie = df.copy()
+    modifie.loc[0, 'VOY'] += 1
+    assert empreinte_dataframe(modifie) != empreinte_dataframe(df)
+
+    systeme = dict(SYSTEMES[1], description="autre texte")
+    assert empreinte_systeme(systeme) == empreinte_systeme(SYSTEMES[1])
+    systeme["paliers"] = [dict(p, taux=p["taux"] * 2) for p in systeme["paliers"]]
+    assert empreinte_systeme(systeme) != empreinte_systeme(SYSTEMES[1])
+
+
+def test_calcul_memoise():
+    df = generer_reseau(40, 2)
+    premier = calculer_primes_df_cache(df, SYSTEMES, 4)
+
+    assert calculer_primes_df_cache(df.copy(), SYSTEMES, 4) is premier
+    assert calculer_primes_df_cache(df, SYSTEMES, 5) is not premier
+    pd.testing.assert_frame_equal(premier.vers_dataframe(),
+                                  calculer_primes_df(df, SYSTEMES, 4))
+
+
+def test_seuls_les_systemes_modifies_sont_recalcules():
+    df = generer_reseau(40, 3)
+    avant = calculer_primes_df_cache(df, SYSTEMES)
+    avant.colonne(f"BONUS/AN_{avant.noms[0]}")
+
+    modifie = dict(SYSTEMES[1], paliers=[dict(p, taux=p["taux"] + 0.1)
+                                         for p in SYSTEMES[1]["paliers"]])
+    apres = calculer_primes_df_cache(df, [SYSTEMES[0], modifie])
+
+    # Colonne du système inchangé reprise telle quelle
+    nom = f"BONUS/AN_{apres.noms[0]}"
+    assert apres.colonne(nom) is avant.colonne(nom)
+    pd.testing.assert_frame_equal(apres.vers_dataframe(),
+                                  calculer_primes_df(df, [SYSTEMES[0], modifie]))
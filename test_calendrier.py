@@ -0,0 +1,123 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from analytique import construire_analyses
+from calendrier import (PrimesCalendrier, calculer_primes_calendrier, serie_mensuelle,
+                        serie_mensuelle_cache)
+from generation import generer_reseau, generer_services
+from ingestion import charger_fichier_services, lire_services_csv
+from utils import SYSTEMES_DEFAUT, calculer_prime_generique, calculer_primes_lot
+
+SYSTEMES = list(SYSTEMES_DEFAUT.values())
+
+
+def _ligne(nom, voy_service, conducteurs):
+    return {'LIGNE': nom, 'VOY': voy_service * 365 * 10, 'VOY/SERVICE/J': voy_service,
+            'NBRE CONDUCTEURS ETP': conducteurs}
+
+
+def test_totaux_mensuels_sur_les_jours_reels():
+    df = pd.DataFrame([_ligne('L1', 300, 4), _ligne('L2', 200, 2)])
+    jours = pd.date_range('2024-02-01', '2024-03-31', freq='D')
+    serie = pd.DataFrame({'LIGNE': 'L1', 'DATE': jours, 'VOY/SERVICE/J': 400.0,
+                          'SERVICES': 10})
+
+    mensuels = PrimesCalendrier(df, serie, SYSTEMES).totaux_mensuels()
+
+    assert mensuels['MOIS'].tolist() == ['2024-02', '2024-03']
+    nb_jours = np.array([29, 31])
+    for systeme, nom in zip(SYSTEMES, ['système_actuel', 'nouveau_système']):
+        # L1 suit la série, L2 garde chaque jour sa moyenne annuelle
+        par_jour = (calculer_prime_generique(400, systeme) * 4 +
+                    calculer_prime_generique(200, systeme) * 2)
+        np.testing.assert_allclose(mensuels[f"cout_total_{nom}_mensuel"],
+                                   par_jour * nb_jours)
+    np.testing.assert_allclose(mensuels['VOY_MENSUEL'], (400 * 10 + 200 * 10) * nb_jours)
+
+
+def test_jour_absent_sans_service():
+    df = pd.DataFrame([_ligne('L1', 300, 1)])
+    serie = pd.DataFrame({'LIGNE': 'L1', 'DATE': pd.to_datetime(['2024-01-01', '2024-01-03']),
+                          'VOY': [3000.0, 3000.0], 'SERVICES': [10, 10]})
+
+    calendrier = PrimesCalendrier(df, serie, SYSTEMES)
+
+    assert calendrier.voyageurs_jour[0].tolist() == [3000.0, 0.0, 3000.0]
+    assert (calendrier.bonus_jour[:, 0, 1] == 0).all()
+
+
+@pytest.fixture(scope='module')
+def reseau():
+    contenu = pd.concat(generer_services(generer_reseau(12, 3), 75)).to_csv(
+        index=False).encode()
+    lus = charger_fichier_services(contenu, produits=('services', 'series'))
+    donnees, valide, message = lus['services']
+    assert valide, message
+    return donnees, lus['series']
+
+
+def test_serie_independante_de_la_taille_des_blocs():
+    contenu = pd.concat(generer_services(generer_reseau(6, 8), 15)).to_csv(
+        index=False).encode()
+    entiere = lire_services_csv(io.BytesIO(contenu), ['series'])['series']
+    par_blocs = lire_services_csv(io.BytesIO(contenu), ['series'], taille_bloc=101)['series']
+
+    pd.testing.assert_frame_equal(entiere, par_blocs)
+
+
+def test_serie_mensuelle_conserve_les_totaux(reseau):
+    _, serie = reseau
+    mensuelle = serie_mensuelle(serie)
+
+    assert (mensuelle['DATE'].dt.day == 1).all()
+    assert mensuelle['VOY'].sum() == serie['VOY'].sum()
+    assert mensuelle['SERVICES'].sum() == serie['SERVICES'].sum()
+
+    journalier = PrimesCalendrier(*reseau, SYSTEMES, 'J').totaux_mensuels()
+    mensuel = PrimesCalendrier(reseau[0], mensuelle, SYSTEMES, 'M').totaux_mensuels()
+    np.testing.assert_allclose(mensuel['VOY_MENSUEL'], journalier['VOY_MENSUEL'])
+
+
+def test_serie_mensuelle_partagee_entre_les_appels(reseau):
+    donnees, serie = reseau
+    mensuelle = serie_mensuelle_cache(serie)
+
+    assert serie_mensuelle_cache(serie.copy()) is mensuelle
+    pd.testing.assert_frame_equal(mensuelle, serie_mensuelle(serie))
+    assert (calculer_primes_calendrier(donnees, serie_mensuelle_cache(serie), SYSTEMES, 'M')
+            is calculer_primes_calendrier(donnees, mensuelle, SYSTEMES, 'M'))
+
+
+@pytest.mark.parametrize('frequence', ['J', 'M'])
+def test_prime_mensuelle_par_conducteur_du_calendrier(reseau, frequence):
+    donnees, serie = reseau
+    if frequence == 'M':
+        serie = serie_mensuelle(serie)
+    resultat = calculer_primes_lot(donnees, SYSTEMES)
+    calendrier = PrimesCalendrier(donnees, serie, SYSTEMES, frequence)
+
+    totaux = construire_analyses(resultat, calendrier)['totaux_globaux']
+
+    conducteurs = donnees['NBRE CONDUCTEURS ETP'].sum()
+    for nom in resultat.noms:
+        cout_moyen = calendrier.totaux_mensuels()[f"cout_total_{nom}_mensuel"].mean()
+        assert totaux[f"bonus_cond_mois_{nom}"] == pytest.approx(cout_moyen / conducteurs)
+        assert totaux[f"bonus_cond_mois_{nom}"] != pytest.approx(
+            totaux[f"bonus_cond_jour_{nom}"] * 30)
+
+
+def test_ligne_sans_conducteurs(reseau):
+    donnees, serie = reseau
+    donnees = donnees.astype({'NBRE CONDUCTEURS ETP': float})
+    donnees.loc[0, 'NBRE CONDUCTEURS ETP'] = np.nan
+    resultat = calculer_primes_lot(donnees, SYSTEMES)
+
+    totaux = construire_analyses(
+        resultat, PrimesCalendrier(donnees, serie, SYSTEMES))['totaux_globaux']
+
+    for nom in resultat.noms:
+        assert np.isfinite(totaux[f"cout_total_{nom}_mensuel"])
+        assert np.isfinite(totaux[f"bonus_cond_mois_{nom}"])
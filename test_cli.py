@@ -0,0 +1,46 @@
+from pathlib import Path
+
+import pandas as pd
+
+from cli import executer, noms_sorties
+from generation import ecrire, generer_reseau
+from utils import SYSTEMES_DEFAUT, exporter_systeme_json
+
+
+def test_noms_uniques_conserves():
+    noms = noms_sorties([Path('a.xlsx'), Path('b.xls')])
+    assert noms == {Path('a.xlsx'): 'a.csv', Path('b.xls'): 'b.csv'}
+
+
+def test_noms_en_collision_distingues():
+    classeurs = [Path('a.xls'), Path('a.xlsx'), Path('A.xlsx'), Path('a_xls.xlsx'),
+                 Path('synthese.xlsx')]
+    noms = noms_sorties(classeurs)
+
+    assert noms[Path('a.xls')] == 'a_xls.csv'
+    assert noms[Path('synthese.xlsx')] == 'synthese_xlsx.csv'
+    minuscules = [n.lower() for n in noms.values()]
+    assert len(set(minuscules)) == len(classeurs)
+    assert 'synthese.csv' not in minuscules
+
+
+def test_executer_ne_perd_aucun_classeur(tmp_path):
+    entree, sortie = tmp_path / 'entree', tmp_path / 'sortie'
+    for graine, nom in enumerate(['a.xlsx', 'A.xlsx', 'synthese.xlsx']):
+        ecrire(generer_reseau(5, graine), entree / nom)
+    systemes = []
+    for cle, systeme in SYSTEMES_DEFAUT.items():
+        chemin = tmp_path / f"{cle}.json"
+        chemin.write_text(exporter_systeme_json(systeme), encoding='utf-8')
+        systemes.append(str(chemin))
+
+    synthese = executer(entree, systemes, sortie, nb_processus=1)
+
+    assert (synthese['erreur'] == '').all()
+    fichiers = synthese.drop_duplicates('classeur').set_index('classeur')['sortie']
+    assert fichiers.nunique() == 3
+    for classeur, fichier in fichiers.items():
+        resultat = pd.read_csv(sortie / fichier)
+        attendu = pd.read_excel(entree / classeur)
+        assert resultat['VOY'].tolist() == attendu['VOY'].tolist()
+    assert set(pd.read_csv(sortie / 'synthese.csv')['classeur']) == set(fichiers.index)
@@ -0,0 +1,99 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conducteurs import calculer_primes_conducteurs, synthese_conducteurs
+from generation import generer_reseau, generer_services
+from ingestion import lire_services_csv
+from utils import SYSTEMES_DEFAUT, calculer_prime_generique
+
+SYSTEMES = list(SYSTEMES_DEFAUT.values())
+
+
+@pytest.fixture(scope='module')
+def services():
+    return pd.concat(generer_services(generer_reseau(8, 9), 12), ignore_index=True)
+
+
+def _reference(services, systeme, mode):
+    """Prime totale de chaque conducteur, journée par journée"""
+    totaux = {}
+    for (conducteur, _), journee in services.groupby(['CONDUCTEUR', 'DATE']):
+        voyageurs = journee['VOYAGEURS'].tolist()
+        if mode == 'moyenne':
+            prime = calculer_prime_generique(sum(voyageurs) / len(voyageurs), systeme)
+        else:
+            prime = np.mean([calculer_prime_generique(v, systeme) for v in voyageurs])
+        totaux[str(conducteur)] = totaux.get(str(conducteur), 0.0) + prime
+    return pd.Series(totaux)
+
+
+@pytest.mark.parametrize('mode', ['moyenne', 'service'])
+def test_primes_par_conducteur(services, mode):
+    primes = calculer_primes_conducteurs(services, SYSTEMES, mode).set_index('CONDUCTEUR')
+
+    for systeme, nom in zip(SYSTEMES, ['système_actuel', 'nouveau_système']):
+        attendu = _reference(services, systeme, mode)
+        np.testing.assert_allclose(primes[f"BONUS/TOTAL_{nom}"].loc[attendu.index],
+                                   attendu.to_numpy(), atol=1e-6)
+    jours = services.groupby('CONDUCTEUR')['DATE'].nunique()
+    np.testing.assert_array_equal(primes['JOURS'].loc[jours.index.astype(str)], jours)
+    assert primes['SERVICES'].sum() == len(services)
+
+
+def test_independant_de_l_ordre_et_de_l_index(services):
+    attendu = calculer_primes_conducteurs(services, SYSTEMES).set_index('CONDUCTEUR')
+    melange = services.sample(frac=1, random_state=3)
+    melange.index = np.arange(len(melange))[::-1] * 7
+
+    obtenu = calculer_primes_conducteurs(melange, SYSTEMES).set_index('CONDUCTEUR')
+
+    pd.testing.assert_frame_equal(obtenu.loc[attendu.index], attendu)
+
+
+@pytest.mark.parametrize('mode', ['moyenne', 'service'])
+def test_voyageurs_manquants_ecartes(services, mode):
+    avec_manquants = services.astype({'VOYAGEURS': float}).reset_index(drop=True)
+    avec_manquants.loc[[0, 5, 11], 'VOYAGEURS'] = np.nan
+
+    obtenu = calculer_primes_conducteurs(avec_manquants, SYSTEMES, mode)
+    attendu = calculer_primes_conducteurs(
+        avec_manquants.dropna(subset=['VOYAGEURS']), SYSTEMES, mode)
+
+    pd.testing.assert_frame_equal(obtenu, attendu)
+    assert obtenu['SERVICES'].sum() == len(services) - 3
+
+
+def test_registre_compact_identique(services):
+    contenu = services.to_csv(index=False).encode()
+    registre, valide, _ = lire_services_csv(io.BytesIO(contenu), ['registre'],
+                                            taille_bloc=500)['registre']
+
+    assert valide
+    assert isinstance(registre['CONDUCTEUR'].dtype, pd.CategoricalDtype)
+    assert registre['VOYAGEURS'].dtype.itemsize < 8
+    pd.testing.assert_frame_equal(
+        calculer_primes_conducteurs(registre, SYSTEMES).sort_values('CONDUCTEUR',
+                                                                     ignore_index=True),
+        calculer_primes_conducteurs(services, SYSTEMES).sort_values('CONDUCTEUR',
+                                                                     ignore_index=True),
+        check_dtype=False)
+
+
+def test_registre_voyageurs_non_numeriques():
+    contenu = b"CONDUCTEUR,DATE,LIGNE,VOYAGEURS\n1,2024-01-01,L1,beaucoup\n"
+    registre, valide, message = lire_services_csv(io.BytesIO(contenu),
+                                                  ['registre'])['registre']
+    assert registre is None and not valide and 'VOYAGEURS' in message
+
+
+def test_synthese(services):
+    primes = calculer_primes_conducteurs(services, SYSTEMES)
+    synthese = synthese_conducteurs(primes, SYSTEMES)
+
+    assert list(synthese.index) == [s['nom'] for s in SYSTEMES]
+    assert (synthese['P10'] <= synthese['médiane']).all()
+    assert (synthese['médiane'] <= synthese['P90']).all()
+    assert (synthese['P90'] <= synthese['maximum']).all()
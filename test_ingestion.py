@@ -0,0 +1,113 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from generation import generer_reseau, generer_services
+from ingestion import histogrammes_services_csv, lire_services_csv
+from utils import (COLONNES_DEBORD, SYSTEMES_DEFAUT, calculer_prime_generique,
+                   calculer_primes_histogrammes, calculer_primes_lot)
+
+SYSTEMES = list(SYSTEMES_DEFAUT.values())
+
+
+@pytest.fixture(scope='module')
+def fichier():
+    reseau = generer_reseau(15, 6)
+    services = pd.concat(generer_services(reseau, 20))
+    return reseau, services, services.to_csv(index=False).encode()
+
+
+def test_histogrammes_exacts(fichier):
+    _, services, contenu = fichier
+    histogrammes = histogrammes_services_csv(io.BytesIO(contenu), max_voyageurs=2000)
+
+    for ligne, voyageurs in services.groupby(services['LIGNE'].astype(str))['VOYAGEURS']:
+        attendu = np.bincount(voyageurs.to_numpy(dtype=int), minlength=2001)
+        np.testing.assert_array_equal(histogrammes.loc[ligne, range(2001)].to_numpy(),
+                                      attendu)
+    assert (histogrammes[list(COLONNES_DEBORD)] == 0).all().all()
+
+
+def test_classes_larges_et_debord(fichier):
+    _, services, contenu = fichier
+    histogrammes = histogrammes_services_csv(io.BytesIO(contenu), largeur_classe=50,
+                                             max_voyageurs=300)
+
+    assert list(histogrammes.columns) == [*range(7), *COLONNES_DEBORD]
+    voyageurs = services['VOYAGEURS'].to_numpy(dtype=int)
+    assert histogrammes[6].sum() == ((voyageurs >= 300) & (voyageurs < 350)).sum()
+    assert histogrammes['SERVICES_DEBORD'].sum() == (voyageurs >= 350).sum() > 0
+    assert histogrammes['VOY_DEBORD'].sum() == voyageurs[voyageurs >= 350].sum()
+    assert (histogrammes[[*range(7), 'SERVICES_DEBORD']].to_numpy().sum() ==
+            len(voyageurs))
+
+
+def test_primes_des_services_au_dela_des_classes(fichier):
+    reseau, _, contenu = fichier
+    complet = histogrammes_services_csv(io.BytesIO(contenu), max_voyageurs=2000)
+    tronque = histogrammes_services_csv(io.BytesIO(contenu), max_voyageurs=300)
+    assert tronque['SERVICES_DEBORD'].sum() > 0
+
+    # Barème linéaire : le débord évalué à sa moyenne ne diffère de la moyenne
+    # des primes que par l'arrondi au centime
+    np.testing.assert_allclose(
+        calculer_primes_histogrammes(reseau, tronque, [SYSTEMES_DEFAUT['systeme_actuel']])
+        .bonus_service_j,
+        calculer_primes_histogrammes(reseau, complet, [SYSTEMES_DEFAUT['systeme_actuel']])
+        .bonus_service_j, rtol=0, atol=0.005)
+
+
+def test_lecture_independante_de_la_taille_des_blocs(fichier):
+    _, _, contenu = fichier
+    produits = ['services', 'histogrammes']
+    entier = lire_services_csv(io.BytesIO(contenu), produits)
+    par_blocs = lire_services_csv(io.BytesIO(contenu), produits, taille_bloc=997)
+
+    pd.testing.assert_frame_equal(entier['histogrammes'], par_blocs['histogrammes'])
+    pd.testing.assert_frame_equal(entier['services'], par_blocs['services'])
+
+
+def test_colonne_manquante():
+    with pytest.raises(ValueError, match="Colonnes manquantes"):
+        lire_services_csv(io.BytesIO(b"LIGNE,DATE\nL1,2024-01-01\n"), ['histogrammes'])
+
+
+def test_voyageurs_non_numeriques():
+    contenu = b"LIGNE,DATE,VOYAGEURS,BUS,CONDUCTEUR\nL1,2024-01-01,beaucoup,B1,C1\n"
+    with pytest.raises(ValueError, match="VOYAGEURS"):
+        lire_services_csv(io.BytesIO(contenu), ['services'])
+
+
+def test_identifiants_manquants_non_comptes():
+    contenu = (b"LIGNE,DATE,VOYAGEURS,BUS,CONDUCTEUR\n"
+               b"L1,2024-01-01,100,B1,C1\n"
+               b"L1,2024-01-01,120,,\n"
+               b"L1,2024-01-02,90,B1,\n"
+               b"L1,2024-01-02,80,B2,C2\n")
+    agregat = lire_services_csv(io.BytesIO(contenu), ['services'])['services']
+
+    ligne = agregat.set_index('LIGNE').loc['L1']
+    assert ligne['BUS'] == 1.5
+    assert ligne['NBRE CONDUCTEURS ETP'] == 1.0
+    assert ligne['VOY/SERVICE/J'] == 97.5
+
+
+def test_primes_sur_la_distribution_exactes(fichier):
+    reseau, services, contenu = fichier
+    histogrammes = histogrammes_services_csv(io.BytesIO(contenu), max_voyageurs=2000)
+    # Une ligne sans service détaillé garde la prime de sa moyenne
+    donnees = pd.concat([reseau, reseau.iloc[[0]].assign(LIGNE='SANS')], ignore_index=True)
+
+    resultat = calculer_primes_histogrammes(donnees, histogrammes, SYSTEMES)
+
+    par_ligne = services.groupby(services['LIGNE'].astype(str))['VOYAGEURS']
+    for k, systeme in enumerate(SYSTEMES):
+        for i, ligne in enumerate(donnees['LIGNE'].astype(str)):
+            if ligne == 'SANS':
+                attendu = calculer_primes_lot(donnees.iloc[[i]], [systeme]).bonus_service_j[0, 0]
+            else:
+                attendu = np.mean([calculer_prime_generique(int(v), systeme)
+                                   for v in par_ligne.get_group(ligne)])
+            assert resultat.bonus_service_j[k, i] == pytest.approx(attendu, abs=1e-9)
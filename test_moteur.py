@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from moteur import compiler_systeme, compiler_systemes, representants_classes
+from utils import SYSTEMES_DEFAUT, calculer_prime_generique
+
+
+def _systeme_aleatoire(rng):
+    """Système de 1 à 5 paliers disjoints à taux à trois décimales"""
+    nb_paliers = int(rng.integers(1, 6))
+    bornes = np.sort(rng.choice(np.arange(1, 400), 2 * nb_paliers, replace=False))
+    return {
+        "nom": "Aléatoire",
+        "paliers": [{
+            "min": int(bornes[2 * i]),
+            "max": int(bornes[2 * i + 1]),
+            "taux": round(float(rng.uniform(0, 2)), 3)
+        } for i in range(nb_paliers)]
+    }
+
+
+def _systemes_test():
+    rng = np.random.default_rng(20240101)
+    return list(SYSTEMES_DEFAUT.values()) + [_systeme_aleatoire(rng) for _ in range(200)]
+
+
+VOYAGEURS = np.arange(0, 600)
+
+
+@pytest.mark.parametrize("systeme", _systemes_test())
+def test_bareme_identique_a_la_boucle(systeme):
+    attendu = [calculer_prime_generique(int(v), systeme) for v in VOYAGEURS]
+    np.testing.assert_array_equal(compiler_systeme(systeme).evaluer(VOYAGEURS), attendu)
+
+
+def test_lot_identique_a_la_boucle():
+    systemes = _systemes_test()
+    attendu = [[calculer_prime_generique(int(v), s) for v in VOYAGEURS] for s in systemes]
+    np.testing.assert_array_equal(compiler_systemes(systemes).evaluer(VOYAGEURS), attendu)
+
+
+@pytest.mark.parametrize("systeme", list(SYSTEMES_DEFAUT.values()))
+def test_voyageurs_fractionnaires(systeme):
+    # Moyennes de services : quarts de voyageurs, égalités fréquentes
+    voyageurs = np.arange(0, 600, 0.25)
+    attendu = [calculer_prime_generique(float(v), systeme) for v in voyageurs]
+    np.testing.assert_array_equal(compiler_systeme(systeme).evaluer(voyageurs), attendu)
+    assert compiler_systeme(systeme).evaluer(382.75) == calculer_prime_generique(382.75, systeme)
+
+
+def test_egalites_au_demi_centime():
+    # 0,015 vaut un peu moins en binaire : round() donne 0,01 là où
+    # np.round(x, 2) donne 0,02
+    systeme = {"nom": "Egalité", "paliers": [{"min": 1, "max": 999, "taux": 0.015}]}
+    voyageurs = np.arange(0, 1000)
+    attendu = [calculer_prime_generique(int(v), systeme) for v in voyageurs]
+    np.testing.assert_array_equal(compiler_systeme(systeme).evaluer(voyageurs), attendu)
+
+
+def test_valeurs_manquantes_et_dimensions():
+    lot = compiler_systemes(list(SYSTEMES_DEFAUT.values()))
+    primes = lot.evaluer(np.array([[np.nan, 300.0], [0.0, 450.0]]))
+    assert primes.shape == (len(SYSTEMES_DEFAUT), 2, 2)
+    assert (primes[:, 0, 0] == 0).all()
+    for k, systeme in enumerate(SYSTEMES_DEFAUT.values()):
+        assert primes[k, 1, 1] == calculer_prime_generique(450, systeme)
+
+
+def test_egalites_en_deux_dimensions():
+    systeme = {"nom": "Egalité", "paliers": [{"min": 1, "max": 999, "taux": 0.015}]}
+    voyageurs = np.arange(0, 1000, dtype=float).reshape(40, 25)
+    attendu = np.array([calculer_prime_generique(int(v), systeme)
+                        for v in voyageurs.ravel()]).reshape(voyageurs.shape)
+    np.testing.assert_array_equal(compiler_systeme(systeme).evaluer(voyageurs), attendu)
+    np.testing.assert_array_equal(compiler_systemes([systeme]).evaluer(voyageurs)[0], attendu)
+
+
+def test_histogrammes_exacts_avec_classes_unitaires():
+    systemes = list(SYSTEMES_DEFAUT.values())
+    lot = compiler_systemes(systemes)
+    rng = np.random.default_rng(1)
+    services = [rng.integers(0, 500, size=n) for n in (1, 17, 250)]
+    comptes = np.array([np.bincount(s, minlength=500) for s in services])
+
+    moyennes = lot.evaluer_histogrammes(comptes, representants_classes(500))
+    for k, systeme in enumerate(systemes):
+        for i, s in enumerate(services):
+            attendu = np.mean([calculer_prime_generique(int(v), systeme) for v in s])
+            assert moyennes[k, i] == pytest.approx(attendu, abs=1e-9)
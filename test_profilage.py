@@ -0,0 +1,46 @@
+import tracemalloc
+
+import pytest
+
+from profilage import Profileur
+
+
+@pytest.fixture(autouse=True)
+def sans_suivi():
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+    yield
+    tracemalloc.stop()
+
+
+def test_suivi_limite_a_l_etape():
+    profileur = Profileur(memoire=True)
+    assert not tracemalloc.is_tracing()
+
+    with profileur.etape('calcul'):
+        assert tracemalloc.is_tracing()
+        with profileur.etape('interne'):
+            donnees = bytearray(4 * 1024**2)
+        del donnees
+
+    assert not tracemalloc.is_tracing()
+    interne, calcul = profileur.mesures
+    assert interne['pic_memoire_octets'] >= 4 * 1024**2
+    assert calcul['pic_memoire_octets'] >= interne['pic_memoire_octets']
+
+
+def test_suivi_deja_actif_conserve():
+    tracemalloc.start()
+    with Profileur(memoire=True).etape('calcul') as mesure:
+        pass
+
+    assert tracemalloc.is_tracing()
+    assert mesure['pic_memoire_octets'] is not None
+
+
+def test_sans_suivi_memoire():
+    profileur = Profileur()
+    with profileur.etape('calcul', lignes=10):
+        assert not tracemalloc.is_tracing()
+
+    assert list(profileur.tableau().columns) == ['etape', 'lignes', 'secondes']
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from analytique import construire_analyses
+from cache import taille_objet
+from generation import generer_reseau
+from utils import SYSTEMES_DEFAUT, _DERNIERS_RESULTATS, calculer_primes_lot
+
+SYSTEMES = list(SYSTEMES_DEFAUT.values())
+
+
+@pytest.fixture
+def resultat():
+    return calculer_primes_lot(generer_reseau(50, 4), SYSTEMES, 3)
+
+
+def test_colonnes_calculees_a_la_lecture(resultat):
+    nom = resultat.noms[1]
+    assert resultat._valeurs == {}
+
+    bonus_an = resultat.colonne(f"BONUS/AN_{nom}")
+
+    np.testing.assert_allclose(bonus_an, resultat.bonus_an()[1])
+    assert set(resultat._valeurs) == {f"BONUS/AN_{nom}", f"BONUS/J_{nom}"}
+    # Les alias partagent le tableau de leur colonne d'origine
+    assert resultat.colonne(f"cout_total_{nom}") is bonus_an
+    assert np.shares_memory(resultat.colonne(f"prime_{nom}"), resultat.bonus_service_j)
+
+
+def test_ordre_et_valeurs_du_dataframe(resultat):
+    df = resultat.vers_dataframe()
+    assert list(df.columns) == resultat.columns
+    base, comp = resultat.noms
+    np.testing.assert_allclose(df[f"diff_cout_{comp}"],
+                               df[f"BONUS/AN_{comp}"] - df[f"BONUS/AN_{base}"])
+    np.testing.assert_allclose(df[f"BONUS/CONDUCTEUR/MOIS_{base}"],
+                               df[f"BONUS/SERVICE/J_{base}"] * 30)
+
+
+def test_taille_facturee_couvre_toutes_les_colonnes(resultat):
+    taille = taille_objet(resultat)
+
+    for nom in resultat.columns:
+        resultat.colonne(nom)
+
+    reelle = (resultat.donnees.memory_usage(index=True, deep=True).sum() +
+              resultat.bonus_service_j.nbytes +
+              sum(v.nbytes for v in resultat._valeurs.values()
+                  if not np.shares_memory(v, resultat.bonus_service_j)))
+    assert taille_objet(resultat) == taille >= reelle
+
+
+def test_derniers_resultats_bornes_en_octets():
+    assert _DERNIERS_RESULTATS.max_octets is not None
+
+
+def test_reprise_des_colonnes_inchangees(resultat):
+    resultat.vers_dataframe()
+    modifie = dict(SYSTEMES[1], paliers=[dict(p, taux=p["taux"] * 2)
+                                         for p in SYSTEMES[1]["paliers"]])
+    suivant = calculer_primes_lot(resultat.donnees, [SYSTEMES[0], modifie], 3)
+
+    reprises = suivant.reprendre(resultat)
+
+    base, comp = suivant.noms
+    assert reprises > 0
+    assert suivant._valeurs[f"BONUS/AN_{base}"] is resultat._valeurs[f"BONUS/AN_{base}"]
+    assert 'VOY/MOIS' in suivant._valeurs
+    assert f"BONUS/AN_{comp}" not in suivant._valeurs
+    assert f"diff_cout_{comp}" not in suivant._valeurs
+
+
+def test_ligne_sans_conducteurs_ignoree_dans_les_totaux():
+    df = generer_reseau(20, 6).astype({'NBRE CONDUCTEURS ETP': float})
+    df.loc[3, 'NBRE CONDUCTEURS ETP'] = np.nan
+    resultat = calculer_primes_lot(df, SYSTEMES)
+
+    totaux = resultat.totaux_annuels()
+    complets = calculer_primes_lot(df.drop(index=3), SYSTEMES).totaux_annuels()
+    np.testing.assert_allclose(totaux.to_numpy(), complets.to_numpy())
+
+    globaux = construire_analyses(resultat)['totaux_globaux']
+    for nom in resultat.noms:
+        for cle in (f"cout_total_{nom}", f"bonus_cond_jour_{nom}",
+                    f"bonus_cond_mois_{nom}", f"bonus_cond_an_{nom}"):
+            assert np.isfinite(globaux[cle])
+            int(globaux[cle])
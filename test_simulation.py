@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from generation import generer_reseau
+from simulation import DISTRIBUTIONS, simuler_couts
+from utils import SYSTEMES_DEFAUT, calculer_primes_lot
+
+SYSTEMES = list(SYSTEMES_DEFAUT.values())
+
+
+@pytest.fixture(scope='module')
+def reseau():
+    return generer_reseau(40, 2)
+
+
+@pytest.mark.parametrize('distribution', DISTRIBUTIONS)
+def test_tirages_partages_entre_systemes(reseau, distribution):
+    ensemble = simuler_couts(reseau, SYSTEMES, nb_tirages=300,
+                             distribution=distribution, graine=4, taille_bloc=128)
+
+    for systeme in SYSTEMES:
+        seul = simuler_couts(reseau, [systeme], nb_tirages=300,
+                             distribution=distribution, graine=4, taille_bloc=128)
+        pd.testing.assert_frame_equal(seul, ensemble.loc[[systeme['nom']]])
+
+
+def test_sans_dispersion_cout_deterministe(reseau):
+    quantiles = simuler_couts(reseau, SYSTEMES, nb_tirages=50,
+                              coefficient_variation=0.0, graine=1)
+
+    attendu = calculer_primes_lot(reseau, SYSTEMES).totaux_annuels().to_numpy()
+    for colonne in ['moyenne', 'P5', 'P50', 'P95']:
+        np.testing.assert_allclose(quantiles[colonne], attendu)
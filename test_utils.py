@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from generation import generer_reseau
+from resultats import _entiers
+from utils import (SYSTEMES_DEFAUT, calculer_primes_df, calculer_primes_lot, normaliser_types,
+                   reduire_entiers)
+
+SYSTEMES = list(SYSTEMES_DEFAUT.values())
+
+
+@pytest.mark.parametrize('valeurs, type_attendu', [
+    ([0, 100, 127], np.int8),
+    ([0, 40_000], np.int32),
+    ([-1, 3_000_000_000], np.int64),
+    ([1.0, 2.0, 300.0], np.int16),
+])
+def test_reduire_entiers(valeurs, type_attendu):
+    reduit = reduire_entiers(pd.Series(valeurs))
+    assert reduit.dtype == type_attendu
+    assert reduit.tolist() == valeurs
+
+
+@pytest.mark.parametrize('valeurs', [[1.5, 2.0], [1.0, np.nan]])
+def test_flottants_non_entiers_conserves(valeurs):
+    reduit = reduire_entiers(pd.Series(valeurs))
+    assert reduit.dtype.kind == 'f'
+    pd.testing.assert_series_equal(reduit, pd.Series(valeurs), check_dtype=False)
+
+
+def test_normaliser_types_sans_perte():
+    df = generer_reseau(30, 7)
+    df['LIGNE'] = [i if i % 2 else f"L{i}" for i in range(len(df))]
+
+    compact = normaliser_types(df)
+
+    assert isinstance(compact['LIGNE'].dtype, pd.CategoricalDtype)
+    assert compact['LIGNE'].astype(str).tolist() == df['LIGNE'].astype(str).tolist()
+    for colonne in ['VOY', 'BUS', 'NBRE CONDUCTEURS ETP']:
+        assert (compact[colonne].to_numpy() == df[colonne].to_numpy()).all()
+    assert compact['VOY/SERVICE/J'].dtype == np.float64
+    memoire = compact.attrs['memoire']
+    assert memoire['octets_apres'] < memoire['octets_avant']
+
+    pd.testing.assert_frame_equal(
+        calculer_primes_df(compact, SYSTEMES).drop(columns='LIGNE'),
+        calculer_primes_df(df, SYSTEMES).drop(columns='LIGNE'),
+        check_dtype=False)
+
+
+def test_comptages_derives_non_finis():
+    assert _entiers(np.array([10.7, 255.2])).dtype == np.int16
+    derives = _entiers(np.array([10.7, np.inf, np.nan, -3.5]))
+    np.testing.assert_array_equal(derives, [10.0, np.nan, np.nan, -3.0])
+
+
+def test_voyageurs_par_bus_sans_bus():
+    df = generer_reseau(4, 1)
+    df.loc[1, 'BUS'] = 0
+
+    voy_bus = calculer_primes_lot(normaliser_types(df), SYSTEMES).colonne('VOY/BUS')
+
+    assert np.isnan(voy_bus[1])
+    assert (voy_bus[[0, 2, 3]] == (df['VOY'] // df['BUS'])[[0, 2, 3]]).all()
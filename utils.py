@@ -1,8 +1,23 @@
+import numpy as np
 import pandas as pd
-import streamlit as st
 import io
-import base64
 import json
+from cache import CacheLRU, empreinte_dataframe, empreinte_systeme
+from moteur import compiler_systemes, representants_classes
+from resultats import ResultatPrimes
+
+# Résultats de calculer_primes_df déjà calculés, indexés par empreinte des entrées
+_CACHE_RESULTATS = CacheLRU(max_entrees=16, max_octets=256 * 1024**2)
+
+# Primes par service d'un système, indexées par données et empreinte du système
+_CACHE_PRIMES_SYSTEMES = CacheLRU(max_entrees=64, max_octets=128 * 1024**2)
+
+# Dernier résultat calculé pour chaque jeu de données, base des recalculs
+_DERNIERS_RESULTATS = CacheLRU(max_entrees=8, max_octets=256 * 1024**2)
+
+# Colonnes des histogrammes pour les services au-delà de la dernière classe :
+# nombre de services et voyageurs cumulés
+COLONNES_DEBORD = ('SERVICES_DEBORD', 'VOY_DEBORD')
 
 # Systèmes de prime par défaut
 SYSTEME_ACTUEL = {
@@ -100,9 +115,9 @@ def calculer_prime_nouvelle(voyageurs):
     return calculer_prime_generique(voyageurs, SYSTEME_NOUVEAU)
 
 
-def calculer_primes_df(df, systemes=None, nb_services_par_jour=5):
+def calculer_primes_lot(df, systemes=None, nb_services_par_jour=5):
     """
-    Ajoute les colonnes de primes calculées au DataFrame pour les systèmes définis
+    Calcule en une seule passe les primes de K systèmes sur les N lignes
     
     Args:
         df (pandas.DataFrame): DataFrame avec une colonne 'VOY/SERVICE/J'
@@ -110,90 +125,162 @@ def calculer_primes_df(df, systemes=None, nb_services_par_jour=5):
         nb_services_par_jour (int): Nombre de services par jour par ligne
         
     Returns:
-        pandas.DataFrame: DataFrame avec les colonnes de primes ajoutées
+        ResultatPrimes: Résultat compact (matrice K x N des primes par service)
     """
     if systemes is None:
         systemes = [SYSTEME_ACTUEL, SYSTEME_NOUVEAU]
 
-    # Créer une copie du DataFrame pour éviter de modifier l'original
-    df_result = df.copy()
-
-    # Ajouter les nouvelles colonnes demandées
-    # VOY/MOIS : Nombre de voyageurs par mois dans la ligne (VOY / 12)
-    df_result['VOY/MOIS'] = (df_result['VOY'] / 12).astype(int)
-
-    # VOY/BUS : Nombre de voyageurs par bus dans la ligne (VOY / BUS)
-    df_result['VOY/BUS'] = (df_result['VOY'] / df_result['BUS']).astype(int)
-
-    # VOY/J : Nombre de voyageurs par jour dans la ligne (VOY / 365)
-    df_result['VOY/J'] = (df_result['VOY'] / 365).astype(int)
-
-    # Ajouter chaque système comme colonne
-    for systeme in systemes:
-        # Créer un nom de base pour ce système pour simplifier la création des noms de colonnes
-        base_nom = systeme['nom'].replace(' ', '_').lower()
+    bonus_service_j = compiler_systemes(systemes).evaluer(
+        df['VOY/SERVICE/J'].to_numpy(dtype=float))
 
-        # BONUS/SERVICE/J : bonus par service par jour (VOY/SERVICE/J * fonction de calcul de bonus)
-        bonus_service_j = f"BONUS/SERVICE/J_{base_nom}"
-        df_result[bonus_service_j] = df_result['VOY/SERVICE/J'].apply(
-            lambda x: calculer_prime_generique(x, systeme))
+    return ResultatPrimes(df, systemes, bonus_service_j)
 
-        # BONUS/J : bonus par jour (BONUS/SERVICE/J * nombre de services par jour)
-        bonus_j = f"BONUS/J_{base_nom}"
-        df_result[bonus_j] = df_result[bonus_service_j] * df_result[
-            'NBRE CONDUCTEURS ETP']
 
-        # BONUS/CONDUCTEUR/J : bonus par conducteur par jour
-        bonus_conducteur_j = f"BONUS/CONDUCTEUR/J_{base_nom}"
-        df_result[bonus_conducteur_j] = df_result[bonus_service_j]
-
-        # BONUS/AN : bonus par an (BONUS/J * 365)
-        bonus_an = f"BONUS/AN_{base_nom}"
-        df_result[bonus_an] = df_result[bonus_j] * 365
-
-        # BONUS/MOIS : bonus par mois (BONUS/J * 30)
-        bonus_mois = f"BONUS/MOIS_{base_nom}"
-        df_result[bonus_mois] = df_result[bonus_j] * 30
-
-        # BONUS/CONDUCTEUR/MOIS : bonus par conducteur par mois (BONUS/CONDUCTEUR/J * 30)
-        bonus_conducteur_mois = f"BONUS/CONDUCTEUR/MOIS_{base_nom}"
-        df_result[bonus_conducteur_mois] = df_result[bonus_conducteur_j] * 30
-
-        # BONUS/CONDUCTEUR/AN : bonus par conducteur par an (BONUS/CONDUCTEUR/J * 365)
-        bonus_conducteur_an = f"BONUS/CONDUCTEUR/AN_{base_nom}"
-        df_result[bonus_conducteur_an] = df_result[bonus_conducteur_j] * 365
+def calculer_primes_histogrammes(df,
+                                 histogrammes,
+                                 systemes=None,
+                                 largeur_classe=1):
+    """
+    Calcule les primes de K systèmes à partir de la distribution des services
+    
+    Le barème n'étant pas linéaire, la prime moyenne par service d'une ligne
+    est l'espérance de la prime sur l'histogramme de ses services, et non la
+    prime de sa moyenne VOY/SERVICE/J. Les services au-delà de la dernière
+    classe sont évalués à leur moyenne réelle par ligne. Les lignes sans
+    histogramme gardent le calcul sur la moyenne.
+    
+    Args:
+        df (pandas.DataFrame): DataFrame avec les colonnes LIGNE et 'VOY/SERVICE/J'
+        histogrammes (pandas.DataFrame): Nombre de services par classe, indexé
+            par LIGNE (voir ingestion.histogrammes_services_csv)
+        systemes (list): Liste des systèmes de primes à calculer
+        largeur_classe (int): Largeur des classes des histogrammes
+        
+    Returns:
+        ResultatPrimes: Résultat compact (matrice K x N des primes par service)
+    """
+    if systemes is None:
+        systemes = [SYSTEME_ACTUEL, SYSTEME_NOUVEAU]
 
-        # Ajouter également les noms compatibles avec l'ancien format pour ne pas casser le reste du code
-        df_result[f"prime_{base_nom}"] = df_result[bonus_service_j]
-        df_result[f"cout_total_{base_nom}"] = df_result[bonus_an]
-        df_result[f"cout_total_{base_nom}_mensuel"] = df_result[bonus_mois]
+    lot = compiler_systemes(systemes)
+    comptes = histogrammes.reindex(df['LIGNE'].astype(str), fill_value=0)
+    debord = comptes.reindex(columns=list(COLONNES_DEBORD), fill_value=0)
+    comptes = comptes.drop(columns=list(COLONNES_DEBORD), errors='ignore')
+    services_debord = debord[COLONNES_DEBORD[0]].to_numpy(dtype=float)
+    bonus_service_j = lot.evaluer_histogrammes(
+        comptes.to_numpy(),
+        representants_classes(comptes.shape[1], largeur_classe),
+        services_debord, debord[COLONNES_DEBORD[1]].to_numpy(dtype=float))
 
-    # Calculer les différences par rapport au système actuel
-    if len(systemes) > 1:
-        nom_base = systemes[0]['nom'].replace(' ', '_').lower()
+    # Lignes absentes des histogrammes : prime de la moyenne
+    sans_service = comptes.sum(axis=1).to_numpy() + services_debord == 0
+    if sans_service.any():
+        bonus_service_j[:, sans_service] = lot.evaluer(
+            df['VOY/SERVICE/J'].to_numpy(dtype=float)[sans_service])
 
-        for i in range(1, len(systemes)):
-            nom_comp = systemes[i]['nom'].replace(' ', '_').lower()
+    return ResultatPrimes(df, systemes, bonus_service_j)
 
-            # Différence de prime par service
-            df_result[f"diff_{nom_comp}"] = df_result[
-                f"BONUS/SERVICE/J_{nom_comp}"] - df_result[
-                    f"BONUS/SERVICE/J_{nom_base}"]
 
-            # Différence de coût annuel total
-            df_result[f"diff_cout_{nom_comp}"] = df_result[
-                f"BONUS/AN_{nom_comp}"] - df_result[f"BONUS/AN_{nom_base}"]
+def calculer_primes_df(df, systemes=None, nb_services_par_jour=5):
+    """
+    Ajoute les colonnes de primes calculées au DataFrame pour les systèmes définis
+    
+    Args:
+        df (pandas.DataFrame): DataFrame avec une colonne 'VOY/SERVICE/J'
+        systemes (list): Liste des systèmes de primes à calculer
+        nb_services_par_jour (int): Nombre de services par jour par ligne
+        
+    Returns:
+        pandas.DataFrame: DataFrame avec les colonnes de primes ajoutées
+    """
+    # Les colonnes de tous les systèmes sont construites en bloc à partir du lot
+    return calculer_primes_lot(df, systemes,
+                               nb_services_par_jour).vers_dataframe()
 
-            # Différence de coût mensuel total
-            df_result[f"diff_cout_mensuel_{nom_comp}"] = df_result[
-                f"BONUS/MOIS_{nom_comp}"] - df_result[f"BONUS/MOIS_{nom_base}"]
 
-            # Différence par conducteur par an
-            df_result[f"diff_conducteur_an_{nom_comp}"] = df_result[
-                f"BONUS/CONDUCTEUR/AN_{nom_comp}"] - df_result[
-                    f"BONUS/CONDUCTEUR/AN_{nom_base}"]
+def calculer_primes_df_cache(df,
+                             systemes=None,
+                             nb_services_par_jour=5,
+                             histogrammes=None,
+                             largeur_classe=1):
+    """
+    Version mémoïsée de calculer_primes_df
+    
+    La clé combine l'empreinte du DataFrame, celle de chaque système et les
+    paramètres. Le cache conserve le résultat compact de calculer_primes_lot :
+    les colonnes dérivées ne sont calculées qu'à leur première lecture, et le
+    DataFrame d'entrée n'est pas copié. Le résultat est partagé entre les
+    appels : il ne doit pas être modifié en place.
+    
+    En cas d'échec, seuls les systèmes modifiés sont réévalués : les primes
+    des systèmes inchangés sont reprises du cache par système, et les
+    colonnes calculées du dernier résultat sur les mêmes données qui ne
+    dépendent pas d'un système modifié sont réutilisées.
+    
+    Args:
+        df (pandas.DataFrame): DataFrame avec une colonne 'VOY/SERVICE/J'
+        systemes (list): Liste des systèmes de primes à calculer
+        nb_services_par_jour (int): Nombre de services par jour par ligne
+        histogrammes (pandas.DataFrame): Histogrammes de voyageurs par service ;
+            s'ils sont fournis, le calcul passe par calculer_primes_histogrammes
+        largeur_classe (int): Largeur des classes des histogrammes
+        
+    Returns:
+        ResultatPrimes: Résultat indexable comme le DataFrame de calculer_primes_df
+    """
+    if systemes is None:
+        systemes = [SYSTEME_ACTUEL, SYSTEME_NOUVEAU]
 
-    return df_result
+    cle = (empreinte_dataframe(df),
+           tuple(empreinte_systeme(s) for s in systemes),
+           nb_services_par_jour,
+           None if histogrammes is None else
+           (empreinte_dataframe(histogrammes), largeur_classe))
+
+    cle_donnees = (cle[0],) + cle[2:]
+
+    resultat = _CACHE_RESULTATS.obtenir(cle)
+    if resultat is None:
+        lignes = [
+            _CACHE_PRIMES_SYSTEMES.obtenir((cle_donnees, empreinte))
+            for empreinte in cle[1]
+        ]
+        manquants = [k for k, ligne in enumerate(lignes) if ligne is None]
+        if manquants:
+            a_calculer = [systemes[k] for k in manquants]
+            if histogrammes is None:
+                partiel = calculer_primes_lot(df, a_calculer,
+                                              nb_services_par_jour)
+            else:
+                partiel = calculer_primes_histogrammes(df, histogrammes,
+                                                       a_calculer,
+                                                       largeur_classe)
+            for i, k in enumerate(manquants):
+                lignes[k] = partiel.bonus_service_j[i].copy()
+                _CACHE_PRIMES_SYSTEMES.ajouter((cle_donnees, cle[1][k]),
+                                               lignes[k])
+
+        bonus_service_j = (np.vstack(lignes) if lignes else
+                           np.empty((0, len(df))))
+        resultat = ResultatPrimes(df, systemes, bonus_service_j)
+
+        precedent = _DERNIERS_RESULTATS.obtenir(cle_donnees)
+        if precedent is not None:
+            resultat.reprendre(precedent)
+        _CACHE_RESULTATS.ajouter(cle, resultat)
+
+    _DERNIERS_RESULTATS.ajouter(cle_donnees, resultat)
+    return resultat
+
+
+def statistiques_cache_primes():
+    """
+    Donne les compteurs du cache des résultats de calcul
+    
+    Returns:
+        dict: Succès, échecs, nombre d'entrées et octets occupés
+    """
+    return _CACHE_RESULTATS.statistiques()
 
 
 def valider_donnees(df):
@@ -225,21 +312,107 @@ def valider_donnees(df):
     return True, ""
 
 
-def get_download_link(df, filename="resultats_primes.csv"):
+# Colonnes de comptage, ramenées au plus petit type entier qui contient leurs valeurs
+COLONNES_ENTIERES = ['VOY', 'BUS', 'NBRE CONDUCTEURS ETP']
+
+
+def memoire_dataframe(df):
+    """
+    Mesure la mémoire occupée par un DataFrame, textes compris
+    
+    Args:
+        df (pandas.DataFrame): DataFrame à mesurer
+        
+    Returns:
+        int: Taille en octets
+    """
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def reduire_entiers(valeurs):
+    """
+    Ramène des comptages au plus petit type entier signé qui les contient
+    
+    Des flottants ne sont convertis que s'ils sont tous entiers (moyennes
+    et valeurs manquantes restent en flottants).
+    
+    Args:
+        valeurs (pandas.Series ou numpy.ndarray): Comptages
+        
+    Returns:
+        pandas.Series ou numpy.ndarray: Mêmes valeurs, type réduit
+    """
+    return pd.to_numeric(valeurs, downcast='integer')
+
+
+def normaliser_types(df):
+    """
+    Harmonise et compacte les types du DataFrame validé
+    
+    LIGNE est stockée en catégorie et les comptages (VOY, BUS, NBRE
+    CONDUCTEURS ETP) au plus petit type entier sûr. VOY/SERVICE/J reste en
+    float64 : les seuils des barèmes sont comparés à ses décimales. La
+    mémoire avant et après normalisation est conservée dans
+    df.attrs['memoire'] (octets_avant, octets_apres).
+    
+    Args:
+        df (pandas.DataFrame): DataFrame validé par valider_donnees
+        
+    Returns:
+        pandas.DataFrame: DataFrame avec LIGNE en catégorie et comptages réduits
+    """
+    octets_avant = memoire_dataframe(df)
+    # Excel renvoie un mélange d'entiers et de textes pour les identifiants de ligne
+    colonnes = {'LIGNE': df['LIGNE'].astype(str).astype('category')}
+    for col in COLONNES_ENTIERES:
+        colonnes[col] = reduire_entiers(df[col])
+    compact = df.assign(**colonnes)
+    compact.attrs['memoire'] = {
+        'octets_avant': octets_avant,
+        'octets_apres': memoire_dataframe(compact)
+    }
+    return compact
+
+
+# Extensions et types MIME des formats de téléchargement CSV
+FORMATS_CSV = {
+    None: (".csv", "text/csv"),
+    "gzip": (".csv.gz", "application/gzip"),
+    "zip": (".zip", "application/zip")
+}
+
+
+def contenu_csv(df,
+                colonnes=None,
+                compression=None,
+                nom_archive="resultats_primes.csv"):
     """
-    Génère un lien de téléchargement pour un DataFrame
+    Produit le contenu d'un fichier CSV, éventuellement compressé
     
     Args:
-        df (pandas.DataFrame): DataFrame à télécharger
-        filename (str): Nom du fichier à télécharger
+        df (pandas.DataFrame ou ResultatPrimes): Données à exporter
+        colonnes (list): Colonnes à exporter (toutes par défaut)
+        compression (str): None, 'gzip' ou 'zip'
+        nom_archive (str): Nom du fichier CSV dans l'archive zip
         
     Returns:
-        str: Lien HTML pour télécharger le DataFrame
+        bytes: Contenu du fichier à télécharger
     """
-    csv = df.to_csv(index=False)
-    b64 = base64.b64encode(csv.encode()).decode()
-    href = f'<a href="data:file/csv;base64,{b64}" download="{filename}">Télécharger les résultats (CSV)</a>'
-    return href
+    if colonnes is not None:
+        df = df[colonnes]
+    elif not isinstance(df, pd.DataFrame):
+        df = df.vers_dataframe()
+
+    if compression == "zip":
+        options = {"method": "zip", "archive_name": nom_archive}
+    elif compression == "gzip":
+        options = {"method": "gzip", "mtime": 0}
+    else:
+        options = None
+
+    buffer = io.BytesIO()
+    df.to_csv(buffer, index=False, compression=options)
+    return buffer.getvalue()
 
 
 def exporter_systeme_json(systeme):